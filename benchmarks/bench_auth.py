@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+认证开销基准测试
+对比 require_user_auth 在不使用缓存（每次 jwt.decode）和命中已验证 Token 缓存时的单次请求开销。
+不访问数据库，只在 Flask 请求上下文中调用被装饰的空函数。
+用法：python benchmarks/bench_auth.py [--requests 20000] [--tokens 100]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from wxcloudrun import app
+from wxcloudrun.middleware import require_user_auth
+from wxcloudrun.handlers.auth_handler import USER_JWT_SECRET, USER_JWT_ALGORITHM
+from wxcloudrun.token_cache import user_tokens
+
+
+@require_user_auth
+def _endpoint():
+    return 'ok', 200
+
+
+def _make_tokens(count):
+    tokens = []
+    for i in range(count):
+        payload = {
+            'user_id': str(i + 1),
+            'phone': '138{:08d}'.format(i),
+            'role': 'user',
+            'iat': datetime.utcnow(),
+            'exp': datetime.utcnow() + timedelta(days=7),
+        }
+        token = jwt.encode(payload, USER_JWT_SECRET, algorithm=USER_JWT_ALGORITHM)
+        tokens.append(token.decode('utf-8') if isinstance(token, bytes) else token)
+    return tokens
+
+
+def _run(tokens, requests):
+    contexts = [
+        app.test_request_context('/api/user/profile', headers={'Authorization': 'Bearer ' + token})
+        for token in tokens
+    ]
+    start = time.perf_counter()
+    for i in range(requests):
+        with contexts[i % len(contexts)]:
+            _endpoint()
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='认证开销基准测试')
+    parser.add_argument('--requests', type=int, default=20000, help='模拟的请求数')
+    parser.add_argument('--tokens', type=int, default=100, help='轮流使用的不同 Token 数')
+    args = parser.parse_args()
+
+    tokens = _make_tokens(args.tokens)
+
+    max_entries = user_tokens.max_entries
+    user_tokens.max_entries = 0
+    user_tokens.clear()
+    uncached = _run(tokens, args.requests)
+
+    user_tokens.max_entries = max(max_entries, args.tokens)
+    _run(tokens, len(tokens))  # 预热缓存
+    cached = _run(tokens, args.requests)
+    user_tokens.max_entries = max_entries
+
+    print("请求数: {}, Token 数: {}".format(args.requests, args.tokens))
+    print("每次校验签名: {:.1f} us/请求".format(uncached * 1e6))
+    print("命中 Token 缓存: {:.1f} us/请求".format(cached * 1e6))
+    print("节省: {:.1f}%".format((1 - cached / uncached) * 100 if uncached else 0.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,3 +19,96 @@ SERVER_PORT = int(os.environ.get("SERVER_PORT", "80"))
 
 # 日志级别
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "info")
+
+# ========== 本地上传文件服务 ==========
+# 本地上传文件的发送方式：
+#   空        - 由 Flask 直接发送（支持 Range / 条件请求）
+#   x-accel   - 返回 X-Accel-Redirect 头，由 nginx 发送文件（ETag、条件请求、Range 均由 nginx 处理）
+#   x-sendfile - 返回 X-Sendfile 头，由前端服务器（Apache/lighttpd 等）发送文件
+UPLOADS_SENDFILE_MODE = os.environ.get("UPLOADS_SENDFILE_MODE", "").strip().lower()
+# X-Accel-Redirect 模式下 nginx internal location 的前缀，需映射到 uploads 目录
+UPLOADS_ACCEL_PREFIX = os.environ.get("UPLOADS_ACCEL_PREFIX", "/_uploads_internal/")
+# uuid 命名的上传文件内容不可变，允许客户端长期缓存（秒）
+UPLOADS_IMMUTABLE_MAX_AGE = int(os.environ.get("UPLOADS_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
+# Flask 内置配置：send_file 是否使用 X-Sendfile
+USE_X_SENDFILE = UPLOADS_SENDFILE_MODE == "x-sendfile"
+
+# ========== 上传大小限制 ==========
+# 单张照片大小上限（字节）
+PHOTO_MAX_BYTES = int(os.environ.get("PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+# 照片上传接口请求体大小上限（字节），在解析表单前拒绝
+PHOTO_UPLOAD_MAX_BODY = int(os.environ.get("PHOTO_UPLOAD_MAX_BODY", str(100 * 1024 * 1024)))
+# 营业执照大小上限（字节）
+BUSINESS_LICENSE_MAX_BYTES = int(os.environ.get("BUSINESS_LICENSE_MAX_BYTES", str(5 * 1024 * 1024)))
+# 营业执照上传接口请求体大小上限（字节），预留表单字段和 multipart 边界的开销
+BUSINESS_LICENSE_MAX_BODY = int(os.environ.get("BUSINESS_LICENSE_MAX_BODY", str(6 * 1024 * 1024)))
+# Flask 内置配置：全局请求体大小上限，未声明 Content-Length 的请求由其兜底
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", str(PHOTO_UPLOAD_MAX_BODY)))
+
+# ========== 照片本地磁盘缓存 ==========
+# 开启后 /api/photos/<id>/content 从本地磁盘 LRU 缓存返回照片，未命中时从 COS 下载
+PHOTO_CACHE_ENABLED = os.environ.get("PHOTO_CACHE_ENABLED", "").strip().lower() in ("1", "true", "yes")
+# 缓存目录和总大小上限（字节）
+PHOTO_CACHE_DIR = os.environ.get("PHOTO_CACHE_DIR", os.path.join("cache", "photos"))
+PHOTO_CACHE_MAX_BYTES = int(os.environ.get("PHOTO_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 浏览器缓存照片内容的时长（秒）
+PHOTO_CACHE_MAX_AGE = int(os.environ.get("PHOTO_CACHE_MAX_AGE", "3600"))
+
+# ========== 短信验证码存储 ==========
+# 验证码存储后端：mysql（sms_codes 表，默认）、redis（多实例共享）、memory（进程内）
+# memory 只适合单实例开发环境：服务会扩容到多个实例，验证码在一个实例发送、在另一个实例校验时会失败
+SMS_CODE_STORE = os.environ.get("SMS_CODE_STORE", "mysql").strip().lower()
+# redis 后端的连接地址
+SMS_REDIS_URL = os.environ.get("SMS_REDIS_URL", "redis://127.0.0.1:6379/0")
+# 验证码有效期（秒）和最多允许输错的次数
+SMS_CODE_TTL_SECONDS = int(os.environ.get("SMS_CODE_TTL_SECONDS", "300"))
+SMS_CODE_MAX_ATTEMPTS = int(os.environ.get("SMS_CODE_MAX_ATTEMPTS", "5"))
+# memory / redis 后端下是否把发送和使用记录异步写入 sms_codes 表（审计日志）
+SMS_AUDIT_ENABLED = os.environ.get("SMS_AUDIT_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+# ========== 接口限流 ==========
+# 令牌桶规则 "scope:count/seconds"，scope 为 phone（手机号）、ip 或 global，逗号分隔，留空表示不限流
+RATE_LIMIT_SMS_SEND = os.environ.get("RATE_LIMIT_SMS_SEND", "phone:1/60,phone:10/3600,ip:20/3600,global:300/60")
+RATE_LIMIT_SMS_VERIFY = os.environ.get("RATE_LIMIT_SMS_VERIFY", "phone:10/300,ip:60/300")
+RATE_LIMIT_LOGIN = os.environ.get("RATE_LIMIT_LOGIN", "phone:10/300,ip:60/300")
+RATE_LIMIT_REGISTER = os.environ.get("RATE_LIMIT_REGISTER", "phone:5/300,ip:30/300")
+# 限流后端：memory（进程内）或 redis（多实例共享）。设置了 RATE_LIMIT_REDIS_URL 时默认 redis，否则默认 memory；
+# memory 后端每个实例各自计数，服务扩容到 N 个实例时实际限额放宽为 N 倍
+RATE_LIMIT_BACKEND = os.environ.get(
+    "RATE_LIMIT_BACKEND", "redis" if os.environ.get("RATE_LIMIT_REDIS_URL") else "memory"
+).strip().lower()
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", SMS_REDIS_URL)
+# 云托管网关在 X-Forwarded-For 末尾追加的可信地址个数：客户端IP取倒数第 N 个条目（前面的条目可由客户端伪造），
+# 0 表示不信任 X-Forwarded-For、使用连接的对端地址
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+# ========== 认证 ==========
+# 已验证 Token 缓存的最大条目数（命中时跳过签名校验），0 表示不缓存
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# 按条件撤销 Token 的记录保留时长（秒），不短于最长的 Token 有效期（用户 Token 7 天）
+AUTH_TOKEN_REVOCATION_MAX_AGE = int(os.environ.get("AUTH_TOKEN_REVOCATION_MAX_AGE", str(7 * 24 * 3600)))
+
+# ========== 用户个人信息缓存 ==========
+# GET /api/user/profile 按手机号缓存的条目数（0 表示不缓存）和有效期（秒），注册、审核、更新营业执照时失效
+USER_PROFILE_CACHE_SIZE = int(os.environ.get("USER_PROFILE_CACHE_SIZE", "10000"))
+USER_PROFILE_CACHE_TTL = int(os.environ.get("USER_PROFILE_CACHE_TTL", "300"))
+# 待审核（pending）的注册记录很快会被审核，只缓存很短时间（秒），避免多实例下审核结果迟迟不可见；0 表示不缓存
+USER_PROFILE_PENDING_CACHE_TTL = int(os.environ.get("USER_PROFILE_PENDING_CACHE_TTL", "5"))
+
+# ========== 幂等键 ==========
+# 带 Idempotency-Key 头的请求，第一次的响应保留时长（秒），期间相同 Key 的重试直接回放
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# 进程内缓存已完成响应的条目数（0 表示只使用数据库）
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1000"))
+# 同一进程内相同 Key 的请求正在处理时，重复请求等待其完成的最长时间（秒），超时返回 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# 处理中的 Key 的租约时长（秒），应为请求超时的数倍；处理请求的实例崩溃后，租约到期即可由之后的重试接管
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "180"))
+
+# ========== 订单归档 ==========
+# 订单、照片列表接口默认只查询最近多少天创建的记录（请求可用 created_from 参数指定更早的起点，created_from=all 不限制），0 表示不限制
+ORDER_QUERY_DEFAULT_DAYS = int(os.environ.get("ORDER_QUERY_DEFAULT_DAYS", "180"))
+# 归档任务在数据库中保留最近多少个自然月的订单，更早的整月订单及其照片记录导出为归档文件后删除
+ORDER_ARCHIVE_RETENTION_MONTHS = int(os.environ.get("ORDER_ARCHIVE_RETENTION_MONTHS", "12"))
+# 归档文件（gzip 压缩的 JSONL）的本地目录，同时上传到 COS 的 archives/orders/ 前缀下
+ORDER_ARCHIVE_DIR = os.environ.get("ORDER_ARCHIVE_DIR", "archives")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+后台任务入口
+用法：python jobs.py <任务名> [参数]，python jobs.py -h 查看所有任务
+"""
+import argparse
+import json
+import logging
+import sys
+import config
+from wxcloudrun import app
+from wxcloudrun.jobs import JOBS
+
+# 配置日志
+logging.basicConfig(
+    level=getattr(logging, config.LOG_LEVEL.upper(), logging.INFO),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='后台任务')
+    subparsers = parser.add_subparsers(dest='job', required=True)
+    for name, module in JOBS.items():
+        job_parser = subparsers.add_parser(name, help=(module.__doc__ or '').strip().splitlines()[0])
+        module.add_arguments(job_parser)
+    
+    args = parser.parse_args()
+    with app.app_context():
+        try:
+            result = JOBS[args.job].run(args)
+        except Exception as e:
+            logger.error(f"任务执行失败: {args.job}, {e}", exc_info=True)
+            sys.exit(1)
+    
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
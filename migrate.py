@@ -36,6 +36,19 @@ def get_db_config():
         'charset': 'utf8mb4'
     }
 
+# 迁移文件中的跳过条件：以 "-- @skip-if:" 开头的注释行后跟一条查询，查询返回结果时跳过整个文件
+# （用于不能重复执行的迁移，如修改列类型）
+SKIP_IF_PREFIX = '-- @skip-if:'
+
+
+def get_skip_condition(sql_content):
+    """获取迁移文件的跳过条件查询，没有时返回 None"""
+    for line in sql_content.splitlines():
+        if line.strip().startswith(SKIP_IF_PREFIX):
+            return line.strip()[len(SKIP_IF_PREFIX):].strip().rstrip(';')
+    return None
+
+
 def execute_migration(migration_file):
     """执行单个迁移文件"""
     print(f"\n{'='*60}")
@@ -53,17 +66,30 @@ def execute_migration(migration_file):
         
         try:
             with connection.cursor() as cursor:
+                skip_condition = get_skip_condition(sql_content)
+                if skip_condition:
+                    cursor.execute(skip_condition)
+                    if cursor.fetchone() is not None:
+                        print(f"⚠ 满足跳过条件，跳过: {migration_file.name}")
+                        return True
+                
                 # 执行SQL（支持多语句）
                 for statement in sql_content.split(';'):
-                    statement = statement.strip()
-                    if statement and not statement.startswith('--'):
+                    # 去掉语句前的注释行，避免带注释的语句被整体跳过
+                    statement = '\n'.join(
+                        line for line in statement.strip().splitlines()
+                        if not line.strip().startswith('--')
+                    ).strip()
+                    if statement:
                         try:
                             cursor.execute(statement)
                             print(f"✓ 执行成功: {statement[:50]}...")
                         except Exception as e:
-                            # 如果是"字段已存在"的错误，可以忽略
-                            if 'Duplicate column name' in str(e) or 'already exists' in str(e).lower():
-                                print(f"⚠ 字段已存在，跳过: {statement[:50]}...")
+                            # 只忽略"表/字段/索引已存在"的 DDL 错误（迁移可重复执行），
+                            # 数据写入的 Duplicate entry 等错误照常失败，避免掩盖数据问题
+                            if ('Duplicate column name' in str(e) or 'Duplicate key name' in str(e)
+                                    or 'already exists' in str(e).lower()):
+                                print(f"⚠ 表/字段/索引已存在，跳过: {statement[:50]}...")
                             else:
                                 print(f"✗ 执行失败: {e}")
                                 print(f"  SQL: {statement[:100]}...")
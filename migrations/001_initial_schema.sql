@@ -36,8 +36,8 @@ CREATE TABLE business_types (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
--- 插入默认业务类型数据
-INSERT INTO business_types (id, name, description) VALUES
+-- 插入默认业务类型数据（已存在时跳过，迁移可重复执行）
+INSERT IGNORE INTO business_types (id, name, description) VALUES
 ('electric_bike', '电动自行车', '电动自行车电池回收业务'),
 ('forklift', '叉车', '叉车电池回收业务'),
 ('other', '其他', '其他类型电池回收业务');
@@ -53,7 +53,7 @@ CREATE TABLE user_roles (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
--- 插入默认用户角色数据
-INSERT INTO user_roles (id, name, description, permissions) VALUES
+-- 插入默认用户角色数据（已存在时跳过，迁移可重复执行）
+INSERT IGNORE INTO user_roles (id, name, description, permissions) VALUES
 ('dealer', '经销商', '从事电池销售和回收业务', '["销售", "回收", "库存管理"]'),
 ('repair_point', '维修点', '提供电池维修和回收服务', '["维修", "回收", "检测"]');
@@ -0,0 +1,13 @@
+-- 照片存储位置标记及列表查询索引
+-- storage 标记照片存储在 COS 还是本地回退目录，代替遍历 uploads/photos 目录
+
+ALTER TABLE battery_upload_photos
+ADD COLUMN storage VARCHAR(10) DEFAULT 'cos' NOT NULL COMMENT '存储位置：cos-对象存储, local-本地回退存储';
+
+-- 历史数据：本地回退存储的照片 file_path 以 uploads/ 开头
+UPDATE battery_upload_photos SET storage = 'local' WHERE file_path LIKE 'uploads/%';
+
+-- 游标分页索引（按创建时间倒序，支持按用户筛选）
+CREATE INDEX idx_battery_upload_photos_storage ON battery_upload_photos(storage, created_at);
+CREATE INDEX idx_battery_upload_photos_user_created ON battery_upload_photos(user_id, created_at, id);
+CREATE INDEX idx_battery_upload_photos_created ON battery_upload_photos(created_at, id);
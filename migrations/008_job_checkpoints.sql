@@ -0,0 +1,9 @@
+-- 后台任务检查点表
+-- 记录批处理任务的进度，任务中断后可以从检查点继续执行
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY COMMENT '任务名',
+    position VARCHAR(255) NULL COMMENT '已处理到的位置（如最后处理的记录ID）',
+    state JSON NULL COMMENT '任务统计等附加状态',
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
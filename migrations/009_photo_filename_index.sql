@@ -0,0 +1,4 @@
+-- 照片文件名索引
+-- 孤儿对象清理任务按文件名批量比对存储中的对象与数据库记录
+
+CREATE INDEX idx_battery_upload_photos_filename ON battery_upload_photos(filename);
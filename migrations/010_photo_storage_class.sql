@@ -0,0 +1,9 @@
+-- 照片 COS 存储类型
+-- 存储类型分层任务把旧订单和已完成/已取消订单的照片转为低频存储或归档存储，
+-- storage_class 记录当前存储类型（生成下载URL时判断是否需要先取回），同时作为任务进度
+
+ALTER TABLE battery_upload_photos
+ADD COLUMN storage_class VARCHAR(20) DEFAULT 'STANDARD' NOT NULL COMMENT 'COS 存储类型：STANDARD-标准, STANDARD_IA-低频, ARCHIVE-归档';
+
+-- 分层任务按存储类型和ID分批扫描
+CREATE INDEX idx_battery_upload_photos_storage_class ON battery_upload_photos(storage, storage_class, id);
@@ -0,0 +1,5 @@
+-- 短信验证码错误次数
+-- 验证码输入错误达到上限（SMS_CODE_MAX_ATTEMPTS）后作废，防止暴力猜测
+
+ALTER TABLE sms_codes
+ADD COLUMN attempts INT DEFAULT 0 NOT NULL COMMENT '验证码输入错误次数';
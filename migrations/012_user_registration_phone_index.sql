@@ -0,0 +1,5 @@
+-- 用户注册记录手机号索引
+-- GET /api/user/profile 按手机号查询最新的注册记录（ORDER BY created_at DESC LIMIT 1），
+-- 联合索引上倒序扫描即可定位，不再全表扫描和排序
+
+CREATE INDEX idx_user_registrations_phone_created ON user_registrations(contact_phone, created_at);
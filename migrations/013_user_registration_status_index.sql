@@ -0,0 +1,9 @@
+-- 用户注册记录状态索引改为 (status, submit_time)
+-- 审核列表按状态筛选、按提交时间范围过滤并倒序游标分页，都在该索引上完成，不再排序；
+-- 待审核数量只扫描索引上 status='pending' 的区间
+-- 索引已包含 submit_time 时跳过本脚本（migrate.py 每次部署都会执行所有脚本，避免重复重建索引）：
+-- @skip-if: SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_registrations' AND INDEX_NAME = 'idx_user_registrations_status' AND COLUMN_NAME = 'submit_time'
+
+ALTER TABLE user_registrations
+DROP INDEX idx_user_registrations_status,
+ADD INDEX idx_user_registrations_status (status, submit_time);
@@ -0,0 +1,6 @@
+-- 电池订单乐观锁版本号
+-- PATCH /api/battery/orders/<order_id> 使用 UPDATE ... WHERE id = ? AND version = ? 检测并发修改，
+-- 其他更新订单的接口同样把版本号加 1
+
+ALTER TABLE battery_upload_orders
+ADD COLUMN version INT DEFAULT 1 NOT NULL COMMENT '乐观锁版本号';
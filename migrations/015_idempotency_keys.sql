@@ -0,0 +1,17 @@
+-- 幂等键表
+-- 创建订单、上传照片接口带 Idempotency-Key 头时，第一次请求的响应保存在这里，
+-- 弱网重试的请求直接回放该响应；过期记录由 purge-idempotency-keys 任务清理
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    scope VARCHAR(50) NOT NULL COMMENT '接口名',
+    idempotency_key VARCHAR(100) NOT NULL COMMENT '客户端传入的 Idempotency-Key',
+    fingerprint CHAR(64) NOT NULL COMMENT '请求内容摘要',
+    status VARCHAR(20) NOT NULL DEFAULT 'processing' COMMENT 'processing-处理中, completed-已完成',
+    response_status INT NULL COMMENT '响应状态码',
+    response_body MEDIUMTEXT NULL COMMENT '响应内容',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL COMMENT '过期时间',
+    UNIQUE KEY uk_idempotency_keys_scope_key (scope, idempotency_key),
+    INDEX idx_idempotency_keys_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,28 @@
+-- 订单、照片主键改为 BINARY(16)（第一步：在线准备，旧版本应用继续运行）
+-- CHAR(36) 主键每行 36 字节（utf8mb4 下索引按最多 144 字节计算），所有二级索引都携带主键，
+-- 随机的 uuid4 使每次插入落在聚簇索引的随机位置。新版本改为按时间递增的 UUIDv7，以 BINARY(16) 存储。
+--
+-- 迁移步骤：
+-- 1. 执行本脚本（migrate.py 自动执行）：添加二进制列（MySQL 8.0 INSTANT 加列，不重建表），触发器同步之后写入的记录
+-- 2. 执行 python jobs.py migrate-uuid-keys 分批回填已有记录（可中断后继续，不锁表）
+-- 3. 发布新版本时执行 python jobs.py migrate-uuid-keys --swap 切换主键
+--    （执行 migrations/manual/binary_uuid_keys_swap.sql，不由 migrate.py 自动执行）
+-- 已有记录的 uuid4 值保持不变（只是改为二进制存储），之后新建的记录使用 UUIDv7
+-- 主键已经切换为 BINARY(16) 时跳过本脚本：
+-- @skip-if: SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'battery_upload_orders' AND COLUMN_NAME = 'id' AND DATA_TYPE = 'binary'
+
+ALTER TABLE battery_upload_orders
+ADD COLUMN id_bin BINARY(16) NULL COMMENT '二进制主键（迁移中）',
+ALGORITHM=INSTANT;
+
+ALTER TABLE battery_upload_photos
+ADD COLUMN id_bin BINARY(16) NULL COMMENT '二进制主键（迁移中）',
+ADD COLUMN order_id_bin BINARY(16) NULL COMMENT '二进制订单ID（迁移中）',
+ALGORITHM=INSTANT;
+
+CREATE TRIGGER trg_battery_upload_orders_id_bin_insert BEFORE INSERT ON battery_upload_orders
+FOR EACH ROW SET NEW.id_bin = UNHEX(REPLACE(NEW.id, '-', ''));
+
+CREATE TRIGGER trg_battery_upload_photos_id_bin_insert BEFORE INSERT ON battery_upload_photos
+FOR EACH ROW SET NEW.id_bin = UNHEX(REPLACE(NEW.id, '-', '')),
+                 NEW.order_id_bin = UNHEX(REPLACE(NEW.order_id, '-', ''));
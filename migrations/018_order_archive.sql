@@ -0,0 +1,16 @@
+-- 订单归档
+-- 订单、照片表只增不减。battery_upload_photos 有外键且主键不含 created_at，无法使用 RANGE 分区，
+-- 改为由 archive-orders 任务按自然月把保留期之前的订单及照片记录导出为 gzip 压缩的 JSONL 文件（上传到 COS）后删除，
+-- restore-orders 任务按归档文件恢复。
+-- 照片记录删除后，对应的存储文件登记在 archived_photo_files 中，孤儿清理任务不会删除这些文件
+
+CREATE TABLE IF NOT EXISTS archived_photo_files (
+    photo_id BINARY(16) NOT NULL PRIMARY KEY,
+    filename VARCHAR(255) NOT NULL,
+    file_path TEXT NOT NULL,
+    archive_name VARCHAR(100) NOT NULL COMMENT '归档文件名',
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE INDEX idx_archived_photo_files_filename ON archived_photo_files(filename);
+CREATE INDEX idx_archived_photo_files_archive ON archived_photo_files(archive_name);
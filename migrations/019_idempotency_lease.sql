@@ -0,0 +1,6 @@
+-- 幂等键处理租约
+-- 处理中的记录登记 locked_until（登记时间 + IDEMPOTENCY_LOCK_SECONDS），
+-- 处理请求的实例崩溃或超时后，租约到期即可由之后的重试接管，不必等待 expires_at（默认 24 小时）。
+-- 为空的记录是旧版本登记的，按 expires_at 推算登记时间
+
+ALTER TABLE idempotency_keys ADD COLUMN locked_until DATETIME NULL COMMENT '处理中的租约到期时间' AFTER response_body;
@@ -0,0 +1,7 @@
+-- 照片上传者 openid
+-- 生成 COS 文件元数据（x-cos-meta-fileid）需要上传者的 openid，小程序端据此访问文件。
+-- COS 不可用时照片回退到本地存储，migrate-local-photos 任务补传到 COS 时使用这里记录的 openid；
+-- 为空表示管理端上传或该列添加之前的记录，按管理端（空字符串）生成元数据
+
+ALTER TABLE battery_upload_photos
+ADD COLUMN openid VARCHAR(64) NULL COMMENT '上传者 openid，管理端上传为空' AFTER user_id;
@@ -0,0 +1,43 @@
+-- 订单、照片主键改为 BINARY(16)（第二步：切换，与新版本应用一起发布）
+-- 不在 migrations/ 目录下，migrate.py 不会自动执行。通过 python jobs.py migrate-uuid-keys --swap 执行：
+-- 该命令确认主键尚未切换、回填已完成（没有 id_bin 为空的记录）后才执行本脚本，并替换实际的外键名。
+-- 表重建使用 INPLACE 算法，重建期间允许并发读写，耗时与表大小成正比；
+-- 旧版本应用写入的是字符串主键，执行期间应停止旧版本的写入。
+-- 删除触发器之后仍有遗漏的记录时，CHANGE COLUMN ... NOT NULL 会失败，不会丢失数据
+
+DROP TRIGGER IF EXISTS trg_battery_upload_orders_id_bin_insert;
+DROP TRIGGER IF EXISTS trg_battery_upload_photos_id_bin_insert;
+
+ALTER TABLE battery_upload_photos DROP FOREIGN KEY {photo_order_fk};
+
+ALTER TABLE battery_upload_orders
+DROP PRIMARY KEY,
+DROP COLUMN id,
+CHANGE COLUMN id_bin id BINARY(16) NOT NULL COMMENT '订单ID（UUIDv7）',
+ADD PRIMARY KEY (id),
+ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 包含 id 列的二级索引随旧列删除，按新列重建
+ALTER TABLE battery_upload_photos
+DROP PRIMARY KEY,
+DROP INDEX idx_battery_upload_photos_order_id,
+DROP INDEX idx_battery_upload_photos_user_created,
+DROP INDEX idx_battery_upload_photos_created,
+DROP INDEX idx_battery_upload_photos_storage_class,
+DROP COLUMN id,
+DROP COLUMN order_id,
+CHANGE COLUMN id_bin id BINARY(16) NOT NULL COMMENT '照片ID（UUIDv7）',
+CHANGE COLUMN order_id_bin order_id BINARY(16) NOT NULL COMMENT '订单ID',
+ADD PRIMARY KEY (id),
+ADD INDEX idx_battery_upload_photos_order_id (order_id),
+ADD INDEX idx_battery_upload_photos_user_created (user_id, created_at, id),
+ADD INDEX idx_battery_upload_photos_created (created_at, id),
+ADD INDEX idx_battery_upload_photos_storage_class (storage, storage_class, id),
+ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 数据来自原有外键约束下的记录，不需要重新校验（关闭校验时可以 INPLACE 添加外键）
+SET foreign_key_checks = 0;
+ALTER TABLE battery_upload_photos
+ADD CONSTRAINT fk_battery_upload_photos_order FOREIGN KEY (order_id) REFERENCES battery_upload_orders(id) ON DELETE CASCADE,
+ALGORITHM=INPLACE, LOCK=NONE;
+SET foreign_key_checks = 1;
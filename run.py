@@ -3,6 +3,7 @@ import sys
 import logging
 from wxcloudrun import app, db
 from wxcloudrun import models
+from wxcloudrun.dao import get_column_data_type
 import config
 
 # 配置日志
@@ -12,6 +13,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def check_uuid_key_schema():
+    """
+    检查订单主键是否已切换为 BINARY(16)
+    模型按 BINARY(16) 读写订单、照片ID，主键仍为 CHAR(36) 时所有查询都查不到、新记录写入错误的ID，
+    需要先执行 python jobs.py migrate-uuid-keys（--swap）完成切换（见 README_MIGRATION.md）
+    :return: 是否可以启动
+    """
+    if db.engine.url.get_backend_name() != 'mysql':
+        return True
+    data_type = get_column_data_type('battery_upload_orders', 'id')
+    if data_type != 'binary':
+        logger.error("battery_upload_orders.id 的类型为 %s，不是 BINARY(16)，拒绝启动：请先执行 "
+                     "python jobs.py migrate-uuid-keys 和 python jobs.py migrate-uuid-keys --swap", data_type)
+        return False
+    return True
+
+
 # 启动Flask Web服务
 if __name__ == '__main__':
     # 创建数据库表（如果不存在）
@@ -21,6 +40,8 @@ if __name__ == '__main__':
             logger.info("数据库表创建/检查完成")
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}")
+        if not check_uuid_key_schema():
+            sys.exit(1)
     
     # 启动服务器
     host = sys.argv[1] if len(sys.argv) > 1 else config.SERVER_HOST
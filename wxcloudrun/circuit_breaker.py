@@ -0,0 +1,150 @@
+"""
+熔断器
+在最近 N 次调用中失败率或慢调用率超过阈值时打开熔断，打开期间直接拒绝调用；
+冷却时间结束后进入半开状态放行少量探测请求，探测成功则恢复，失败则重新打开
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('log')
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    基于滑动窗口的熔断器（线程安全）
+    用法：
+        if not breaker.allow_request():
+            return fallback
+        start = time.monotonic()
+        ok = do_call()
+        breaker.record(ok, time.monotonic() - start)
+    """
+
+    def __init__(self, name, window_size=20, minimum_calls=5,
+                 failure_rate_threshold=0.5, slow_call_seconds=3.0,
+                 slow_call_rate_threshold=0.5, open_seconds=30.0,
+                 half_open_max_calls=1):
+        """
+        :param name: 熔断器名称（用于日志和监控）
+        :param window_size: 滑动窗口大小（最近多少次调用）
+        :param minimum_calls: 窗口内至少多少次调用才计算失败率
+        :param failure_rate_threshold: 失败率阈值（0-1）
+        :param slow_call_seconds: 超过该耗时（秒）的调用视为慢调用
+        :param slow_call_rate_threshold: 慢调用率阈值（0-1）
+        :param open_seconds: 打开后多久进入半开状态（秒）
+        :param half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.name = name
+        self.window_size = window_size
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._window = deque(maxlen=window_size)  # (是否失败, 是否慢调用)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+        self._open_count = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        # 调用方需持有锁
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("熔断器 %s 进入半开状态，开始探测", self.name)
+
+    def _open(self):
+        # 调用方需持有锁
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._open_count += 1
+        self._window.clear()
+        logger.warning("熔断器 %s 已打开，%d 秒内直接拒绝调用", self.name, self.open_seconds)
+
+    def allow_request(self):
+        """
+        是否放行本次调用（放行后必须调用 record 报告结果）
+        :return: 是否放行
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record(self, success, elapsed):
+        """
+        报告一次调用结果
+        :param success: 调用是否成功
+        :param elapsed: 调用耗时（秒）
+        """
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+                if success and not slow:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    logger.info("熔断器 %s 探测成功，已恢复", self.name)
+                else:
+                    self._open()
+                return
+
+            if self._state == STATE_OPEN:
+                # 打开前已放行的调用，结果不再计入窗口
+                return
+
+            self._window.append((not success, slow))
+            calls = len(self._window)
+            if calls < self.minimum_calls:
+                return
+            failure_rate = sum(1 for failed, _ in self._window if failed) / calls
+            slow_rate = sum(1 for _, is_slow in self._window if is_slow) / calls
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                logger.warning("熔断器 %s 失败率 %.2f，慢调用率 %.2f，超过阈值",
+                               self.name, failure_rate, slow_rate)
+                self._open()
+
+    def snapshot(self):
+        """
+        获取熔断器状态（用于监控）
+        :return: 状态字典
+        """
+        with self._lock:
+            self._refresh_state()
+            calls = len(self._window)
+            failures = sum(1 for failed, _ in self._window if failed)
+            slow_calls = sum(1 for _, is_slow in self._window if is_slow)
+            retry_in = 0.0
+            if self._state == STATE_OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+            return {
+                'state': self._state,
+                'window_calls': calls,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'slow_call_rate': round(slow_calls / calls, 3) if calls else 0.0,
+                'rejected_calls': self._rejected,
+                'open_count': self._open_count,
+                'retry_in_seconds': round(retry_in, 1),
+            }
@@ -1,19 +1,105 @@
 """
 微信云托管对象存储工具模块
-使用 requests 实现文件上传、下载等管理功能
+使用 requests（共享连接池，见 http_client）和 COS SDK 实现文件上传、下载等管理功能
 参考：https://developers.weixin.qq.com/miniprogram/dev/wxcloudservice/wxcloudrun/src/development/storage/service/cos-sdk.html
 """
 import logging
 import os
+import threading
 import time
+from functools import wraps
+from typing import Optional, Dict, Any, Tuple
 import requests
-from typing import Optional, Dict, Any
 from qcloud_cos import CosConfig
 from qcloud_cos import CosS3Client
 from qcloud_cos.cos_exception import CosClientError, CosServiceError
+from wxcloudrun import metrics, http_client
+from wxcloudrun.circuit_breaker import CircuitBreaker
 
 logger = logging.getLogger('log')
 
+# COS 熔断器：COS 或 api.weixin.qq.com 异常/变慢时快速失败，上传直接回退到本地存储
+cos_breaker = CircuitBreaker(
+    'cos',
+    window_size=int(os.environ.get('COS_BREAKER_WINDOW_SIZE', '20')),
+    minimum_calls=int(os.environ.get('COS_BREAKER_MINIMUM_CALLS', '5')),
+    failure_rate_threshold=float(os.environ.get('COS_BREAKER_FAILURE_RATE', '0.5')),
+    slow_call_seconds=float(os.environ.get('COS_BREAKER_SLOW_CALL_SECONDS', '3')),
+    slow_call_rate_threshold=float(os.environ.get('COS_BREAKER_SLOW_CALL_RATE', '0.5')),
+    open_seconds=float(os.environ.get('COS_BREAKER_OPEN_SECONDS', '30')),
+)
+metrics.register_gauge('cos.breaker', cos_breaker.snapshot)
+
+# 存储类型：低频存储可直接读取；归档类存储需要先取回（restore）才能下载
+STORAGE_CLASS_STANDARD = 'STANDARD'
+STORAGE_CLASS_STANDARD_IA = 'STANDARD_IA'
+STORAGE_CLASS_ARCHIVE = 'ARCHIVE'
+ARCHIVE_STORAGE_CLASSES = frozenset([STORAGE_CLASS_ARCHIVE, 'DEEP_ARCHIVE'])
+
+# 归档对象取回配置：取回副本保留天数和取回模式（Expedited/Standard/Bulk）
+RESTORE_DAYS = int(os.environ.get('COS_RESTORE_DAYS', '1'))
+RESTORE_TIER = os.environ.get('COS_RESTORE_TIER', 'Standard')
+
+# 取回状态
+RESTORE_STATUS_AVAILABLE = 'available'
+RESTORE_STATUS_RESTORING = 'restoring'
+
+
+# 当前线程正在执行的 COS 调用是否遇到服务故障（由 _mark_fault 设置，熔断装饰器读取）
+_call_state = threading.local()
+
+
+def _is_fault(error) -> bool:
+    """
+    是否为 COS 服务故障：网络错误、超时和 5xx 响应；
+    4xx（对象不存在、无权限、参数错误等）是正常的业务结果，不计入熔断
+    """
+    if isinstance(error, CosServiceError):
+        status_code = error.get_status_code()
+        return status_code is None or status_code >= 500 or status_code == 408
+    return isinstance(error, (CosClientError, requests.RequestException, TimeoutError, ConnectionError))
+
+
+def _mark_fault(error=None):
+    """
+    在受熔断保护的函数中标记本次调用遇到服务故障
+    :param error: 捕获的异常，为空表示无条件标记（如获取临时密钥失败）
+    """
+    if error is None or _is_fault(error):
+        _call_state.fault = True
+
+
+def _guarded_by_breaker(func):
+    """
+    COS 调用熔断装饰器
+    熔断打开时直接返回 None（调用方按失败处理）。只有被 _mark_fault 标记的服务故障（网络错误、超时、5xx）
+    或抛出的异常计入熔断器窗口的失败；返回值为空（对象不存在、未取回等）视为调用成功
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        name = func.__name__
+        if not cos_breaker.allow_request():
+            metrics.incr(f'cos.{name}.short_circuited')
+            logger.warning("COS 熔断器打开，跳过调用: %s", name)
+            return None
+        outer_fault = getattr(_call_state, 'fault', False)
+        _call_state.fault = False
+        start = time.monotonic()
+        result = None
+        raised = True
+        try:
+            result = func(*args, **kwargs)
+            raised = False
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            fault = raised or _call_state.fault
+            _call_state.fault = outer_fault
+            cos_breaker.record(not fault, elapsed)
+            metrics.observe(f'cos.{name}', elapsed)
+            metrics.incr(f'cos.{name}.{"failure" if fault else "success" if result else "miss"}')
+    return wrapper
+
 # 临时密钥缓存
 _temp_credentials: Optional[Dict[str, Any]] = None
 _temp_credentials_expire_time: int = 0
@@ -34,8 +120,7 @@ def get_temp_credentials() -> Optional[Dict[str, Any]]:
     
     try:
         url = "http://api.weixin.qq.com/_/cos/getauth"
-        response = requests.get(url, timeout=10, proxies={'http': None, 'https': None})
-        response.raise_for_status()
+        response = http_client.call('GET', url, 'getauth', idempotent=True, budget=5.0)
         data = response.json()
         
         if 'TmpSecretId' in data and 'TmpSecretKey' in data:
@@ -61,6 +146,7 @@ def get_cos_client() -> Optional[CosS3Client]:
         credentials = get_temp_credentials()
         if not credentials:
             logger.error("无法获取临时密钥")
+            _mark_fault()
             return None
         
         # 获取存储桶配置
@@ -118,8 +204,8 @@ def get_file_metadata(openid: str, cos_path: str) -> Optional[str]:
             "paths": [cos_path]
         }
         
-        response = requests.post(url, json=payload, timeout=10, proxies={'http': None, 'https': None})
-        response.raise_for_status()
+        # 编码元数据不产生副作用，可以安全重试
+        response = http_client.call('POST', url, 'metaid_encode', idempotent=True, budget=3.0, json=payload)
         data = response.json()
         
         if data.get('errcode') == 0 and data.get('respdata'):
@@ -135,6 +221,7 @@ def get_file_metadata(openid: str, cos_path: str) -> Optional[str]:
         return None
 
 
+@_guarded_by_breaker
 def upload_photo_to_cos(file_data: bytes, user_id: str, filename: str, openid: str = '') -> Optional[str]:
     """
     上传照片到微信云托管对象存储
@@ -167,7 +254,7 @@ def upload_photo_to_cos(file_data: bytes, user_id: str, filename: str, openid: s
             'Bucket': bucket_name,
             'Body': file_data,
             'Key': cos_key,
-            'StorageClass': 'STANDARD'
+            'StorageClass': STORAGE_CLASS_STANDARD
         }
         
         # 如果有元数据，添加到 Headers
@@ -188,12 +275,15 @@ def upload_photo_to_cos(file_data: bytes, user_id: str, filename: str, openid: s
         
     except CosClientError as e:
         logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return None
     except CosServiceError as e:
         logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
         return None
     except Exception as e:
         logger.error(f"上传文件到 COS 失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return None
 
 
@@ -237,6 +327,7 @@ def extract_cos_key_from_file_path(file_path: str) -> Optional[str]:
     return None
 
 
+@_guarded_by_breaker
 def get_file_download_url(cos_key: str, expires: int = 3600) -> Optional[str]:
     """
     获取文件的预签名下载URL
@@ -265,15 +356,61 @@ def get_file_download_url(cos_key: str, expires: int = 3600) -> Optional[str]:
         
     except CosClientError as e:
         logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return None
     except CosServiceError as e:
         logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
         return None
     except Exception as e:
         logger.error(f"获取下载URL失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return None
 
 
+@_guarded_by_breaker
+def upload_file_to_cos(local_path: str, cos_key: str, storage_class: str = STORAGE_CLASS_STANDARD) -> bool:
+    """
+    上传本地文件到 COS（大文件自动分块上传）
+    :param local_path: 本地文件路径
+    :param cos_key: COS 文件路径（Key）
+    :param storage_class: 存储类型
+    :return: 是否成功
+    """
+    try:
+        client = get_cos_client()
+        if not client:
+            return False
+        
+        bucket_name = get_bucket_name()
+        if not bucket_name:
+            return False
+        
+        client.upload_file(
+            Bucket=bucket_name,
+            Key=cos_key,
+            LocalFilePath=local_path,
+            StorageClass=storage_class
+        )
+        
+        logger.info(f"文件上传成功: {local_path} -> {cos_key}")
+        return True
+        
+    except CosClientError as e:
+        logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return False
+    except CosServiceError as e:
+        logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
+        return False
+    except Exception as e:
+        logger.error(f"上传文件失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return False
+
+
+@_guarded_by_breaker
 def download_file_from_cos(cos_key: str, local_path: str) -> bool:
     """
     从 COS 下载文件到本地
@@ -305,15 +442,19 @@ def download_file_from_cos(cos_key: str, local_path: str) -> bool:
         
     except CosClientError as e:
         logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return False
     except CosServiceError as e:
         logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
         return False
     except Exception as e:
         logger.error(f"下载文件失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return False
 
 
+@_guarded_by_breaker
 def delete_file_from_cos(cos_key: str) -> bool:
     """
     从 COS 删除文件
@@ -340,12 +481,15 @@ def delete_file_from_cos(cos_key: str) -> bool:
         
     except CosClientError as e:
         logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return False
     except CosServiceError as e:
         logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
         return False
     except Exception as e:
         logger.error(f"删除文件失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
         return False
 
 
@@ -362,8 +506,7 @@ def decode_file_metadata(metaid: str) -> Optional[Dict[str, Any]]:
             "metaid": metaid
         }
         
-        response = requests.post(url, json=payload, timeout=10, proxies={'http': None, 'https': None})
-        response.raise_for_status()
+        response = http_client.call('POST', url, 'metaid_decode', idempotent=True, budget=3.0, json=payload)
         data = response.json()
         
         if data.get('errcode') == 0 and data.get('respdata'):
@@ -376,3 +519,232 @@ def decode_file_metadata(metaid: str) -> Optional[Dict[str, Any]]:
     except Exception as e:
         logger.error(f"解析文件元数据异常: {str(e)}", exc_info=True)
         return None
+
+
+@_guarded_by_breaker
+def list_objects_page(prefix: str, marker: str = '', max_keys: int = 1000) -> Optional[Dict[str, Any]]:
+    """
+    分页列出 COS 对象
+    :param prefix: 对象前缀，如 photos/
+    :param marker: 上一页返回的 next_marker，第一页传空字符串
+    :param max_keys: 每页最多返回的对象数（最大 1000）
+    :return: {'objects': [{'key', 'size', 'last_modified', 'storage_class'}], 'next_marker', 'is_truncated'} 或 None
+    """
+    try:
+        client = get_cos_client()
+        if not client:
+            return None
+        
+        bucket_name = get_bucket_name()
+        if not bucket_name:
+            return None
+        
+        response = client.list_objects(
+            Bucket=bucket_name,
+            Prefix=prefix,
+            Marker=marker,
+            MaxKeys=max_keys
+        )
+        objects = [{
+            'key': item['Key'],
+            'size': int(item.get('Size', 0)),
+            'last_modified': item.get('LastModified'),
+            'storage_class': item.get('StorageClass', 'STANDARD'),
+        } for item in response.get('Contents', [])]
+        is_truncated = str(response.get('IsTruncated', 'false')).lower() == 'true'
+        next_marker = response.get('NextMarker') or (objects[-1]['key'] if objects else '')
+        return {
+            'objects': objects,
+            'next_marker': next_marker if is_truncated else '',
+            'is_truncated': is_truncated,
+        }
+        
+    except CosClientError as e:
+        logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except CosServiceError as e:
+        logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except Exception as e:
+        logger.error(f"列出文件失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+
+
+@_guarded_by_breaker
+def delete_files_from_cos(cos_keys: list) -> Optional[Dict[str, Any]]:
+    """
+    批量删除 COS 文件（单次最多 1000 个）
+    :param cos_keys: COS 文件路径（Key）列表
+    :return: {'deleted': [key, ...], 'errors': [{'key', 'code', 'message'}]} 或 None
+    """
+    try:
+        if not cos_keys:
+            return {'deleted': [], 'errors': []}
+        if len(cos_keys) > 1000:
+            raise ValueError("单次最多删除 1000 个文件")
+        
+        client = get_cos_client()
+        if not client:
+            return None
+        
+        bucket_name = get_bucket_name()
+        if not bucket_name:
+            return None
+        
+        response = client.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                'Quiet': 'false',
+                'Object': [{'Key': key} for key in cos_keys]
+            }
+        )
+        errors = [{
+            'key': item.get('Key'),
+            'code': item.get('Code'),
+            'message': item.get('Message'),
+        } for item in response.get('Error', [])]
+        deleted = [item.get('Key') for item in response.get('Deleted', [])]
+        
+        logger.info(f"批量删除文件完成: 成功 {len(deleted)} 个, 失败 {len(errors)} 个")
+        return {'deleted': deleted, 'errors': errors}
+        
+    except CosClientError as e:
+        logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except CosServiceError as e:
+        logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except Exception as e:
+        logger.error(f"批量删除文件失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+
+
+@_guarded_by_breaker
+def change_storage_class(cos_key: str, storage_class: str) -> Optional[str]:
+    """
+    修改 COS 文件的存储类型（复制到同一个 Key，保留 x-cos-meta-fileid 等元数据）
+    :param cos_key: COS 文件路径（Key）
+    :param storage_class: 目标存储类型，如 STANDARD_IA、ARCHIVE
+    :return: 修改后的存储类型或 None
+    """
+    try:
+        client = get_cos_client()
+        if not client:
+            return None
+        
+        bucket_name = get_bucket_name()
+        if not bucket_name:
+            return None
+        
+        # CopyStatus=Copy 沿用源对象的元数据，只修改存储类型
+        client.copy_object(
+            Bucket=bucket_name,
+            Key=cos_key,
+            CopySource={
+                'Bucket': bucket_name,
+                'Key': cos_key,
+                'Region': os.environ.get('COS_REGION', 'ap-shanghai')
+            },
+            CopyStatus='Copy',
+            StorageClass=storage_class
+        )
+        
+        logger.info(f"修改存储类型成功: {cos_key} -> {storage_class}")
+        return storage_class
+        
+    except CosClientError as e:
+        logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except CosServiceError as e:
+        logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except Exception as e:
+        logger.error(f"修改存储类型失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+
+
+@_guarded_by_breaker
+def ensure_restored(cos_key: str) -> Optional[str]:
+    """
+    检查归档文件的取回状态，尚未取回时发起取回
+    :param cos_key: COS 文件路径（Key）
+    :return: available（已取回，可以下载）、restoring（取回中）或 None
+    """
+    try:
+        client = get_cos_client()
+        if not client:
+            return None
+        
+        bucket_name = get_bucket_name()
+        if not bucket_name:
+            return None
+        
+        response = client.head_object(Bucket=bucket_name, Key=cos_key)
+        headers = {key.lower(): value for key, value in response.items()}
+        restore = headers.get('x-cos-restore')
+        if restore:
+            # 形如 ongoing-request="false", expiry-date="..."
+            if 'ongoing-request="true"' in restore:
+                return RESTORE_STATUS_RESTORING
+            return RESTORE_STATUS_AVAILABLE
+        
+        if headers.get('x-cos-storage-class', STORAGE_CLASS_STANDARD) not in ARCHIVE_STORAGE_CLASSES:
+            # 数据库记录的存储类型已过期（例如文件被手动恢复为标准存储）
+            return RESTORE_STATUS_AVAILABLE
+        
+        try:
+            client.restore_object(
+                Bucket=bucket_name,
+                Key=cos_key,
+                RestoreRequest={
+                    'Days': RESTORE_DAYS,
+                    'CASCADEConfiguration': {'Tier': RESTORE_TIER}
+                }
+            )
+            logger.info(f"已发起归档文件取回: {cos_key}, 模式: {RESTORE_TIER}")
+        except CosServiceError as e:
+            # 并发请求已经发起过取回
+            if e.get_error_code() != 'RestoreAlreadyInProgress':
+                raise
+        metrics.incr('cos.restore.requested')
+        return RESTORE_STATUS_RESTORING
+        
+    except CosClientError as e:
+        logger.error(f"COS 客户端错误: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except CosServiceError as e:
+        logger.error(f"COS 服务错误: {e.get_error_code()}, {e.get_error_msg()}", exc_info=True)
+        _mark_fault(e)
+        return None
+    except Exception as e:
+        logger.error(f"检查归档文件取回状态失败: {str(e)}", exc_info=True)
+        _mark_fault(e)
+        return None
+
+
+def get_photo_download_url(cos_key: str, storage_class: str = STORAGE_CLASS_STANDARD,
+                           expires: int = 3600) -> Tuple[Optional[str], Optional[str]]:
+    """
+    按存储类型获取照片下载URL
+    归档文件需要先取回，取回完成前不生成URL（预签名URL此时访问会返回 403）
+    :param cos_key: COS 文件路径（Key）
+    :param storage_class: 数据库记录的存储类型
+    :param expires: URL 有效期（秒）
+    :return: (预签名下载URL或 None, 取回状态)，非归档文件的取回状态为 None
+    """
+    if storage_class in ARCHIVE_STORAGE_CLASSES:
+        restore_status = ensure_restored(cos_key)
+        if restore_status != RESTORE_STATUS_AVAILABLE:
+            return None, restore_status
+        return get_file_download_url(cos_key, expires=expires), restore_status
+    return get_file_download_url(cos_key, expires=expires), None
@@ -1,19 +1,127 @@
 import logging
-from datetime import datetime
-from sqlalchemy.exc import OperationalError
-from sqlalchemy import and_
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError, IntegrityError
+from sqlalchemy import and_, or_, bindparam, event, select, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+import config
 from wxcloudrun import db
+from wxcloudrun.ttl_cache import TTLCache
 from wxcloudrun.models import (
     UserRegistration, BusinessType, UserRole,
-    BatteryUploadOrder, BatteryUploadPhoto, User, SmsCode
+    BatteryUploadOrder, BatteryUploadPhoto, User, SmsCode, JobCheckpoint, IdempotencyKey, ArchivedPhotoFile
 )
 
 # 初始化日志
 logger = logging.getLogger('log')
 
+# session.info 中标记当前处于 transaction() 作用域的键
+_TRANSACTION_KEY = 'dao_transaction'
+
+
+# ========== 事务相关 ==========
+
+@contextmanager
+def transaction():
+    """
+    事务作用域（unit of work）
+    作用域内调用的写操作只 flush 不 commit、不 refresh，退出作用域时统一提交一次，
+    发生异常则整体回滚。嵌套调用会复用最外层事务。
+    提交后不使实体属性过期，处理器构建响应时不会再触发 SELECT。
+    用法：
+        with transaction():
+            user = create_user(phone)
+            create_user_registration({...})
+    :return: 当前 session
+    """
+    session = db.session()
+    if session.info.get(_TRANSACTION_KEY):
+        yield session
+        return
+
+    expire_on_commit = session.expire_on_commit
+    session.info[_TRANSACTION_KEY] = True
+    session.expire_on_commit = False
+    try:
+        yield session
+        session.commit()
+    except Exception as e:
+        logger.error("transaction errorMsg= {}".format(e))
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(_TRANSACTION_KEY, None)
+        session.expire_on_commit = expire_on_commit
+
+
+def in_transaction():
+    """
+    当前是否处于 transaction() 作用域内
+    :return: 是否在事务中
+    """
+    return bool(db.session().info.get(_TRANSACTION_KEY))
+
+
+def _save(entity=None):
+    """
+    持久化当前 session 中的变更
+    事务作用域内只 flush（自增主键和 Python 端默认值会在 flush 时回填到实体上），
+    否则立即提交并 refresh，保持原有的单步调用语义
+    :param entity: 需要 refresh 的实体，可为空
+    """
+    if in_transaction():
+        db.session.flush()
+        return
+    db.session.commit()
+    if entity is not None:
+        db.session.refresh(entity)
+
+
+def _rollback():
+    """
+    写操作失败时回滚
+    事务作用域内交给 transaction() 统一回滚，避免半途丢弃外层已有的变更
+    """
+    if not in_transaction():
+        db.session.rollback()
+
+
+def _raise_in_transaction():
+    """
+    出错时返回默认值（None、False 等）的函数在 except 中调用：
+    事务作用域内重新抛出当前异常，由 transaction() 整体回滚，避免在已经出错的事务中继续执行并提交；
+    否则不做处理，保持原有的返回值
+    """
+    if in_transaction():
+        raise
+
+
+def _after_commit(callback):
+    """
+    执行回调使缓存失效：总是立即执行一次；在 transaction() 作用域内再注册到提交之后执行一次
+    （提交前的并发请求可能已经把旧值重新写入缓存，提交后的第二次失效把它清掉，重复失效是有意的）
+    :param callback: 无参函数
+    """
+    callback()
+    if in_transaction():
+        event.listen(db.session(), 'after_commit', lambda session: callback(), once=True)
+
 
 # ========== 用户注册相关 ==========
 
+# 按手机号缓存 GET /api/user/profile 的响应数据，注册、审核、更新营业执照时失效
+user_profile_cache = TTLCache('cache.user_profile', config.USER_PROFILE_CACHE_SIZE, config.USER_PROFILE_CACHE_TTL)
+
+
+def invalidate_user_profile(phone):
+    """
+    使该手机号的个人信息缓存失效
+    :param phone: 手机号
+    """
+    if phone:
+        _after_commit(lambda: user_profile_cache.delete(phone))
+
+
 def create_user_registration(registration_data):
     """
     创建用户注册记录
@@ -23,16 +131,16 @@ def create_user_registration(registration_data):
     try:
         registration = UserRegistration(**registration_data)
         db.session.add(registration)
-        db.session.commit()
-        db.session.refresh(registration)
+        _save(registration)
+        invalidate_user_profile(registration.contact_phone)
         return registration
     except OperationalError as e:
         logger.error("create_user_registration errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("create_user_registration errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
 
 
@@ -46,6 +154,7 @@ def get_user_registration_by_user_id(user_id):
         return UserRegistration.query.filter(UserRegistration.user_id == user_id).first()
     except OperationalError as e:
         logger.error("get_user_registration_by_user_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -61,24 +170,28 @@ def get_user_registration_by_registration_id(registration_id):
         ).first()
     except OperationalError as e:
         logger.error("get_user_registration_by_registration_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
 def get_user_registration_by_phone(phone):
     """
     根据手机号查询用户注册记录（返回最新的）
+    按 idx_user_registrations_phone_created 倒序扫描，只回表读取一行
     :param phone: 手机号
     :return: UserRegistration 实体或 None
     """
     try:
         return UserRegistration.query.filter(
             UserRegistration.contact_phone == phone
-        ).order_by(UserRegistration.created_at.desc()).first()
+        ).order_by(UserRegistration.created_at.desc(), UserRegistration.id.desc()).first()
     except OperationalError as e:
         logger.error("get_user_registration_by_phone errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
     except Exception as e:
         logger.error("get_user_registration_by_phone errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -93,21 +206,63 @@ def get_latest_user_registration():
         ).first()
     except OperationalError as e:
         logger.error("get_latest_user_registration errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
-def get_all_user_registrations():
+def list_user_registrations(status=None, submitted_from=None, submitted_to=None, cursor=None, limit=20):
     """
-    获取所有用户注册记录
-    :return: UserRegistration 列表
+    游标分页查询用户注册记录（按提交时间倒序）
+    按状态筛选时走 idx_user_registrations_status (status, submit_time)，否则走 idx_user_registrations_submit_time，
+    查询代价与总数据量无关
+    :param status: 按状态筛选，可为空
+    :param submitted_from: 提交时间下限（包含），可为空
+    :param submitted_to: 提交时间上限（不包含），可为空
+    :param cursor: 上一页最后一条记录的 (submit_time, id)，可为空
+    :param limit: 分页大小
+    :return: (UserRegistration 列表, 是否还有下一页)
     """
     try:
-        return UserRegistration.query.order_by(
-            UserRegistration.created_at.desc()
-        ).all()
+        query = UserRegistration.query
+        if status:
+            query = query.filter(UserRegistration.status == status)
+        if submitted_from:
+            query = query.filter(UserRegistration.submit_time >= submitted_from)
+        if submitted_to:
+            query = query.filter(UserRegistration.submit_time < submitted_to)
+        if cursor:
+            cursor_submit_time, cursor_id = cursor
+            query = query.filter(or_(
+                UserRegistration.submit_time < cursor_submit_time,
+                and_(
+                    UserRegistration.submit_time == cursor_submit_time,
+                    UserRegistration.id < cursor_id
+                )
+            ))
+        registrations = query.order_by(
+            UserRegistration.submit_time.desc(), UserRegistration.id.desc()
+        ).limit(limit + 1).all()
+        return registrations[:limit], len(registrations) > limit
     except OperationalError as e:
-        logger.error("get_all_user_registrations errorMsg= {}".format(e))
-        return []
+        logger.error("list_user_registrations errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return [], False
+
+
+def count_user_registrations(status):
+    """
+    统计某个状态的注册记录数（只扫描 idx_user_registrations_status 上该状态的区间）
+    :param status: 状态
+    :return: 记录数
+    """
+    try:
+        return db.session.query(db.func.count(UserRegistration.id)).filter(
+            UserRegistration.status == status
+        ).scalar() or 0
+    except OperationalError as e:
+        logger.error("count_user_registrations errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return 0
 
 
 def update_user_registration_status(registration_id, status, review_comment=None):
@@ -130,16 +285,54 @@ def update_user_registration_status(registration_id, status, review_comment=None
             registration.review_comment = review_comment
         registration.updated_at = datetime.utcnow()
         
-        db.session.commit()
-        db.session.refresh(registration)
+        _save(registration)
+        invalidate_user_profile(registration.contact_phone)
         return registration
     except OperationalError as e:
         logger.error("update_user_registration_status errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("update_user_registration_status errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        raise
+
+
+def bulk_update_user_registration_status(registration_ids, status, review_comment=None):
+    """
+    批量更新用户注册状态（一条 SELECT 确认存在的记录，一条 UPDATE 批量更新）
+    在 transaction() 中调用时两条语句一起提交
+    :param registration_ids: 注册ID列表
+    :param status: 新状态
+    :param review_comment: 审核评论，为空时保留原评论
+    :return: 实际存在并已更新的注册ID集合
+    """
+    if not registration_ids:
+        return set()
+    try:
+        rows = db.session.query(UserRegistration.registration_id, UserRegistration.contact_phone).filter(
+            UserRegistration.registration_id.in_(registration_ids)
+        ).all()
+        if not rows:
+            return set()
+        found = {row.registration_id for row in rows}
+        now = datetime.utcnow()
+        values = {'status': status, 'review_time': now, 'updated_at': now}
+        if review_comment:
+            values['review_comment'] = review_comment
+        table = UserRegistration.__table__
+        db.session.execute(table.update().where(table.c.registration_id.in_(found)).values(**values))
+        _save()
+        for phone in {row.contact_phone for row in rows}:
+            invalidate_user_profile(phone)
+        return found
+    except OperationalError as e:
+        logger.error("bulk_update_user_registration_status errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("bulk_update_user_registration_status errorMsg= {}".format(e))
+        _rollback()
         raise
 
 
@@ -158,15 +351,18 @@ def update_user_business_license_path(user_id, business_license_path):
         
         registration.business_license_path = business_license_path
         registration.updated_at = datetime.utcnow()
-        db.session.commit()
+        _save()
+        invalidate_user_profile(registration.contact_phone)
         return True
     except OperationalError as e:
         logger.error("update_user_business_license_path errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
     except Exception as e:
         logger.error("update_user_business_license_path errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
 
 
@@ -181,16 +377,15 @@ def create_battery_upload_order(order_data):
     try:
         order = BatteryUploadOrder(**order_data)
         db.session.add(order)
-        db.session.commit()
-        db.session.refresh(order)
+        _save(order)
         return order
     except OperationalError as e:
         logger.error("create_battery_upload_order errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("create_battery_upload_order errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
 
 
@@ -204,20 +399,26 @@ def get_battery_upload_order_by_id(order_id):
         return BatteryUploadOrder.query.filter(BatteryUploadOrder.id == order_id).first()
     except OperationalError as e:
         logger.error("get_battery_upload_order_by_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
-def get_all_battery_upload_orders():
+def get_all_battery_upload_orders(created_from=None):
     """
-    获取所有电池上传订单
+    获取电池上传订单（按创建时间倒序）
+    :param created_from: 只查询该时间之后创建的订单（走 created_at 索引），None 表示全部
     :return: BatteryUploadOrder 列表
     """
     try:
-        return BatteryUploadOrder.query.order_by(
+        query = BatteryUploadOrder.query
+        if created_from is not None:
+            query = query.filter(BatteryUploadOrder.created_at >= created_from)
+        return query.order_by(
             BatteryUploadOrder.created_at.desc()
         ).all()
     except OperationalError as e:
         logger.error("get_all_battery_upload_orders errorMsg= {}".format(e))
+        _raise_in_transaction()
         return []
 
 
@@ -239,16 +440,114 @@ def update_battery_upload_order(order_id, update_data):
                 setattr(order, key, value)
         
         order.updated_at = datetime.utcnow()
-        db.session.commit()
-        db.session.refresh(order)
+        order.version = BatteryUploadOrder.version + 1
+        _save(order)
         return order
     except OperationalError as e:
         logger.error("update_battery_upload_order errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("update_battery_upload_order errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        raise
+
+
+def patch_battery_upload_order(order_id, expected_version, fields, allowed_from=None):
+    """
+    按版本号更新订单的部分字段（乐观锁）
+    UPDATE battery_upload_orders SET ..., version = version + 1 WHERE id = ? AND version = ? [AND status IN (?)]
+    修改状态时（allowed_from 不为空）需要在 transaction() 中调用：先 SELECT ... FOR UPDATE 锁定并读取原状态，
+    UPDATE 再以 status IN (allowed_from + 目标状态) 为条件，状态与目标状态相同时视为不修改状态
+    :param order_id: 订单ID
+    :param expected_version: 客户端读取到的版本号
+    :param fields: 要更新的字段字典
+    :param allowed_from: 允许变更到 fields['status'] 的当前状态集合，为空表示不修改状态
+    :return: (新版本号, 更新时间, 原状态)；版本号不匹配或订单不存在时返回 (None, None, None)，
+             当前状态不允许变更到目标状态时返回 (None, None, 当前状态)
+    """
+    try:
+        now = datetime.utcnow()
+        table = BatteryUploadOrder.__table__
+        condition = and_(table.c.id == order_id, table.c.version == expected_version)
+        previous_status = None
+        if allowed_from is not None:
+            previous_status = db.session.query(BatteryUploadOrder.status).filter(
+                BatteryUploadOrder.id == order_id, BatteryUploadOrder.version == expected_version
+            ).with_for_update().scalar()
+            if previous_status is None:
+                return None, None, None
+            statuses = tuple(allowed_from) + (fields['status'],)
+            if previous_status not in statuses:
+                return None, None, previous_status
+            condition = and_(condition, table.c.status.in_(statuses))
+        result = db.session.execute(
+            table.update().where(condition).values(updated_at=now, version=table.c.version + 1, **fields)
+        )
+        _save()
+        if result.rowcount != 1:
+            return None, None, None
+        return expected_version + 1, now, previous_status
+    except OperationalError as e:
+        logger.error("patch_battery_upload_order errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("patch_battery_upload_order errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def get_battery_order_version(order_id):
+    """
+    查询订单当前的版本号
+    :param order_id: 订单ID
+    :return: 版本号，订单不存在返回 None
+    """
+    try:
+        return db.session.query(BatteryUploadOrder.version).filter(
+            BatteryUploadOrder.id == order_id
+        ).scalar()
+    except OperationalError as e:
+        logger.error("get_battery_order_version errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return None
+
+
+def bulk_transition_battery_order_status(order_ids, to_status, allowed_from):
+    """
+    批量变更订单状态（一条 SELECT ... FOR UPDATE 锁定并读取当前状态，一条 UPDATE 批量变更）
+    需要在 transaction() 中调用：行锁保证读取到的状态在 UPDATE 之前不被其他请求修改
+    :param order_ids: 订单ID列表
+    :param to_status: 目标状态
+    :param allowed_from: 允许变更到目标状态的当前状态集合
+    :return: (已变更的 {订单ID: (原状态, 新版本号)}, 未变更的 {订单ID: 当前状态}, 变更时间)，不存在的订单不在其中
+    """
+    if not order_ids:
+        return {}, {}, None
+    try:
+        rows = db.session.query(
+            BatteryUploadOrder.id, BatteryUploadOrder.status, BatteryUploadOrder.version
+        ).filter(BatteryUploadOrder.id.in_(order_ids)).with_for_update().all()
+        changed = {row.id: (row.status, row.version + 1) for row in rows if row.status in allowed_from}
+        unchanged = {row.id: row.status for row in rows if row.status not in allowed_from}
+        now = datetime.utcnow()
+        if changed:
+            table = BatteryUploadOrder.__table__
+            db.session.execute(
+                table.update().where(table.c.id.in_(list(changed))).values(
+                    status=to_status, updated_at=now, version=table.c.version + 1
+                )
+            )
+            _save()
+        return changed, unchanged, now
+    except OperationalError as e:
+        logger.error("bulk_transition_battery_order_status errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("bulk_transition_battery_order_status errorMsg= {}".format(e))
+        _rollback()
         raise
 
 
@@ -261,16 +560,15 @@ def create_battery_upload_photo(photo_data):
     try:
         photo = BatteryUploadPhoto(**photo_data)
         db.session.add(photo)
-        db.session.commit()
-        db.session.refresh(photo)
+        _save(photo)
         return photo
     except OperationalError as e:
         logger.error("create_battery_upload_photo errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("create_battery_upload_photo errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
 
 
@@ -286,9 +584,210 @@ def get_photos_by_order_id(order_id):
         ).order_by(BatteryUploadPhoto.upload_index).all()
     except OperationalError as e:
         logger.error("get_photos_by_order_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return []
 
 
+def get_battery_upload_photo_by_id(photo_id):
+    """
+    根据照片ID查询照片
+    :param photo_id: 照片ID
+    :return: BatteryUploadPhoto 实体或 None
+    """
+    try:
+        return BatteryUploadPhoto.query.filter(BatteryUploadPhoto.id == photo_id).first()
+    except OperationalError as e:
+        logger.error("get_battery_upload_photo_by_id errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return None
+
+
+def list_battery_upload_photos(user_id=None, storage=None, cursor=None, limit=20, created_from=None):
+    """
+    游标分页查询照片记录（按创建时间倒序）
+    走 (user_id, created_at, id) / (created_at, id) 索引，查询代价与总数据量无关
+    :param user_id: 按用户筛选，可为空
+    :param storage: 按存储位置筛选（cos / local），可为空
+    :param cursor: 上一页最后一条记录的 (created_at, id)，可为空
+    :param limit: 分页大小
+    :param created_from: 只查询该时间之后创建的照片，None 表示全部
+    :return: (BatteryUploadPhoto 列表, 是否还有下一页)
+    """
+    try:
+        query = BatteryUploadPhoto.query
+        if user_id:
+            query = query.filter(BatteryUploadPhoto.user_id == user_id)
+        if storage:
+            query = query.filter(BatteryUploadPhoto.storage == storage)
+        if created_from is not None:
+            query = query.filter(BatteryUploadPhoto.created_at >= created_from)
+        if cursor:
+            cursor_created_at, cursor_id = cursor
+            query = query.filter(or_(
+                BatteryUploadPhoto.created_at < cursor_created_at,
+                and_(
+                    BatteryUploadPhoto.created_at == cursor_created_at,
+                    BatteryUploadPhoto.id < cursor_id
+                )
+            ))
+        photos = query.order_by(
+            BatteryUploadPhoto.created_at.desc(), BatteryUploadPhoto.id.desc()
+        ).limit(limit + 1).all()
+        return photos[:limit], len(photos) > limit
+    except OperationalError as e:
+        logger.error("list_battery_upload_photos errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return [], False
+
+
+def get_local_photos_after(after_id, limit):
+    """
+    按ID顺序获取本地回退存储的照片（用于迁移到 COS）
+    :param after_id: 上一批最后一条记录的ID，从头开始时传空字符串
+    :param limit: 批大小
+    :return: BatteryUploadPhoto 列表
+    """
+    try:
+        query = BatteryUploadPhoto.query.filter(BatteryUploadPhoto.storage == 'local')
+        if after_id:
+            query = query.filter(BatteryUploadPhoto.id > after_id)
+        return query.order_by(BatteryUploadPhoto.id).limit(limit).all()
+    except OperationalError as e:
+        logger.error("get_local_photos_after errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return []
+
+
+def mark_photos_migrated_to_cos(updates):
+    """
+    批量把本地照片记录改写为 COS Key（一条 executemany 语句）
+    只更新仍为本地存储的记录，重复执行不会产生副作用
+    :param updates: [(photo_id, cos_key), ...]
+    :return: 实际更新的行数
+    """
+    if not updates:
+        return 0
+    try:
+        table = BatteryUploadPhoto.__table__
+        statement = table.update().where(
+            and_(table.c.id == bindparam('photo_id'), table.c.storage == 'local')
+        ).values(file_path=bindparam('cos_key'), storage='cos')
+        result = db.session.execute(
+            statement, [{'photo_id': photo_id, 'cos_key': cos_key} for photo_id, cos_key in updates]
+        )
+        _save()
+        return result.rowcount
+    except OperationalError as e:
+        logger.error("mark_photos_migrated_to_cos errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("mark_photos_migrated_to_cos errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def get_photo_file_paths_by_filenames(filenames):
+    """
+    按文件名批量查询照片记录（包括已归档的照片）的存储路径（走 filename 索引）
+    :param filenames: 文件名列表
+    :return: file_path 集合
+    """
+    if not filenames:
+        return set()
+    try:
+        filenames = list(filenames)
+        rows = db.session.query(BatteryUploadPhoto.file_path).filter(
+            BatteryUploadPhoto.filename.in_(filenames)
+        ).union_all(
+            db.session.query(ArchivedPhotoFile.file_path).filter(
+                ArchivedPhotoFile.filename.in_(filenames)
+            )
+        ).all()
+        return {row.file_path for row in rows}
+    except OperationalError as e:
+        logger.error("get_photo_file_paths_by_filenames errorMsg= {}".format(e))
+        raise
+
+
+
+def get_photos_for_tiering(after_id, ia_cutoff, archive_cutoff, terminal_statuses, limit):
+    """
+    按ID顺序获取需要降低存储类型的 COS 照片（用于存储类型分层任务）
+    标准存储：订单早于 ia_cutoff 或处于终态；低频存储：订单早于 archive_cutoff
+    :param after_id: 上一批最后一条记录的ID，从头开始时传空字符串
+    :param ia_cutoff: 转低频存储的订单创建时间界限
+    :param archive_cutoff: 转归档存储的订单创建时间界限，None 表示不归档
+    :param terminal_statuses: 订单终态列表
+    :param limit: 批大小
+    :return: [(photo_id, file_path, storage_class, 订单创建时间), ...]
+    """
+    try:
+        standard_due = and_(
+            BatteryUploadPhoto.storage_class == 'STANDARD',
+            or_(
+                BatteryUploadOrder.created_at < ia_cutoff,
+                BatteryUploadOrder.status.in_(list(terminal_statuses))
+            )
+        )
+        conditions = [standard_due]
+        if archive_cutoff is not None:
+            conditions.append(and_(
+                BatteryUploadPhoto.storage_class == 'STANDARD_IA',
+                BatteryUploadOrder.created_at < archive_cutoff
+            ))
+        query = db.session.query(
+            BatteryUploadPhoto.id, BatteryUploadPhoto.file_path,
+            BatteryUploadPhoto.storage_class, BatteryUploadOrder.created_at
+        ).join(
+            BatteryUploadOrder, BatteryUploadOrder.id == BatteryUploadPhoto.order_id
+        ).filter(
+            and_(
+                BatteryUploadPhoto.storage == 'cos',
+                or_(*conditions)
+            )
+        )
+        if after_id:
+            query = query.filter(BatteryUploadPhoto.id > after_id)
+        return query.order_by(BatteryUploadPhoto.id).limit(limit).all()
+    except OperationalError as e:
+        logger.error("get_photos_for_tiering errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return []
+
+
+def update_photo_storage_classes(updates):
+    """
+    批量更新照片的存储类型（每个目标存储类型一条 UPDATE 语句）
+    :param updates: [(photo_id, storage_class), ...]
+    :return: 实际更新的行数
+    """
+    if not updates:
+        return 0
+    ids_by_class = {}
+    for photo_id, storage_class in updates:
+        ids_by_class.setdefault(storage_class, []).append(photo_id)
+    try:
+        table = BatteryUploadPhoto.__table__
+        updated = 0
+        for storage_class, photo_ids in ids_by_class.items():
+            result = db.session.execute(
+                table.update().where(
+                    and_(table.c.id.in_(photo_ids), table.c.storage == 'cos')
+                ).values(storage_class=storage_class)
+            )
+            updated += result.rowcount
+        _save()
+        return updated
+    except OperationalError as e:
+        logger.error("update_photo_storage_classes errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("update_photo_storage_classes errorMsg= {}".format(e))
+        _rollback()
+        raise
+
 # ========== 业务类型和用户角色 ==========
 
 def get_business_type_by_id(business_type_id):
@@ -301,6 +800,7 @@ def get_business_type_by_id(business_type_id):
         return BusinessType.query.filter(BusinessType.id == business_type_id).first()
     except OperationalError as e:
         logger.error("get_business_type_by_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -314,6 +814,7 @@ def get_user_role_by_id(user_role_id):
         return UserRole.query.filter(UserRole.id == user_role_id).first()
     except OperationalError as e:
         logger.error("get_user_role_by_id errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -330,9 +831,11 @@ def query_counterbyid(counter_id):
         return Counters.query.filter(Counters.id == counter_id).first()
     except OperationalError as e:
         logger.error("query_counterbyid errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
     except Exception as e:
         logger.error("query_counterbyid errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -344,15 +847,17 @@ def insert_counter(counter):
     """
     try:
         db.session.add(counter)
-        db.session.commit()
+        _save()
         return True
     except OperationalError as e:
         logger.error("insert_counter errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
     except Exception as e:
         logger.error("insert_counter errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
 
 
@@ -363,15 +868,17 @@ def update_counterbyid(counter):
     :return: 是否成功
     """
     try:
-        db.session.commit()
+        _save()
         return True
     except OperationalError as e:
         logger.error("update_counterbyid errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
     except Exception as e:
         logger.error("update_counterbyid errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
 
 
@@ -386,15 +893,17 @@ def delete_counterbyid(counter_id):
         counter = Counters.query.filter(Counters.id == counter_id).first()
         if counter:
             db.session.delete(counter)
-            db.session.commit()
+            _save()
         return True
     except OperationalError as e:
         logger.error("delete_counterbyid errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
     except Exception as e:
         logger.error("delete_counterbyid errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        _raise_in_transaction()
         return False
 
 
@@ -410,9 +919,11 @@ def get_user_by_phone(phone):
         return User.query.filter(User.phone == phone).first()
     except OperationalError as e:
         logger.error("get_user_by_phone errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
     except Exception as e:
         logger.error("get_user_by_phone errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
 
 
@@ -425,87 +936,685 @@ def create_user(phone):
     try:
         user = User(phone=phone)
         db.session.add(user)
-        db.session.commit()
-        db.session.refresh(user)
+        _save(user)
         return user
     except OperationalError as e:
         logger.error("create_user errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("create_user errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
 
 
-def create_sms_code(phone, code, ip_address=None):
+def upsert_user_by_phone(phone):
+    """
+    按手机号获取或创建用户，返回用户ID（一条语句，并发注册同一手机号不会因唯一键冲突失败）
+    INSERT INTO users (phone, ...) VALUES (...) ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+    手机号已存在时 LAST_INSERT_ID(id) 让 lastrowid 返回已有用户的ID；非 MySQL 数据库退回先查后插
+    :param phone: 手机号
+    :return: 用户ID
+    """
+    try:
+        if db.session.get_bind().dialect.name != 'mysql':
+            user = get_user_by_phone(phone) or create_user(phone)
+            return user.id
+        now = datetime.utcnow()
+        users = User.__table__
+        stmt = mysql_insert(users).values(phone=phone, created_at=now, updated_at=now)
+        stmt = stmt.on_duplicate_key_update(id=db.func.LAST_INSERT_ID(users.c.id))
+        user_id = db.session.execute(stmt).lastrowid
+        _save()
+        return user_id
+    except OperationalError as e:
+        logger.error("upsert_user_by_phone errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("upsert_user_by_phone errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def create_sms_code(phone, code, ip_address=None, sent_at=None):
     """
     创建短信验证码记录
     :param phone: 手机号
     :param code: 验证码
     :param ip_address: IP地址
+    :param sent_at: 发送时间，默认为当前时间（异步写入审计日志时传入实际发送时间）
     :return: SmsCode 实体
     """
     try:
-        sms_code = SmsCode(phone=phone, code=code, ip_address=ip_address)
+        sms_code = SmsCode(phone=phone, code=code, ip_address=ip_address, sent_at=sent_at or datetime.utcnow())
         db.session.add(sms_code)
-        db.session.commit()
-        db.session.refresh(sms_code)
+        _save(sms_code)
         return sms_code
     except OperationalError as e:
         logger.error("create_sms_code errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
         raise
     except Exception as e:
         logger.error("create_sms_code errorMsg= {}".format(e))
-        db.session.rollback()
+        _rollback()
+        raise
+
+
+def _latest_sms_code_id(phone):
+    # 该手机号最后发送的验证码ID（重新获取后之前的验证码全部失效），套一层派生表，
+    # MySQL 才允许在 UPDATE sms_codes 的条件里查询 sms_codes 本身
+    table = SmsCode.__table__
+    latest = select([db.func.max(table.c.id).label('id')]).where(table.c.phone == phone).alias('t')
+    return select([latest.c.id]).scalar_subquery()
+
+
+def consume_sms_code(phone, code, ttl_seconds=300, max_attempts=5, used_at=None):
+    """
+    校验并核销验证码（只匹配该手机号最后发送的验证码；一条条件 UPDATE，并发请求只有一个能核销成功）
+    UPDATE sms_codes SET used_at=? WHERE id=(SELECT id FROM (SELECT MAX(id) AS id FROM sms_codes WHERE phone=?) t)
+        AND code=? AND used_at IS NULL AND sent_at>=? AND attempts<?
+    :param phone: 手机号
+    :param code: 验证码
+    :param ttl_seconds: 验证码有效期（秒）
+    :param max_attempts: 错误次数上限，达到后验证码作废
+    :param used_at: 使用时间，默认为当前时间
+    :return: 影响的行数（1 表示核销成功，0 表示验证码错误、不存在或已过期）
+    """
+    try:
+        now = datetime.utcnow()
+        table = SmsCode.__table__
+        statement = table.update().where(
+            and_(
+                table.c.id == _latest_sms_code_id(phone),
+                table.c.code == code,
+                table.c.used_at.is_(None),
+                table.c.sent_at >= now - timedelta(seconds=ttl_seconds),
+                table.c.attempts < max_attempts
+            )
+        ).values(used_at=used_at or now)
+        result = db.session.execute(statement)
+        _save()
+        return result.rowcount
+    except OperationalError as e:
+        logger.error("consume_sms_code errorMsg= {}".format(e))
+        _rollback()
         raise
 
 
-def get_latest_sms_code(phone):
+def record_sms_code_failure(phone, ttl_seconds=300, max_attempts=5):
     """
-    获取指定手机号最新的验证码（未使用且未过期）
+    验证码输入错误：该手机号最后发送的验证码错误次数加一
+    （条件 UPDATE 同 consume_sms_code 按派生表定位最后一条验证码并原子加一；
+    更新成功后再按主键读一次累加后的错误次数，共两条语句）
     :param phone: 手机号
-    :return: SmsCode 实体或 None
+    :param ttl_seconds: 验证码有效期（秒）
+    :param max_attempts: 错误次数上限
+    :return: 累加后的错误次数（0 表示没有有效的验证码）
     """
     try:
-        from datetime import datetime, timedelta
-        # 验证码有效期5分钟
-        expire_time = datetime.utcnow() - timedelta(minutes=5)
-        return SmsCode.query.filter(
+        table = SmsCode.__table__
+        statement = table.update().where(
             and_(
-                SmsCode.phone == phone,
-                SmsCode.used_at.is_(None),
-                SmsCode.sent_at >= expire_time
+                table.c.id == _latest_sms_code_id(phone),
+                table.c.used_at.is_(None),
+                table.c.sent_at >= datetime.utcnow() - timedelta(seconds=ttl_seconds),
+                table.c.attempts < max_attempts
             )
-        ).order_by(SmsCode.sent_at.desc()).first()
+        ).values(attempts=table.c.attempts + 1)
+        result = db.session.execute(statement)
+        _save()
+        if not result.rowcount:
+            return 0
+        return db.session.query(SmsCode.attempts).filter(
+            SmsCode.id == _latest_sms_code_id(phone)
+        ).scalar() or 0
+    except OperationalError as e:
+        logger.error("record_sms_code_failure errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def get_sms_code_id_range(before):
+    """
+    获取发送时间早于 before 的验证码ID范围（走 sent_at 索引）
+    :param before: 时间界限
+    :return: (最小ID, 最大ID)，没有记录时为 (None, None)
+    """
+    try:
+        row = db.session.query(db.func.min(SmsCode.id), db.func.max(SmsCode.id)).filter(
+            SmsCode.sent_at < before
+        ).one()
+        return row[0], row[1]
+    except OperationalError as e:
+        logger.error("get_sms_code_id_range errorMsg= {}".format(e))
+        raise
+
+
+def delete_sms_codes_in_id_range(start_id, end_id, before):
+    """
+    删除主键在 [start_id, end_id) 内且发送时间早于 before 的验证码（按主键范围删除，锁定范围小）
+    :param start_id: 起始ID（包含）
+    :param end_id: 结束ID（不包含）
+    :param before: 时间界限
+    :return: 删除的行数
+    """
+    try:
+        table = SmsCode.__table__
+        result = db.session.execute(table.delete().where(
+            and_(table.c.id >= start_id, table.c.id < end_id, table.c.sent_at < before)
+        ))
+        _save()
+        return result.rowcount
     except OperationalError as e:
-        logger.error("get_latest_sms_code errorMsg= {}".format(e))
+        logger.error("delete_sms_codes_in_id_range errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def count_sms_codes(before=None):
+    """
+    统计验证码记录数
+    :param before: 只统计发送时间早于该时间的记录，None 表示全部
+    :return: 记录数
+    """
+    try:
+        query = db.session.query(db.func.count(SmsCode.id))
+        if before is not None:
+            query = query.filter(SmsCode.sent_at < before)
+        return query.scalar() or 0
+    except OperationalError as e:
+        logger.error("count_sms_codes errorMsg= {}".format(e))
+        raise
+
+# ========== 后台任务检查点 ==========
+
+def get_job_checkpoint(job_name):
+    """
+    获取任务检查点
+    :param job_name: 任务名
+    :return: JobCheckpoint 实体或 None
+    """
+    try:
+        return JobCheckpoint.query.filter(JobCheckpoint.job_name == job_name).first()
+    except OperationalError as e:
+        logger.error("get_job_checkpoint errorMsg= {}".format(e))
+        _raise_in_transaction()
         return None
+
+
+def save_job_checkpoint(job_name, position, state=None):
+    """
+    保存任务检查点（不存在则创建）
+    :param job_name: 任务名
+    :param position: 已处理到的位置，任务完成时传 None
+    :param state: 附加状态字典
+    :return: JobCheckpoint 实体
+    """
+    try:
+        checkpoint = get_job_checkpoint(job_name)
+        if checkpoint is None:
+            checkpoint = JobCheckpoint(job_name=job_name)
+            db.session.add(checkpoint)
+        checkpoint.position = position
+        checkpoint.state = state
+        checkpoint.updated_at = datetime.utcnow()
+        _save()
+        return checkpoint
+    except OperationalError as e:
+        logger.error("save_job_checkpoint errorMsg= {}".format(e))
+        _rollback()
+        raise
     except Exception as e:
-        logger.error("get_latest_sms_code errorMsg= {}".format(e))
-        return None
+        logger.error("save_job_checkpoint errorMsg= {}".format(e))
+        _rollback()
+        raise
 
 
-def mark_sms_code_as_used(sms_code_id):
+def get_all_job_checkpoints():
     """
-    标记验证码为已使用
-    :param sms_code_id: 验证码ID
-    :return: 是否成功
+    获取所有任务检查点（用于监控任务进度和统计）
+    :return: JobCheckpoint 列表
     """
     try:
-        from datetime import datetime
-        sms_code = SmsCode.query.filter(SmsCode.id == sms_code_id).first()
-        if sms_code:
-            sms_code.used_at = datetime.utcnow()
-            db.session.commit()
-            return True
-        return False
+        return JobCheckpoint.query.order_by(JobCheckpoint.job_name).all()
     except OperationalError as e:
-        logger.error("mark_sms_code_as_used errorMsg= {}".format(e))
-        db.session.rollback()
+        logger.error("get_all_job_checkpoints errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return []
+
+
+# ========== 幂等键相关 ==========
+
+# 幂等键表 (scope, idempotency_key) 唯一索引名（MySQL 重复键错误信息中包含该名称）
+IDEMPOTENCY_KEY_UNIQUE_INDEX = 'uk_idempotency_keys_scope_key'
+
+
+def claim_idempotency_key(scope, idempotency_key, fingerprint, expires_at, locked_until):
+    """
+    登记一个处理中的幂等键（依靠唯一索引，并发的重复请求只有一个能登记成功）
+    :param scope: 接口名
+    :param idempotency_key: 客户端传入的 Idempotency-Key
+    :param fingerprint: 请求内容摘要
+    :param expires_at: 过期时间
+    :param locked_until: 处理租约到期时间
+    :return: 是否登记成功（False 表示该 Key 已存在）
+    """
+    try:
+        db.session.add(IdempotencyKey(
+            scope=scope, idempotency_key=idempotency_key, fingerprint=fingerprint,
+            status='processing', expires_at=expires_at, locked_until=locked_until
+        ))
+        _save()
+        return True
+    except IntegrityError as e:
+        _rollback()
+        # 只有 (scope, idempotency_key) 唯一索引冲突表示 Key 已存在，其他约束错误照常抛出
+        if IDEMPOTENCY_KEY_UNIQUE_INDEX not in str(e.orig):
+            logger.error("claim_idempotency_key errorMsg= {}".format(e))
+            raise
+        _raise_in_transaction()
         return False
+    except OperationalError as e:
+        logger.error("claim_idempotency_key errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def take_over_idempotency_key(scope, idempotency_key, fingerprint, expires_at, locked_until, now):
+    """
+    接管已过期、或处理租约已到期的幂等键（条件更新，并发的接管只有一个成功）
+    :param scope: 接口名
+    :param idempotency_key: 客户端传入的 Idempotency-Key
+    :param fingerprint: 请求内容摘要
+    :param expires_at: 新的过期时间
+    :param locked_until: 新的处理租约到期时间
+    :param now: 当前时间
+    :return: 是否接管成功
+    """
+    try:
+        table = IdempotencyKey.__table__
+        # 旧版本登记的记录没有 locked_until，按 登记时间（expires_at - IDEMPOTENCY_TTL_SECONDS）+ 租约时长 推算
+        legacy_lock_expired = and_(
+            table.c.locked_until.is_(None),
+            table.c.expires_at <= now + timedelta(
+                seconds=config.IDEMPOTENCY_TTL_SECONDS - config.IDEMPOTENCY_LOCK_SECONDS)
+        )
+        lock_expired = and_(
+            table.c.status == 'processing',
+            or_(table.c.locked_until <= now, legacy_lock_expired)
+        )
+        result = db.session.execute(table.update().where(and_(
+            table.c.scope == scope, table.c.idempotency_key == idempotency_key,
+            or_(table.c.expires_at <= now, lock_expired)
+        )).values(
+            fingerprint=fingerprint, status='processing', response_status=None, response_body=None,
+            expires_at=expires_at, locked_until=locked_until
+        ))
+        _save()
+        return result.rowcount > 0
+    except OperationalError as e:
+        logger.error("take_over_idempotency_key errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def get_idempotency_key(scope, idempotency_key):
+    """
+    查询幂等键
+    :param scope: 接口名
+    :param idempotency_key: 客户端传入的 Idempotency-Key
+    :return: IdempotencyKey 实体或 None
+    """
+    try:
+        return IdempotencyKey.query.filter(
+            IdempotencyKey.scope == scope, IdempotencyKey.idempotency_key == idempotency_key
+        ).first()
+    except OperationalError as e:
+        logger.error("get_idempotency_key errorMsg= {}".format(e))
+        _raise_in_transaction()
+        return None
+
+
+def _own_idempotency_key(table, scope, idempotency_key, locked_until):
+    # locked_until 同时作为登记凭证：租约到期被接管后，原请求不能再修改或删除该记录
+    return and_(
+        table.c.scope == scope, table.c.idempotency_key == idempotency_key,
+        table.c.status == 'processing', table.c.locked_until == locked_until
+    )
+
+
+def complete_idempotency_key(scope, idempotency_key, locked_until, response_status, response_body):
+    """
+    保存幂等键对应的响应
+    :param scope: 接口名
+    :param idempotency_key: 客户端传入的 Idempotency-Key
+    :param locked_until: 登记时的处理租约到期时间
+    :param response_status: 响应状态码
+    :param response_body: 响应内容
+    :return: 是否保存（False 表示租约已到期并被其他请求接管）
+    """
+    try:
+        table = IdempotencyKey.__table__
+        result = db.session.execute(table.update().where(
+            _own_idempotency_key(table, scope, idempotency_key, locked_until)
+        ).values(status='completed', response_status=response_status, response_body=response_body))
+        _save()
+        return result.rowcount > 0
+    except OperationalError as e:
+        logger.error("complete_idempotency_key errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def release_idempotency_key(scope, idempotency_key, locked_until):
+    """
+    删除处理失败的幂等键，客户端可以用同一个 Key 重试
+    :param scope: 接口名
+    :param idempotency_key: 客户端传入的 Idempotency-Key
+    :param locked_until: 登记时的处理租约到期时间
+    :return: 是否删除
+    """
+    try:
+        table = IdempotencyKey.__table__
+        result = db.session.execute(table.delete().where(
+            _own_idempotency_key(table, scope, idempotency_key, locked_until)
+        ))
+        _save()
+        return result.rowcount > 0
+    except OperationalError as e:
+        logger.error("release_idempotency_key errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def delete_expired_idempotency_keys(before, limit):
+    """
+    删除一批已过期的幂等键（先按 expires_at 索引取出一批主键，再按主键删除）
+    :param before: 过期时间界限
+    :param limit: 每批删除的最大行数
+    :return: 删除的行数
+    """
+    try:
+        ids = [row.id for row in db.session.query(IdempotencyKey.id).filter(
+            IdempotencyKey.expires_at < before
+        ).order_by(IdempotencyKey.expires_at).limit(limit)]
+        if not ids:
+            return 0
+        table = IdempotencyKey.__table__
+        result = db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        _save()
+        return result.rowcount
+    except OperationalError as e:
+        logger.error("delete_expired_idempotency_keys errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+# ========== 主键迁移（CHAR(36) -> BINARY(16)） ==========
+
+# 迁移期间（migrations/016 执行后、migrate-uuid-keys --swap 切换前）各表需要回填的二进制列，以及对应的原字符串列
+UUID_KEY_BACKFILL_COLUMNS = {
+    'battery_upload_orders': (('id_bin', 'id'),),
+    'battery_upload_photos': (('id_bin', 'id'), ('order_id_bin', 'order_id')),
+}
+
+
+def backfill_binary_uuid_keys(table_name, after_id, limit):
+    """
+    按主键顺序回填一批记录的二进制 UUID 列（UNHEX(REPLACE(id, '-', ''))），只改写尚未回填的行
+    :param table_name: 表名（UUID_KEY_BACKFILL_COLUMNS 中的表）
+    :param after_id: 上一批最后一条记录的ID（字符串），从头开始时传空字符串
+    :param limit: 批大小
+    :return: (本批最后一条记录的ID, 更新的行数)，没有更多记录时ID为 None
+    """
+    columns = UUID_KEY_BACKFILL_COLUMNS[table_name]
+    try:
+        last_id = db.session.execute(text(
+            "SELECT MAX(id) FROM (SELECT id FROM {} WHERE id > :after_id ORDER BY id LIMIT :limit) AS batch"
+            .format(table_name)
+        ), {'after_id': after_id, 'limit': limit}).scalar()
+        if last_id is None:
+            return None, 0
+        assignments = ', '.join("{} = UNHEX(REPLACE({}, '-', ''))".format(target, source) for target, source in columns)
+        pending = ' OR '.join('{} IS NULL'.format(target) for target, _ in columns)
+        result = db.session.execute(text(
+            "UPDATE {} SET {} WHERE id > :after_id AND id <= :last_id AND ({})".format(table_name, assignments, pending)
+        ), {'after_id': after_id, 'last_id': last_id})
+        _save()
+        return last_id, result.rowcount
+    except OperationalError as e:
+        logger.error("backfill_binary_uuid_keys errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def get_column_data_type(table_name, column_name):
+    """
+    查询当前数据库中列的类型（information_schema.COLUMNS.DATA_TYPE）
+    :param table_name: 表名
+    :param column_name: 列名
+    :return: 小写的类型名（如 char、binary），列不存在时返回 None
+    """
+    try:
+        data_type = db.session.execute(text(
+            "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND COLUMN_NAME = :column_name"
+        ), {'table_name': table_name, 'column_name': column_name}).scalar()
+        return data_type.lower() if data_type else None
+    except OperationalError as e:
+        logger.error("get_column_data_type errorMsg= {}".format(e))
+        raise
+
+
+def get_foreign_key_name(table_name, column_name):
+    """
+    查询列上的外键约束名
+    :param table_name: 表名
+    :param column_name: 列名
+    :return: 约束名，没有外键时返回 None
+    """
+    try:
+        return db.session.execute(text(
+            "SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND COLUMN_NAME = :column_name "
+            "AND REFERENCED_TABLE_NAME IS NOT NULL"
+        ), {'table_name': table_name, 'column_name': column_name}).scalar()
+    except OperationalError as e:
+        logger.error("get_foreign_key_name errorMsg= {}".format(e))
+        raise
+
+
+def execute_sql_statements(statements):
+    """
+    在同一个数据库连接上依次执行 SQL 语句（会话变量如 foreign_key_checks 在语句之间保持）
+    DDL 语句隐式提交，失败时已执行的语句不会回滚
+    :param statements: SQL 语句列表
+    """
+    with db.engine.connect() as connection:
+        for statement in statements:
+            logger.info("执行: %s", statement.splitlines()[0])
+            connection.exec_driver_sql(statement)
+
+
+def count_pending_binary_uuid_keys(table_name):
+    """
+    统计尚未回填二进制 UUID 列的记录数
+    :param table_name: 表名（UUID_KEY_BACKFILL_COLUMNS 中的表）
+    :return: 记录数
+    """
+    pending = ' OR '.join('{} IS NULL'.format(target) for target, _ in UUID_KEY_BACKFILL_COLUMNS[table_name])
+    try:
+        return db.session.execute(text(
+            "SELECT COUNT(*) FROM {} WHERE {}".format(table_name, pending)
+        )).scalar() or 0
+    except OperationalError as e:
+        logger.error("count_pending_binary_uuid_keys errorMsg= {}".format(e))
+        raise
+
+
+# ========== 订单归档 ==========
+
+def get_oldest_battery_order_created_at():
+    """
+    获取最早的订单创建时间
+    :return: datetime，没有订单时返回 None
+    """
+    try:
+        return db.session.query(db.func.min(BatteryUploadOrder.created_at)).scalar()
+    except OperationalError as e:
+        logger.error("get_oldest_battery_order_created_at errorMsg= {}".format(e))
+        raise
+
+
+def count_battery_orders_created_between(created_from, created_to):
+    """
+    统计创建时间在 [created_from, created_to) 内的订单数
+    :return: 订单数
+    """
+    try:
+        return db.session.query(db.func.count(BatteryUploadOrder.id)).filter(
+            BatteryUploadOrder.created_at >= created_from,
+            BatteryUploadOrder.created_at < created_to
+        ).scalar() or 0
+    except OperationalError as e:
+        logger.error("count_battery_orders_created_between errorMsg= {}".format(e))
+        raise
+
+
+def get_orders_for_archive(created_from, created_to, after_id, limit):
+    """
+    按ID顺序获取一批创建时间在 [created_from, created_to) 内的订单（用于归档）
+    :param after_id: 上一批最后一条记录的ID，从头开始时传空字符串
+    :param limit: 批大小
+    :return: BatteryUploadOrder 列表
+    """
+    try:
+        query = BatteryUploadOrder.query.filter(
+            BatteryUploadOrder.created_at >= created_from,
+            BatteryUploadOrder.created_at < created_to
+        )
+        if after_id:
+            query = query.filter(BatteryUploadOrder.id > after_id)
+        return query.order_by(BatteryUploadOrder.id).limit(limit).all()
+    except OperationalError as e:
+        logger.error("get_orders_for_archive errorMsg= {}".format(e))
+        raise
+
+
+def get_photos_by_order_ids(order_ids):
+    """
+    批量获取多个订单的照片（一条 IN 查询）
+    :param order_ids: 订单ID列表
+    :return: BatteryUploadPhoto 列表
+    """
+    if not order_ids:
+        return []
+    try:
+        return BatteryUploadPhoto.query.filter(
+            BatteryUploadPhoto.order_id.in_(list(order_ids))
+        ).order_by(BatteryUploadPhoto.order_id, BatteryUploadPhoto.upload_index).all()
+    except OperationalError as e:
+        logger.error("get_photos_by_order_ids errorMsg= {}".format(e))
+        raise
+
+
+def delete_archived_orders(archived, archive_name):
+    """
+    删除已写入归档文件的订单及其照片记录，照片文件登记到 archived_photo_files
+    需要在 transaction() 中调用：SELECT ... FOR UPDATE 锁定订单，
+    导出之后版本号变化或照片有增减的订单不删除（留待下次归档）
+    :param archived: {订单ID: (导出时的版本号, 导出的照片ID集合)}
+    :param archive_name: 归档文件名
+    :return: (已删除的订单ID列表, 跳过的订单ID列表)
+    """
+    if not archived:
+        return [], []
+    try:
+        order_ids = list(archived)
+        versions = {row.id: row.version for row in db.session.query(
+            BatteryUploadOrder.id, BatteryUploadOrder.version
+        ).filter(BatteryUploadOrder.id.in_(order_ids)).with_for_update().all()}
+        photos_by_order = {}
+        for photo in db.session.query(
+            BatteryUploadPhoto.id, BatteryUploadPhoto.order_id,
+            BatteryUploadPhoto.filename, BatteryUploadPhoto.file_path
+        ).filter(BatteryUploadPhoto.order_id.in_(order_ids)).all():
+            photos_by_order.setdefault(photo.order_id, []).append(photo)
+
+        deleted = [
+            order_id for order_id in order_ids
+            if versions.get(order_id) == archived[order_id][0]
+            and {photo.id for photo in photos_by_order.get(order_id, [])} == archived[order_id][1]
+        ]
+        deleted_set = set(deleted)
+        skipped = [order_id for order_id in order_ids if order_id not in deleted_set]
+        if deleted:
+            now = datetime.utcnow()
+            photo_files = [{
+                'photo_id': photo.id,
+                'filename': photo.filename,
+                'file_path': photo.file_path,
+                'archive_name': archive_name,
+                'archived_at': now,
+            } for order_id in deleted for photo in photos_by_order.get(order_id, [])]
+            if photo_files:
+                # 重复归档（上次删除失败后重试）时覆盖登记
+                db.session.execute(
+                    ArchivedPhotoFile.__table__.delete().where(
+                        ArchivedPhotoFile.__table__.c.photo_id.in_([item['photo_id'] for item in photo_files])
+                    )
+                )
+                db.session.execute(ArchivedPhotoFile.__table__.insert(), photo_files)
+            photo_table = BatteryUploadPhoto.__table__
+            db.session.execute(photo_table.delete().where(photo_table.c.order_id.in_(deleted)))
+            order_table = BatteryUploadOrder.__table__
+            db.session.execute(order_table.delete().where(order_table.c.id.in_(deleted)))
+            _save()
+        return deleted, skipped
+    except OperationalError as e:
+        logger.error("delete_archived_orders errorMsg= {}".format(e))
+        _rollback()
+        raise
     except Exception as e:
-        logger.error("mark_sms_code_as_used errorMsg= {}".format(e))
-        db.session.rollback()
-        return False
+        logger.error("delete_archived_orders errorMsg= {}".format(e))
+        _rollback()
+        raise
+
+
+def restore_archived_orders(orders, photos):
+    """
+    从归档恢复一批订单及其照片记录，已存在的订单（及其照片）保持不变
+    需要在 transaction() 中调用
+    :param orders: 订单字段字典列表
+    :param photos: 照片字段字典列表
+    :return: (恢复的订单数, 恢复的照片数)
+    """
+    if not orders:
+        return 0, 0
+    try:
+        order_ids = [order['id'] for order in orders]
+        existing = {row.id for row in db.session.query(BatteryUploadOrder.id).filter(
+            BatteryUploadOrder.id.in_(order_ids)
+        ).all()}
+        new_orders = [order for order in orders if order['id'] not in existing]
+        new_order_ids = {order['id'] for order in new_orders}
+        new_photos = [photo for photo in photos if photo['order_id'] in new_order_ids]
+        if new_orders:
+            db.session.execute(BatteryUploadOrder.__table__.insert(), new_orders)
+        if new_photos:
+            db.session.execute(BatteryUploadPhoto.__table__.insert(), new_photos)
+        if photos:
+            # 照片记录已回到照片表，不再需要登记
+            table = ArchivedPhotoFile.__table__
+            db.session.execute(table.delete().where(table.c.photo_id.in_([photo['id'] for photo in photos])))
+        _save()
+        return len(new_orders), len(new_photos)
+    except OperationalError as e:
+        logger.error("restore_archived_orders errorMsg= {}".format(e))
+        _rollback()
+        raise
+    except Exception as e:
+        logger.error("restore_archived_orders errorMsg= {}".format(e))
+        _rollback()
+        raise
@@ -0,0 +1,190 @@
+"""
+本地磁盘 LRU 缓存
+按总字节数限制容量，超出后淘汰最久未访问的文件；同一个 Key 的并发未命中只加载一次（其余请求等待结果）。
+启动时扫描缓存目录重建索引（按修改时间排序），容器重启后已缓存的文件仍可命中
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from wxcloudrun import metrics
+
+logger = logging.getLogger('log')
+
+# 加载中的临时文件后缀，启动时清理残留
+TEMP_SUFFIX = '.tmp'
+
+
+class _Flight:
+    """同一个 Key 的一次加载，其余并发请求等待 event"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.ok = False
+
+
+class DiskLRUCache:
+    """
+    磁盘 LRU 缓存（线程安全）
+    用法：
+        path = cache.get(key, loader)   # loader(tmp_path) 把内容写到 tmp_path，成功返回 True
+        if path is None:
+            return 加载失败
+        return send_file(path)
+    """
+
+    def __init__(self, name, directory, max_bytes, load_timeout=30.0):
+        """
+        :param name: 缓存名称（用于指标名）
+        :param directory: 缓存目录
+        :param max_bytes: 缓存总大小上限（字节）
+        :param load_timeout: 等待其他请求加载同一个 Key 的最长时间（秒）
+        """
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.load_timeout = load_timeout
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 文件名 -> 大小，按访问顺序排列（末尾最新）
+        self._total_bytes = 0
+        self._inflight = {}
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        metrics.register_gauge(name, self.snapshot)
+
+    def _load_index(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(TEMP_SUFFIX):
+                    self._remove_file(entry.path)
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, filename, size in sorted(files):
+            self._entries[filename] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+        logger.info("磁盘缓存 %s 已加载: %d 个文件, %d 字节", self.name, len(self._entries), self._total_bytes)
+
+    @staticmethod
+    def _filename(key):
+        # Key 可能包含 /，使用摘要作为文件名
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("删除缓存文件失败: %s, %s", path, str(e))
+
+    def _evict(self, keep=None):
+        # 调用方需持有锁；淘汰最久未访问的文件直到总大小不超过上限（不淘汰刚写入的 keep）
+        while self._total_bytes > self.max_bytes and self._entries:
+            filename, size = next(iter(self._entries.items()))
+            if filename == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(filename)
+                continue
+            del self._entries[filename]
+            self._total_bytes -= size
+            self._remove_file(os.path.join(self.directory, filename))
+            metrics.incr(f'{self.name}.evicted')
+
+    def _touch_entry(self, filename):
+        # 调用方需持有锁；标记为最近访问并返回文件路径
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            # 文件被外部删除，从索引中移除
+            self._total_bytes -= self._entries.pop(filename, 0)
+            return None
+        self._entries.move_to_end(filename)
+        return path
+
+    def get(self, key, loader):
+        """
+        获取缓存文件路径，未命中时调用 loader 加载
+        返回的文件可能在之后被淘汰，调用方应立即打开（已打开的文件不受淘汰影响）
+        :param key: 缓存 Key（如 COS Key）
+        :param loader: loader(tmp_path) -> bool，把内容写入 tmp_path
+        :return: 缓存文件路径，加载失败返回 None
+        """
+        filename = self._filename(key)
+        with self._lock:
+            if filename in self._entries:
+                path = self._touch_entry(filename)
+                if path is not None:
+                    self._hits += 1
+                    metrics.incr(f'{self.name}.hit')
+                    return path
+            self._misses += 1
+            metrics.incr(f'{self.name}.miss')
+            flight = self._inflight.get(filename)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[filename] = flight
+
+        if not leader:
+            # 合并并发未命中：等待正在进行的加载完成
+            metrics.incr(f'{self.name}.coalesced')
+            if not flight.event.wait(self.load_timeout) or not flight.ok:
+                return None
+            with self._lock:
+                return self._touch_entry(filename) if filename in self._entries else None
+
+        tmp_path = os.path.join(self.directory, '{}.{}{}'.format(filename, uuid.uuid4().hex, TEMP_SUFFIX))
+        try:
+            start = time.monotonic()
+            ok = False
+            try:
+                ok = bool(loader(tmp_path)) and os.path.isfile(tmp_path)
+            except Exception as e:
+                logger.error("磁盘缓存 %s 加载失败: %s, %s", self.name, key, str(e), exc_info=True)
+            metrics.observe(f'{self.name}.load', time.monotonic() - start)
+            if not ok:
+                if os.path.exists(tmp_path):
+                    self._remove_file(tmp_path)
+                return None
+
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                os.replace(tmp_path, os.path.join(self.directory, filename))
+                self._total_bytes += size - self._entries.pop(filename, 0)
+                self._entries[filename] = size
+                self._evict(keep=filename)
+                flight.ok = True
+                return self._touch_entry(filename)
+        finally:
+            with self._lock:
+                self._inflight.pop(filename, None)
+            flight.event.set()
+
+    def snapshot(self):
+        """
+        获取缓存状态（用于监控）
+        :return: 状态字典
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+                'loading': len(self._inflight),
+            }
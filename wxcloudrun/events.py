@@ -0,0 +1,56 @@
+"""
+进程内变更事件
+写操作提交后调用 emit 发布事件，订阅者同步执行；订阅者抛出的异常只记录日志，不影响请求。
+需要跨进程投递时（消息队列、Webhook 等）在启动时 subscribe 一个转发函数即可
+"""
+import logging
+import threading
+from wxcloudrun import metrics
+
+logger = logging.getLogger('log')
+
+# 订单状态变更：{'order_id', 'from_status', 'to_status', 'changed_at'}
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+_lock = threading.Lock()
+_subscribers = {}
+
+
+def subscribe(event_type, handler):
+    """
+    订阅事件
+    :param event_type: 事件类型
+    :param handler: handler(payload)
+    """
+    with _lock:
+        _subscribers.setdefault(event_type, []).append(handler)
+
+
+def unsubscribe(event_type, handler):
+    """
+    取消订阅
+    :param event_type: 事件类型
+    :param handler: 订阅时传入的函数
+    """
+    with _lock:
+        handlers = _subscribers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+
+def emit(event_type, payload):
+    """
+    发布事件（应在事务提交之后调用）
+    :param event_type: 事件类型
+    :param payload: 事件数据字典
+    """
+    metrics.incr(f'events.{event_type}')
+    logger.debug("事件 %s: %s", event_type, payload)
+    with _lock:
+        handlers = list(_subscribers.get(event_type, ()))
+    for handler in handlers:
+        try:
+            handler(payload)
+        except Exception as e:
+            metrics.incr('events.handler_error')
+            logger.error("事件处理失败: %s, %s", event_type, str(e), exc_info=True)
@@ -2,6 +2,8 @@ import logging
 import jwt
 from datetime import datetime, timedelta
 from flask import request
+from wxcloudrun import metrics
+from wxcloudrun.dao import get_all_job_checkpoints
 from wxcloudrun.response import make_succ_response, make_err_response
 
 logger = logging.getLogger('log')
@@ -37,6 +39,7 @@ def admin_login():
         payload = {
             'username': username,
             'role': 'admin',
+            'iat': datetime.utcnow(),
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         
@@ -60,3 +63,23 @@ def admin_login():
         logger.error("❌ 管理员登录失败: %s", str(e), exc_info=True)
         return make_err_response(f"登录失败: {str(e)}"), 500
 
+
+def get_metrics():
+    """
+    获取运行指标（熔断器状态、外部调用耗时等，管理员功能）
+    后台任务在独立进程中执行，其进度和统计从任务检查点表读取
+    """
+    try:
+        data = metrics.snapshot()
+        data['jobs'] = {
+            checkpoint.job_name: {
+                'position': checkpoint.position,
+                'state': checkpoint.state,
+                'updated_at': checkpoint.updated_at.isoformat() + 'Z' if checkpoint.updated_at else None,
+            }
+            for checkpoint in get_all_job_checkpoints()
+        }
+        return make_succ_response(data, "获取运行指标成功"), 200
+    except Exception as e:
+        logger.error("❌ 获取运行指标失败: %s", str(e), exc_info=True)
+        return make_err_response(f"获取运行指标失败: {str(e)}"), 500
@@ -7,10 +7,8 @@ import jwt
 from datetime import datetime, timedelta
 from flask import request
 from wxcloudrun import db
-from wxcloudrun.dao import (
-    get_user_by_phone, create_user, create_sms_code,
-    get_latest_sms_code, mark_sms_code_as_used
-)
+from wxcloudrun.dao import get_user_by_phone, create_user
+from wxcloudrun import sms_store
 from wxcloudrun.utils import validate_phone
 from wxcloudrun.response import make_succ_response, make_err_response
 
@@ -44,22 +42,17 @@ def send_sms_code():
         if not validate_phone(phone):
             return make_err_response("手机号格式不正确"), 400
         
-        # 检查发送频率（1分钟内不能重复发送）
-        latest_code = get_latest_sms_code(phone)
-        if latest_code:
-            time_diff = datetime.utcnow() - latest_code.sent_at
-            if time_diff.total_seconds() < 60:
-                remaining_seconds = 60 - int(time_diff.total_seconds())
-                return make_err_response(f"验证码发送过于频繁，请{remaining_seconds}秒后再试"), 429
+        # 发送频率由路由上的限流装饰器控制（同一手机号默认 1 分钟 1 次）
         
         # 生成验证码（Mock版本，固定返回123456）
         code = MOCK_SMS_CODE
         
-        # 获取客户端IP
-        ip_address = request.remote_addr or request.headers.get('X-Forwarded-For', '').split(',')[0]
+        # 获取客户端IP（与限流相同，只信任网关追加的 X-Forwarded-For 条目；middleware 导入了本模块，在函数内导入）
+        from wxcloudrun.middleware import get_client_ip
+        ip_address = get_client_ip()
         
-        # 保存验证码到数据库
-        create_sms_code(phone, code, ip_address)
+        # 保存验证码（有效期5分钟）
+        sms_store.save_code(phone, code, ip_address)
         
         logger.info("✅ 短信验证码发送成功: phone=%s, code=%s", phone, code)
         
@@ -98,20 +91,11 @@ def verify_sms_code():
         if not validate_phone(phone):
             return make_err_response("手机号格式不正确"), 400
         
-        # 获取最新的未使用验证码
-        sms_code_record = get_latest_sms_code(phone)
-        
-        if not sms_code_record:
-            return make_err_response("验证码不存在或已过期，请重新获取"), 400
-        
-        # 验证验证码
-        if sms_code_record.code != code:
-            logger.warning("⚠️ 验证码错误: phone=%s, input_code=%s, correct_code=%s", 
-                          phone, code, sms_code_record.code)
-            return make_err_response("验证码错误"), 400
-        
-        # 标记验证码为已使用
-        mark_sms_code_as_used(sms_code_record.id)
+        # 校验并核销验证码
+        result = sms_store.verify_and_consume(phone, code)
+        if result != sms_store.VERIFY_OK:
+            logger.warning("⚠️ 验证码校验失败: phone=%s, result=%s", phone, result)
+            return make_err_response(sms_store.VERIFY_ERROR_MESSAGES[result]), 400
         
         logger.info("✅ 短信验证码验证成功: phone=%s", phone)
         
@@ -149,18 +133,11 @@ def login_with_sms():
         if not validate_phone(phone):
             return make_err_response("手机号格式不正确"), 400
         
-        # 验证验证码
-        sms_code_record = get_latest_sms_code(phone)
-        
-        if not sms_code_record:
-            return make_err_response("验证码不存在或已过期，请重新获取"), 400
-        
-        if sms_code_record.code != code:
-            logger.warning("⚠️ 登录验证码错误: phone=%s", phone)
-            return make_err_response("验证码错误"), 400
-        
-        # 标记验证码为已使用
-        mark_sms_code_as_used(sms_code_record.id)
+        # 校验并核销验证码
+        result = sms_store.verify_and_consume(phone, code)
+        if result != sms_store.VERIFY_OK:
+            logger.warning("⚠️ 登录验证码校验失败: phone=%s, result=%s", phone, result)
+            return make_err_response(sms_store.VERIFY_ERROR_MESSAGES[result]), 400
         
         # 查找用户（不自动创建）
         user = get_user_by_phone(phone)
@@ -175,6 +152,7 @@ def login_with_sms():
             'user_id': str(user.id),
             'phone': user.phone,
             'role': 'user',
+            'iat': datetime.utcnow(),
             'exp': datetime.utcnow() + timedelta(days=7)  # token有效期7天
         }
         
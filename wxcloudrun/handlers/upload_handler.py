@@ -1,24 +1,58 @@
+import io
 import logging
 import os
+import re
 import uuid
 import json
-from datetime import datetime
-from flask import request, jsonify, send_from_directory
+import mimetypes
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from flask import request, jsonify, send_file, Response
 from werkzeug.utils import secure_filename
-from wxcloudrun import db
-from wxcloudrun.models import BatteryUploadPhoto
+from werkzeug.security import safe_join
+import config
 from wxcloudrun.dao import (
     get_user_registration_by_user_id, create_battery_upload_order,
     get_all_battery_upload_orders, get_battery_upload_order_by_id,
     create_battery_upload_photo, get_photos_by_order_id,
-    update_user_business_license_path, update_battery_upload_order
+    update_user_business_license_path, update_battery_upload_order,
+    list_battery_upload_photos, get_battery_upload_photo_by_id, transaction,
+    bulk_transition_battery_order_status, patch_battery_upload_order, get_battery_order_version
+)
+from wxcloudrun.utils import (
+    read_image_upload, get_mime_type, encode_cursor, decode_cursor, parse_page_limit, parse_utc_datetime,
+    generate_time_ordered_id, normalize_uuid
 )
-from wxcloudrun.utils import is_valid_image_type, get_mime_type
 from wxcloudrun.response import make_succ_response, make_err_response
-from wxcloudrun.cos_storage import upload_photo_to_cos, get_file_download_url, extract_cos_key_from_file_path
+from wxcloudrun.cos_storage import (
+    upload_photo_to_cos, get_file_download_url, get_photo_download_url, extract_cos_key_from_file_path,
+    download_file_from_cos, ensure_restored, ARCHIVE_STORAGE_CLASSES, RESTORE_STATUS_AVAILABLE
+)
+from wxcloudrun.disk_cache import DiskLRUCache
+from wxcloudrun.zip_stream import stream_zip
+from wxcloudrun import events
 
 logger = logging.getLogger('log')
 
+# 订单状态允许的变更：目标状态 -> 允许的当前状态
+ORDER_STATUS_TRANSITIONS = {
+    'processing': ('pending',),
+    'completed': ('processing',),
+    'cancelled': ('pending', 'processing'),
+}
+
+# 批量变更订单状态一次最多处理的订单数
+BULK_ORDER_STATUS_MAX_IDS = 200
+
+# uuid 命名的上传文件（照片、营业执照）写入后内容不会再变化，可长期缓存
+IMMUTABLE_FILENAME_REGEX = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.\w+$'
+)
+
 
 def upload_photos():
     """
@@ -52,9 +86,10 @@ def upload_photos():
                 if file and file.filename:
                     filename = file.filename
                     
-                    # 验证文件类型
-                    if not is_valid_image_type(filename):
-                        logger.warn("不支持的文件类型: %s", filename)
+                    # 按文件头校验图片类型并限制大小读取，超限或非图片时立即跳过
+                    file_data, image_type, error_msg = read_image_upload(file.stream, config.PHOTO_MAX_BYTES)
+                    if error_msg:
+                        logger.warn("跳过无效照片 %s: %s", filename, error_msg)
                         continue
                     
                     # 获取上传索引
@@ -64,133 +99,122 @@ def upload_photos():
                         upload_index = file_index
                         file_index += 1
                     
-                    # 读取文件数据
-                    file_data = file.read()
-                    
-                    # 验证文件大小 (限制为10MB)
-                    if len(file_data) > 10 * 1024 * 1024:
-                        logger.warn("文件过大: %d bytes", len(file_data))
-                        continue
-                    
-                    uploaded_files.append((filename, file_data, upload_index))
+                    uploaded_files.append((filename, file_data, image_type, upload_index))
         
         if not uploaded_files:
             return make_err_response("没有有效的照片文件"), 400
         
-        # 开始数据库事务
-        try:
-            # 创建电池上传订单
-            order_id = str(uuid.uuid4())
-            order_data = {
-                'id': order_id,
-                'user_id': user_id,
-                'store_name': user.store_name,
-                'contact_name': user.contact_name,
-                'contact_phone': user.contact_phone,
-                'contact_address': user.address,
-                'total_photos': len(uploaded_files),
-                'status': 'pending',
-            }
-            order = create_battery_upload_order(order_data)
+        # 先把照片写入存储（COS 或本地回退），网络 I/O 不占用数据库事务
+        order_id = generate_time_ordered_id()
+        # openid 为空字符串表示管理端上传，小程序端需要传入实际 openid
+        openid = request.form.get('openid', '')
+        stored_files = []
+        for original_filename, file_data, file_extension, upload_index in uploaded_files:
+            # 生成唯一文件名（扩展名取自文件头识别出的类型）
+            unique_filename = f"{uuid.uuid4()}.{file_extension}"
             
-            # 上传照片到微信云托管对象存储并插入数据库记录
-            photos = []
-            for original_filename, file_data, upload_index in uploaded_files:
-                # 生成唯一文件名
-                file_extension = os.path.splitext(original_filename)[1][1:] or 'jpg'
-                unique_filename = f"{uuid.uuid4()}.{file_extension}"
-                
-                # 上传到微信云托管对象存储
-                # openid 为空字符串表示管理端上传，小程序端需要传入实际 openid
-                openid = request.form.get('openid', '')
-                cos_key = upload_photo_to_cos(file_data, user_id, unique_filename, openid=openid)
-                
-                # 如果 COS 上传失败，回退到本地存储（用于本地开发环境）
-                if not cos_key:
-                    logger.warning("COS 上传失败，回退到本地存储: %s", original_filename)
-                    # 创建用户专用上传目录
-                    user_upload_dir = os.path.join('uploads', 'photos', user_id)
-                    os.makedirs(user_upload_dir, exist_ok=True)
-                    
-                    # 保存到本地
-                    local_file_path = os.path.join(user_upload_dir, unique_filename)
-                    with open(local_file_path, 'wb') as f:
-                        f.write(file_data)
-                    
-                    # 使用本地路径作为 file_path
-                    cos_key = local_file_path
-                    logger.info("文件已保存到本地: %s", local_file_path)
-                
-                # 获取MIME类型
-                mime_type = get_mime_type(file_extension)
-                
-                # 插入照片记录到数据库（file_path 存储 COS Key）
-                photo_data = {
-                    'id': str(uuid.uuid4()),
-                    'order_id': order_id,
-                    'user_id': user_id,
-                    'filename': unique_filename,
-                    'original_filename': original_filename,
-                    'file_path': cos_key,  # 存储 COS 文件路径（Key）
-                    'file_size': len(file_data),
-                    'mime_type': mime_type,
-                    'upload_index': upload_index,
-                }
-                photo = create_battery_upload_photo(photo_data)
-                
-                # 获取下载URL
-                # 如果是 COS Key（以 photos/ 开头且不是绝对路径），获取预签名URL
-                # 否则是本地文件路径，生成相对URL
-                if cos_key.startswith('photos/') and not os.path.isabs(cos_key):
-                    download_url = get_file_download_url(cos_key, expires=3600)
-                else:
-                    # 本地文件，生成相对URL
-                    rel_path = os.path.relpath(cos_key, 'uploads')
-                    download_url = f"/uploads/{rel_path}"
+            # 上传到微信云托管对象存储
+            cos_key = upload_photo_to_cos(file_data, user_id, unique_filename, openid=openid)
+            
+            # 如果 COS 上传失败，回退到本地存储（用于本地开发环境）
+            storage = 'cos'
+            if not cos_key:
+                logger.warning("COS 上传失败，回退到本地存储: %s", original_filename)
+                # 创建用户专用上传目录
+                user_upload_dir = os.path.join('uploads', 'photos', user_id)
+                os.makedirs(user_upload_dir, exist_ok=True)
                 
-                # 判断是 COS Key 还是本地路径
-                is_cos_key = cos_key.startswith('photos/') and not os.path.isabs(cos_key)
+                # 保存到本地
+                local_file_path = os.path.join(user_upload_dir, unique_filename)
+                with open(local_file_path, 'wb') as f:
+                    f.write(file_data)
                 
-                photos.append({
-                    'id': photo.id,
-                    'filename': photo.filename,
-                    'original_filename': photo.original_filename,
-                    'cos_key': cos_key if is_cos_key else None,  # COS 文件路径（Key），本地文件时为 None
-                    'file_path': photo.file_path,  # 存储路径（COS Key 或本地路径）
-                    'download_url': download_url,  # 预签名下载URL 或本地文件URL
-                    'file_size': photo.file_size,
-                    'mime_type': photo.mime_type,
-                    'upload_index': photo.upload_index,
-                    'created_at': photo.created_at.isoformat() + 'Z' if photo.created_at else None,
-                })
-                
-                if is_cos_key:
-                    logger.info("文件上传成功到 COS: %s, cos_key: %s", unique_filename, cos_key)
-                else:
-                    logger.info("文件保存到本地: %s, file_path: %s", unique_filename, cos_key)
+                # 使用本地路径作为 file_path
+                cos_key = local_file_path
+                storage = 'local'
+                logger.info("文件已保存到本地: %s", local_file_path)
             
-            logger.info("照片上传完成，共上传 %d 个文件，订单ID: %s", len(photos), order_id)
-            
-            # 构建响应
-            response_data = {
-                'order_id': order.id,
-                'user_id': order.user_id,
-                'store_name': order.store_name,
-                'contact_name': order.contact_name,
-                'contact_phone': order.contact_phone,
-                'contact_address': order.contact_address,
-                'status': order.status,
-                'total_photos': order.total_photos,
-                'photos': photos,
-                'created_at': order.created_at.isoformat() + 'Z' if order.created_at else None,
-            }
+            stored_files.append({
+                'id': generate_time_ordered_id(),
+                'order_id': order_id,
+                'user_id': user_id,
+                # 本地回退存储的照片补传到 COS 时需要用同一个 openid 生成文件元数据
+                'openid': openid or None,
+                'filename': unique_filename,
+                'original_filename': original_filename,
+                'file_path': cos_key,  # 存储 COS 文件路径（Key）或本地路径
+                'file_size': len(file_data),
+                'mime_type': get_mime_type(file_extension),
+                'upload_index': upload_index,
+                'storage': storage,
+            })
+        
+        # 订单与照片记录在同一事务中写入，只提交一次
+        order_data = {
+            'id': order_id,
+            'user_id': user_id,
+            'store_name': user.store_name,
+            'contact_name': user.contact_name,
+            'contact_phone': user.contact_phone,
+            'contact_address': user.address,
+            'total_photos': len(uploaded_files),
+            'status': 'pending',
+        }
+        with transaction():
+            order = create_battery_upload_order(order_data)
+            photo_records = [create_battery_upload_photo(photo_data) for photo_data in stored_files]
+        
+        photos = []
+        for photo in photo_records:
+            cos_key = photo.file_path
             
-            return make_succ_response(response_data), 200
+            # 获取下载URL
+            # COS 存储的照片获取预签名URL，本地回退存储的照片生成相对URL
+            is_cos_key = photo.storage == 'cos'
+            if is_cos_key:
+                download_url = get_file_download_url(cos_key, expires=3600)
+            else:
+                # 本地文件，生成相对URL
+                rel_path = os.path.relpath(cos_key, 'uploads')
+                download_url = f"/uploads/{rel_path}"
             
-        except Exception as e:
-            db.session.rollback()
-            raise e
+            photos.append({
+                'id': photo.id,
+                'filename': photo.filename,
+                'original_filename': photo.original_filename,
+                'cos_key': cos_key if is_cos_key else None,  # COS 文件路径（Key），本地文件时为 None
+                'file_path': photo.file_path,  # 存储路径（COS Key 或本地路径）
+                'download_url': download_url,  # 预签名下载URL 或本地文件URL
+                'file_size': photo.file_size,
+                'mime_type': photo.mime_type,
+                'upload_index': photo.upload_index,
+                'created_at': photo.created_at.isoformat() + 'Z' if photo.created_at else None,
+            })
             
+            if is_cos_key:
+                logger.info("文件上传成功到 COS: %s, cos_key: %s", photo.filename, cos_key)
+            else:
+                logger.info("文件保存到本地: %s, file_path: %s", photo.filename, cos_key)
+        
+        logger.info("照片上传完成，共上传 %d 个文件，订单ID: %s", len(photos), order_id)
+        
+        # 构建响应
+        response_data = {
+            'order_id': order.id,
+            'user_id': order.user_id,
+            'store_name': order.store_name,
+            'contact_name': order.contact_name,
+            'contact_phone': order.contact_phone,
+            'contact_address': order.contact_address,
+            'status': order.status,
+            'version': order.version,
+            'total_photos': order.total_photos,
+            'photos': photos,
+            'created_at': order.created_at.isoformat() + 'Z' if order.created_at else None,
+        }
+        
+        return make_succ_response(response_data), 200
+        
     except Exception as e:
         logger.error("❌ 照片上传失败: %s", str(e), exc_info=True)
         return make_err_response(f"照片上传失败: {str(e)}"), 500
@@ -219,25 +243,19 @@ def upload_business_license():
         filename = file.filename
         logger.info("处理营业执照上传: %s", filename)
         
-        # 验证文件类型
-        if not is_valid_image_type(filename):
-            logger.warn("不支持的文件类型: %s", filename)
-            return make_err_response("不支持的文件类型，请上传图片文件"), 400
-        
-        # 读取文件数据
-        file_data = file.read()
-        
-        # 验证文件大小 (限制为5MB)
-        if len(file_data) > 5 * 1024 * 1024:
-            logger.warn("文件过大: %d bytes", len(file_data))
-            return make_err_response("文件过大，请上传小于5MB的图片"), 400
+        # 按文件头校验图片类型并限制大小读取
+        file_data, file_extension, error_msg = read_image_upload(file.stream, config.BUSINESS_LICENSE_MAX_BYTES)
+        if error_msg:
+            logger.warn("营业执照校验失败 %s: %s", filename, error_msg)
+            return make_err_response("{}，请上传小于{}MB的图片文件".format(
+                error_msg, config.BUSINESS_LICENSE_MAX_BYTES // (1024 * 1024)
+            )), 400
         
         # 创建用户专用上传目录
         user_upload_dir = os.path.join('uploads', 'business_licenses', user_id)
         os.makedirs(user_upload_dir, exist_ok=True)
         
         # 生成唯一文件名
-        file_extension = os.path.splitext(filename)[1][1:] or 'jpg'
         unique_filename = f"business_license_{uuid.uuid4()}.{file_extension}"
         file_path = os.path.join(user_upload_dir, unique_filename)
         
@@ -269,42 +287,318 @@ def upload_business_license():
         return make_err_response(f"营业执照上传失败: {str(e)}"), 500
 
 
+def _parse_created_from():
+    """
+    解析列表接口的 created_from 参数，未指定时默认只查询最近 ORDER_QUERY_DEFAULT_DAYS 天，all 表示不限制
+    :return: 起始时间，None 表示不限制
+    :raises ValueError: 格式无效
+    """
+    value = request.args.get('created_from')
+    if value == 'all':
+        return None
+    if value:
+        return parse_utc_datetime(value)
+    if config.ORDER_QUERY_DEFAULT_DAYS > 0:
+        return datetime.utcnow() - timedelta(days=config.ORDER_QUERY_DEFAULT_DAYS)
+    return None
+
+
+def _set_created_from_header(response, created_from):
+    # 实际使用的查询起点（默认窗口时客户端据此提示并提供“加载更早”），不限制时为空
+    response.headers['X-Created-From'] = created_from.isoformat() + 'Z' if created_from else ''
+    return response
+
+
 def get_uploaded_photos():
     """
-    获取上传的照片列表
+    获取上传的照片列表（游标分页）
+    查询参数：
+    - user_id: 按用户筛选（可选）
+    - storage: 按存储位置筛选，cos 或 local（可选）
+    - created_from: 只返回该时间之后创建的照片，ISO 8601，默认最近 ORDER_QUERY_DEFAULT_DAYS 天，all 表示不限制（可选）
+    响应 data.created_from 和 X-Created-From 头为实际使用的起点
+    - cursor: 上一页返回的 next_cursor（可选）
+    - limit: 分页大小，默认 20，最大 100
     """
     try:
-        upload_dir = os.path.join('uploads', 'photos')
-        
-        if not os.path.exists(upload_dir):
-            return make_succ_response([]), 200
+        user_id = request.args.get('user_id') or None
+        storage = request.args.get('storage') or None
+        if storage and storage not in ('cos', 'local'):
+            return make_err_response("无效的 storage 参数，必须是 cos 或 local"), 400
+        try:
+            created_from = _parse_created_from()
+        except ValueError:
+            return make_err_response("无效的 created_from 参数，应为 ISO 8601 时间"), 400
+        
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = decode_cursor(request.args['cursor'])
+            if cursor is None:
+                return make_err_response("无效的分页游标"), 400
+        
+        limit = parse_page_limit(request.args.get('limit'))
+        photos, has_more = list_battery_upload_photos(
+            user_id=user_id, storage=storage, cursor=cursor, limit=limit, created_from=created_from
+        )
+        
+        items = []
+        for photo in photos:
+            # 本地回退存储的照片通过 /uploads/ 访问；COS 照片只返回存储路径，
+            # 由小程序端使用 wx.cloud.getTempFileURL 获取临时访问URL
+            url = None
+            if photo.storage == 'local':
+                url = f"/uploads/{os.path.relpath(photo.file_path, 'uploads')}"
+            items.append({
+                'id': photo.id,
+                'order_id': photo.order_id,
+                'user_id': photo.user_id,
+                'filename': photo.filename,
+                'file_path': photo.file_path,
+                'storage': photo.storage,
+                'url': url,
+                'size': photo.file_size,
+                'created_at': photo.created_at.isoformat() + 'Z' if photo.created_at else None,
+            })
         
-        files = []
-        for root, dirs, filenames in os.walk(upload_dir):
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                file_stat = os.stat(file_path)
-                
-                # 计算相对路径
-                rel_path = os.path.relpath(file_path, 'uploads')
-                
-                files.append({
-                    'filename': filename,
-                    'url': f"/uploads/{rel_path}",
-                    'size': file_stat.st_size,
-                    'created_at': datetime.fromtimestamp(file_stat.st_ctime).isoformat() + 'Z',
-                })
+        next_cursor = None
+        if has_more and photos:
+            next_cursor = encode_cursor(photos[-1].created_at, photos[-1].id)
         
-        return make_succ_response(files, "获取照片列表成功"), 200
+        response_data = {
+            'items': items,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'created_from': created_from.isoformat() + 'Z' if created_from else None,
+        }
+        return _set_created_from_header(make_succ_response(response_data, "获取照片列表成功"), created_from), 200
         
     except Exception as e:
         logger.error("❌ 获取照片列表失败: %s", str(e), exc_info=True)
         return make_err_response(f"获取照片列表失败: {str(e)}"), 500
 
 
+def serve_uploaded_file(filename):
+    """
+    提供本地上传文件的访问
+    - 默认由 Flask 发送，支持 Range（断点续传）、ETag / Last-Modified 条件请求
+    - UPLOADS_SENDFILE_MODE=x-accel 时只返回 X-Accel-Redirect 头，由 nginx 发送文件体并处理条件请求、Range
+    - UPLOADS_SENDFILE_MODE=x-sendfile 时由 Flask 返回 X-Sendfile 头
+    """
+    upload_dir = os.path.join(os.getcwd(), 'uploads')
+    file_path = safe_join(upload_dir, filename)
+    if file_path is None or not os.path.isfile(file_path):
+        return make_err_response("文件不存在"), 404
+    
+    immutable = bool(IMMUTABLE_FILENAME_REGEX.search(filename))
+    
+    if config.UPLOADS_SENDFILE_MODE == 'x-accel':
+        # 不设置 ETag / Last-Modified、不返回 304：nginx 的 internal location 发送同一个文件时
+        # 自行生成校验器并处理条件请求和 Range，客户端只会看到一套校验器
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = config.UPLOADS_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+    else:
+        file_stat = os.stat(file_path)
+        # 强校验器：修改时间 + 大小 + 路径摘要，文件被覆盖写入后一定变化
+        etag = "{}-{}-{}".format(
+            int(file_stat.st_mtime), file_stat.st_size,
+            zlib.adler32(filename.encode('utf-8')) & 0xffffffff
+        )
+        response = send_file(
+            file_path,
+            conditional=True,
+            etag=etag,
+            last_modified=file_stat.st_mtime,
+        )
+    
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = config.UPLOADS_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+_photo_cache = None
+_photo_cache_lock = threading.Lock()
+
+
+def get_photo_cache():
+    """
+    获取照片磁盘缓存（首次使用时创建）
+    :return: DiskLRUCache
+    """
+    global _photo_cache
+    if _photo_cache is None:
+        with _photo_cache_lock:
+            if _photo_cache is None:
+                _photo_cache = DiskLRUCache('photo_cache', config.PHOTO_CACHE_DIR, config.PHOTO_CACHE_MAX_BYTES)
+    return _photo_cache
+
+
+def _download_cos_photo(cos_key, storage_class, local_path):
+    """
+    从 COS 下载照片到本地路径，归档照片未取回时发起取回并返回失败
+    :return: 是否成功
+    """
+    if storage_class in ARCHIVE_STORAGE_CLASSES and ensure_restored(cos_key) != RESTORE_STATUS_AVAILABLE:
+        return False
+    return download_file_from_cos(cos_key, local_path)
+
+
+def get_photo_content(photo_id):
+    """
+    获取照片内容
+    COS 照片从本地磁盘 LRU 缓存返回，未命中时从 COS 下载到缓存（并发请求同一张照片只下载一次）；
+    本地回退存储的照片直接返回文件
+    """
+    if not config.PHOTO_CACHE_ENABLED:
+        return make_err_response("照片缓存未开启"), 404
+    
+    photo = get_battery_upload_photo_by_id(photo_id)
+    if photo is None:
+        return make_err_response("照片不存在"), 404
+    
+    cos_key = extract_cos_key_from_file_path(photo.file_path) if photo.storage == 'cos' else None
+    if cos_key:
+        file_path = get_photo_cache().get(
+            cos_key, lambda tmp_path: _download_cos_photo(cos_key, photo.storage_class, tmp_path)
+        )
+        if file_path is None:
+            if photo.storage_class in ARCHIVE_STORAGE_CLASSES:
+                response = make_err_response("照片正在从归档存储取回，请稍后再试")
+                response.headers['Retry-After'] = '60'
+                return response, 503
+            return make_err_response("获取照片失败"), 502
+    else:
+        upload_dir = os.path.join(os.getcwd(), 'uploads')
+        file_path = safe_join(upload_dir, os.path.relpath(photo.file_path, 'uploads'))
+        if file_path is None or not os.path.isfile(file_path):
+            return make_err_response("照片文件不存在"), 404
+    
+    # 照片内容不会变化，以照片ID作为 ETag；send_file 立即打开文件，之后被淘汰也不影响本次发送
+    try:
+        response = send_file(
+            file_path,
+            mimetype=photo.mime_type or 'application/octet-stream',
+            conditional=True,
+            etag=photo.id,
+            last_modified=photo.created_at,
+            max_age=config.PHOTO_CACHE_MAX_AGE,
+        )
+    except FileNotFoundError:
+        # 返回路径后、打开前恰好被淘汰
+        return make_err_response("照片暂时不可用，请重试"), 503
+    response.cache_control.private = True
+    response.cache_control.public = None
+    return response
+
+
+def _open_order_photo(item, tmp_dir):
+    """
+    打开订单照片用于打包（在预取线程中执行，不访问数据库）
+    COS 照片优先从照片缓存读取，否则下载到临时目录，打开后立即删除临时文件（文件句柄关闭前仍可读取）
+    :param item: 照片信息字典
+    :param tmp_dir: 临时目录
+    :return: 二进制文件对象，获取失败返回 None
+    """
+    try:
+        if item['cos_key']:
+            if config.PHOTO_CACHE_ENABLED:
+                path = get_photo_cache().get(
+                    item['cos_key'],
+                    lambda tmp_path: _download_cos_photo(item['cos_key'], item['storage_class'], tmp_path)
+                )
+                return open(path, 'rb') if path else None
+            tmp_path = os.path.join(tmp_dir, item['id'])
+            if not _download_cos_photo(item['cos_key'], item['storage_class'], tmp_path):
+                return None
+            f = open(tmp_path, 'rb')
+            os.remove(tmp_path)
+            return f
+        
+        upload_dir = os.path.join(os.getcwd(), 'uploads')
+        file_path = safe_join(upload_dir, os.path.relpath(item['file_path'], 'uploads'))
+        return open(file_path, 'rb') if file_path else None
+    except OSError as e:
+        logger.warning("打开订单照片失败: %s, %s", item['id'], str(e))
+        return None
+
+
+def _order_zip_entries(items):
+    """
+    逐张产出 ZIP 条目；写入当前照片的同时在后台线程预取下一张
+    无法获取的照片记录在 errors.txt 中
+    """
+    errors = []
+    with tempfile.TemporaryDirectory(prefix='order_zip_') as tmp_dir, \
+            ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_open_order_photo, items[0], tmp_dir) if items else None
+        try:
+            for index, item in enumerate(items):
+                source = future.result()
+                future = None
+                if index + 1 < len(items):
+                    future = executor.submit(_open_order_photo, items[index + 1], tmp_dir)
+                if source is None:
+                    errors.append(f"{item['filename']}\t{item['original_filename']}")
+                    continue
+                yield f"{index + 1:03d}_{item['filename']}", source, item['created_at']
+            
+            if errors:
+                content = "以下照片获取失败（归档照片可能正在取回，请稍后重新下载）:\n" + "\n".join(errors) + "\n"
+                yield 'errors.txt', io.BytesIO(content.encode('utf-8')), None
+        finally:
+            # 客户端中途断开时关闭已预取的文件
+            if future is not None:
+                source = future.result()
+                if source is not None:
+                    source.close()
+    if errors:
+        logger.warning("订单照片打包有 %d 张获取失败", len(errors))
+
+
+def download_order_photos_zip(order_id):
+    """
+    流式下载订单的所有照片（ZIP，条目不压缩）
+    边下载边打包输出，内存占用与照片数量无关
+    """
+    order = get_battery_upload_order_by_id(order_id)
+    if order is None:
+        return make_err_response("未找到指定的电池订单"), 404
+    
+    # 生成器在响应阶段执行，先把需要的字段取成普通字典
+    items = []
+    for photo in get_photos_by_order_id(order.id):
+        cos_key = extract_cos_key_from_file_path(photo.file_path) if photo.storage == 'cos' else None
+        items.append({
+            'id': photo.id,
+            'filename': photo.filename,
+            'original_filename': photo.original_filename,
+            'file_path': photo.file_path,
+            'cos_key': cos_key,
+            'storage_class': photo.storage_class,
+            'created_at': photo.created_at,
+        })
+    if not items:
+        return make_err_response("该订单没有照片"), 404
+    
+    logger.info("开始打包订单照片: %s, 共 %d 张", order.id, len(items))
+    response = Response(stream_zip(_order_zip_entries(items)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="order_{order.id}_photos.zip"'
+    # 关闭 nginx 响应缓冲，边打包边发送
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.cache_control.no_store = True
+    return response
+
 def get_all_battery_orders():
     """
     获取所有电池上传订单（管理员功能）
+    查询参数：
+    - created_from: 只返回该时间之后创建的订单，ISO 8601，默认最近 ORDER_QUERY_DEFAULT_DAYS 天，all 表示不限制（可选）
+    响应 X-Created-From 头为实际使用的起点（不限制时为空），管理后台据此提示并提供“加载更早的订单”
     """
     try:
         # ========== 请求日志 ==========
@@ -316,7 +610,13 @@ def get_all_battery_orders():
         logger.info("   request.args: %s", dict(request.args))
         logger.info("=" * 80)
         
-        orders = get_all_battery_upload_orders()
+        # 默认只查询最近的订单，更早的订单用 created_from 参数查询
+        try:
+            created_from = _parse_created_from()
+        except ValueError:
+            return make_err_response("无效的 created_from 参数，应为 ISO 8601 时间"), 400
+        
+        orders = get_all_battery_upload_orders(created_from=created_from)
         logger.info("📦 从数据库获取到 %d 个订单", len(orders))
         
         order_responses = []
@@ -347,6 +647,7 @@ def get_all_battery_orders():
                 'contact_phone': order.contact_phone,
                 'contact_address': order.contact_address,
                 'status': order.status,
+                'version': order.version,
                 'total_photos': order.total_photos,
                 'photos': photo_responses,
                 'created_at': order.created_at.isoformat() + 'Z' if order.created_at else None,
@@ -367,7 +668,9 @@ def get_all_battery_orders():
             logger.info("     订单 %d: order_id=%s, created_at=%s", i+1, order['order_id'], order['created_at'])
         logger.info("=" * 80)
         
-        return make_succ_response(order_responses, "获取电池上传订单成功"), 200
+        return _set_created_from_header(
+            make_succ_response(order_responses, "获取电池上传订单成功"), created_from
+        ), 200
         
     except Exception as e:
         logger.error("=" * 80)
@@ -422,13 +725,16 @@ def get_battery_order_detail(order_id):
         for index, photo in enumerate(photos):
             # 生成预签名下载URL（有效期1小时）
             download_url = None
+            restore_status = None
             if photo.file_path:
                 # 从 file_path 中提取 COS Key（支持 cloud:// 格式和 photos/ 格式）
                 cos_key = extract_cos_key_from_file_path(photo.file_path)
                 
                 if cos_key:
-                    # 成功提取 COS Key，生成预签名URL
-                    download_url = get_file_download_url(cos_key, expires=3600)
+                    # 成功提取 COS Key，生成预签名URL（归档照片取回完成前不生成）
+                    download_url, restore_status = get_photo_download_url(
+                        cos_key, storage_class=photo.storage_class, expires=3600
+                    )
                     logger.info("   照片 #%d 预签名URL: %s (从 %s 提取)", index + 1, download_url, photo.file_path)
                 else:
                     # 无法提取 COS Key，可能是本地文件，生成相对URL
@@ -444,6 +750,10 @@ def get_battery_order_detail(order_id):
                 'original_filename': photo.original_filename,
                 'file_path': photo.file_path,  # 云存储相对路径，如 'photos/user_id/timestamp.jpg'
                 'download_url': download_url,  # 预签名下载URL，前端应使用此字段
+                # 开启照片缓存时可通过 content_url 获取照片内容
+                'content_url': f"/api/photos/{photo.id}/content" if config.PHOTO_CACHE_ENABLED else None,
+                'storage_class': photo.storage_class,
+                'restore_status': restore_status,  # 归档照片：restoring-取回中，available-已取回；其他照片为 None
                 'file_size': photo.file_size,
                 'mime_type': photo.mime_type,
                 'upload_index': photo.upload_index,
@@ -470,6 +780,7 @@ def get_battery_order_detail(order_id):
             'contact_phone': order.contact_phone,
             'contact_address': order.contact_address,
             'status': order.status,
+            'version': order.version,
             'total_photos': order.total_photos,
             'photos': photo_responses,
             'order_type': order.order_type or 'photo_upload',
@@ -545,7 +856,7 @@ def create_battery_order():
             return make_err_response("用户不存在"), 404
         
         # 生成订单ID
-        order_id = str(uuid.uuid4())
+        order_id = generate_time_ordered_id()
         
         # 统计照片数量（从电池数据中提取云存储路径）
         photo_count = 0
@@ -568,75 +879,67 @@ def create_battery_order():
             'total_weight': str(data.get('total_weight', 0)) if data.get('total_weight') is not None else None,
         }
         
-        order = create_battery_upload_order(order_data)
-        
-        # 处理电池照片：保存云存储路径到数据库
-        photo_index = 0
-        logger.info("📸 开始处理电池照片，batteries 数量: %d", len(batteries))
-        
-        for battery in batteries:
-            image_url = battery.get('image_url')  # 可能是 fileID 或 cloudPath
-            file_id = battery.get('file_id')  # 完整的 fileID，格式：cloud://env.storageId/path
-            cloud_path = battery.get('cloud_path')  # 云存储相对路径
-            
-            # 优先使用 file_id，如果没有则使用 image_url
-            final_file_id = file_id or (image_url if image_url and image_url.startswith('cloud://') else None)
-            final_cloud_path = cloud_path or (image_url if image_url and not image_url.startswith('cloud://') else None)
+        # 订单与照片记录在同一事务中写入，只提交一次
+        with transaction():
+            order = create_battery_upload_order(order_data)
             
-            logger.info("📸 处理电池照片 #%d: image_url = %s, file_id = %s, cloud_path = %s", 
-                       photo_index, image_url, file_id, cloud_path)
+            # 处理电池照片：保存云存储路径到数据库
+            photo_index = 0
+            logger.info("📸 开始处理电池照片，batteries 数量: %d", len(batteries))
             
-            if final_file_id or final_cloud_path:
-                # 从路径中提取文件名
-                if final_file_id:
-                    # 从 fileID 中提取路径：cloud://env.storageId/path/to/file.jpg
-                    path_in_fileid = '/'.join(final_file_id.split('/')[2:]) if '/' in final_file_id else final_file_id
-                    path_parts = path_in_fileid.split('/')
-                else:
-                    # 从 cloudPath 中提取：photos/user_id/timestamp_index.jpg
-                    path_parts = final_cloud_path.split('/')
-                
-                filename = path_parts[-1] if path_parts else f"battery_{photo_index}.jpg"
-                original_filename = filename
+            for battery in batteries:
+                image_url = battery.get('image_url')  # 可能是 fileID 或 cloudPath
+                file_id = battery.get('file_id')  # 完整的 fileID，格式：cloud://env.storageId/path
+                cloud_path = battery.get('cloud_path')  # 云存储相对路径
                 
-                # 创建照片记录
-                # file_path 存储 fileID（如果存在）或 cloudPath
-                photo_data = {
-                    'id': str(uuid.uuid4()),
-                    'order_id': order_id,
-                    'user_id': user_id,
-                    'filename': filename,
-                    'original_filename': original_filename,
-                    'file_path': final_file_id or final_cloud_path,  # 优先存储 fileID，如果没有则存储 cloudPath
-                    'file_size': 0,  # 云存储路径不包含文件大小信息
-                    'mime_type': get_mime_type(filename.split('.')[-1] if '.' in filename else 'jpg'),
-                    'upload_index': photo_index,
-                }
+                # 优先使用 file_id，如果没有则使用 image_url
+                final_file_id = file_id or (image_url if image_url and image_url.startswith('cloud://') else None)
+                final_cloud_path = cloud_path or (image_url if image_url and not image_url.startswith('cloud://') else None)
                 
-                logger.info("📸 准备插入照片记录: %s", json.dumps(photo_data, indent=2, ensure_ascii=False, default=str))
+                logger.info("📸 处理电池照片 #%d: image_url = %s, file_id = %s, cloud_path = %s", 
+                           photo_index, image_url, file_id, cloud_path)
                 
-                try:
-                    # 直接使用 SQLAlchemy 创建照片记录，避免单独 commit
-                    photo = BatteryUploadPhoto(**photo_data)
-                    db.session.add(photo)
+                if final_file_id or final_cloud_path:
+                    # 从路径中提取文件名
+                    if final_file_id:
+                        # 从 fileID 中提取路径：cloud://env.storageId/path/to/file.jpg
+                        path_in_fileid = '/'.join(final_file_id.split('/')[2:]) if '/' in final_file_id else final_file_id
+                        path_parts = path_in_fileid.split('/')
+                    else:
+                        # 从 cloudPath 中提取：photos/user_id/timestamp_index.jpg
+                        path_parts = final_cloud_path.split('/')
+                    
+                    filename = path_parts[-1] if path_parts else f"battery_{photo_index}.jpg"
+                    original_filename = filename
+                    
+                    # 创建照片记录
+                    # file_path 存储 fileID（如果存在）或 cloudPath
+                    photo_data = {
+                        'id': generate_time_ordered_id(),
+                        'order_id': order_id,
+                        'user_id': user_id,
+                        'filename': filename,
+                        'original_filename': original_filename,
+                        'file_path': final_file_id or final_cloud_path,  # 优先存储 fileID，如果没有则存储 cloudPath
+                        'file_size': 0,  # 云存储路径不包含文件大小信息
+                        'mime_type': get_mime_type(filename.split('.')[-1] if '.' in filename else 'jpg'),
+                        'upload_index': photo_index,
+                    }
+                    
+                    logger.info("📸 准备插入照片记录: %s", json.dumps(photo_data, indent=2, ensure_ascii=False, default=str))
+                    
+                    # 事务作用域内只 flush，不单独 commit
+                    create_battery_upload_photo(photo_data)
                     photo_count += 1
                     photo_index += 1
-                    logger.info("✅ 照片记录已添加到 session: %s (order_id: %s)", image_url, order_id)
-                except Exception as e:
-                    logger.error("❌ 添加照片记录失败: %s", str(e), exc_info=True)
-                    # 继续处理其他照片，不中断订单创建
-            else:
-                logger.warn("⚠️ 电池 #%d 没有 image_url 字段", photo_index)
+                    logger.info("✅ 照片记录已添加到事务: %s (order_id: %s)", image_url, order_id)
+                else:
+                    logger.warn("⚠️ 电池 #%d 没有 image_url 字段", photo_index)
+            
+            # 更新订单照片数量，退出事务作用域时统一提交（包括照片记录）
+            order.total_photos = photo_count
         
-        # 更新订单照片数量并提交所有更改（包括照片记录）
-        order.total_photos = photo_count
-        try:
-            db.session.commit()
-            logger.info("✅ 数据库事务提交成功，订单照片数量: %d", photo_count)
-        except Exception as e:
-            logger.error("❌ 数据库事务提交失败: %s", str(e), exc_info=True)
-            db.session.rollback()
-            raise
+        logger.info("✅ 数据库事务提交成功，订单照片数量: %d", photo_count)
         
         logger.info("✅ 成功创建电池订单: %s, 包含 %d 张照片", order_id, photo_count)
         
@@ -664,6 +967,7 @@ def create_battery_order():
             'total_weight': order.total_weight,
             'pickup_date': order.pickup_date.isoformat() + 'Z' if order.pickup_date else None,
             'status': order.status,
+            'version': order.version,
             'total_photos': photo_count,
             'created_at': order.created_at.isoformat() + 'Z' if order.created_at else None,
         }
@@ -748,11 +1052,20 @@ def update_battery_order(order_id):
             update_data['order_type'] = data['order_type']
         
         # 执行更新
+        previous_status = order.status
         updated_order = update_battery_upload_order(order_id, update_data)
         
         if updated_order is None:
             return make_err_response("更新订单失败"), 500
         
+        if updated_order.status != previous_status:
+            events.emit(events.ORDER_STATUS_CHANGED, {
+                'order_id': updated_order.id,
+                'from_status': previous_status,
+                'to_status': updated_order.status,
+                'changed_at': updated_order.updated_at,
+            })
+        
         # 构建响应数据
         response_data = {
             'order_id': updated_order.id,
@@ -762,6 +1075,7 @@ def update_battery_order(order_id):
             'contact_phone': updated_order.contact_phone,
             'contact_address': updated_order.contact_address,
             'status': updated_order.status,
+            'version': updated_order.version,
             'total_photos': updated_order.total_photos,
             'order_type': updated_order.order_type or 'photo_upload',
             'batteries': updated_order.batteries if updated_order.batteries else [],
@@ -793,3 +1107,192 @@ def update_battery_order(order_id):
         logger.error("❌ 更新电池订单失败: %s", str(e), exc_info=True)
         return make_err_response(f"更新电池订单失败: {str(e)}"), 500
 
+
+def bulk_update_battery_order_status():
+    """
+    批量变更订单状态
+    请求体：{"order_ids": [...], "status": "completed"}
+    只允许 ORDER_STATUS_TRANSITIONS 中的状态变更（pending→processing/cancelled，processing→completed/cancelled），
+    所有订单在一个事务中用一条 UPDATE 变更，提交后每个变更的订单发布一个 order.status_changed 事件。
+    返回每个订单的处理结果：updated、invalid_transition（附当前状态）或 not_found
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return make_err_response("请求数据不能为空"), 400
+        
+        to_status = data.get('status')
+        order_ids = data.get('order_ids')
+        if to_status not in ORDER_STATUS_TRANSITIONS:
+            return make_err_response(
+                "无效的目标状态，必须是 {}".format('、'.join(ORDER_STATUS_TRANSITIONS))
+            ), 400
+        if not isinstance(order_ids, list) or not order_ids:
+            return make_err_response("order_ids 必须是非空数组"), 400
+        if not all(isinstance(order_id, str) and order_id for order_id in order_ids):
+            return make_err_response("order_ids 中的每一项必须是非空字符串"), 400
+        
+        # 统一为标准格式后去重，保持请求中的顺序（不是合法 UUID 的ID原样保留，结果为 not_found）
+        order_ids = list(dict.fromkeys(normalize_uuid(order_id) or order_id for order_id in order_ids))
+        if len(order_ids) > BULK_ORDER_STATUS_MAX_IDS:
+            return make_err_response(f"一次最多处理 {BULK_ORDER_STATUS_MAX_IDS} 个订单"), 400
+        
+        allowed_from = ORDER_STATUS_TRANSITIONS[to_status]
+        with transaction():
+            changed, unchanged, changed_at = bulk_transition_battery_order_status(
+                order_ids, to_status, allowed_from
+            )
+        
+        results = []
+        for order_id in order_ids:
+            if order_id in changed:
+                previous_status, version = changed[order_id]
+                results.append({
+                    'order_id': order_id,
+                    'result': 'updated',
+                    'previous_status': previous_status,
+                    'status': to_status,
+                    'version': version,
+                    'updated_at': changed_at.isoformat() + 'Z',
+                })
+                events.emit(events.ORDER_STATUS_CHANGED, {
+                    'order_id': order_id,
+                    'from_status': previous_status,
+                    'to_status': to_status,
+                    'changed_at': changed_at,
+                })
+            elif order_id in unchanged:
+                results.append({'order_id': order_id, 'result': 'invalid_transition', 'status': unchanged[order_id]})
+            else:
+                results.append({'order_id': order_id, 'result': 'not_found'})
+        
+        logger.info("✅ 批量变更订单状态: status=%s, 变更 %d 个, 不允许变更 %d 个, 未找到 %d 个",
+                    to_status, len(changed), len(unchanged), len(order_ids) - len(changed) - len(unchanged))
+        
+        response_data = {
+            'status': to_status,
+            'updated_count': len(changed),
+            'results': results,
+        }
+        return make_succ_response(response_data, "批量变更订单状态成功"), 200
+        
+    except Exception as e:
+        logger.error("❌ 批量变更订单状态失败: %s", str(e), exc_info=True)
+        return make_err_response(f"批量变更订单状态失败: {str(e)}"), 500
+
+
+def _parse_order_patch_fields(data):
+    """
+    解析订单可编辑的字段（只包含请求中出现的字段）
+    :param data: 请求体
+    :return: (字段字典, 错误信息)
+    """
+    fields = {}
+    if 'status' in data:
+        # 只能变更为 ORDER_STATUS_TRANSITIONS 中的目标状态，当前状态在更新时校验
+        if data['status'] not in ORDER_STATUS_TRANSITIONS:
+            return None, "无效的目标状态，必须是 {}".format('、'.join(ORDER_STATUS_TRANSITIONS))
+        fields['status'] = data['status']
+    if 'pickup_date' in data:
+        try:
+            fields['pickup_date'] = parse_utc_datetime(data['pickup_date'])
+        except (ValueError, AttributeError):
+            return None, "提货日期格式错误，请使用 ISO 8601 格式"
+    for key in ('total_price', 'total_weight'):
+        if key in data:
+            fields[key] = str(data[key]) if data[key] is not None else None
+    if 'batteries' in data:
+        if data['batteries'] is not None and not isinstance(data['batteries'], list):
+            return None, "batteries 必须是数组"
+        fields['batteries'] = data['batteries']
+    if 'order_type' in data:
+        if not data['order_type']:
+            return None, "order_type 不能为空"
+        fields['order_type'] = data['order_type']
+    return fields, None
+
+
+def _parse_expected_version(data):
+    # 客户端读取到的版本号：请求体 version 或 If-Match 头（ETag 格式 "3" 也可以）
+    value = data.get('version')
+    if value is None:
+        value = (request.headers.get('If-Match') or '').strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        value = value.strip('"') or None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def patch_battery_order(order_id):
+    """
+    按版本号部分更新订单（乐观锁）
+    请求体只包含要修改的字段和读取订单时拿到的 version（也可以通过 If-Match 头传入），
+    用一条 UPDATE ... WHERE id = ? AND version = ? 完成；版本号不匹配返回 409 和当前版本号，
+    成功时返回新版本号（不再查询订单）。
+    修改状态时按 ORDER_STATUS_TRANSITIONS 校验：锁定并读取原状态后 UPDATE 再加上 status IN (允许的当前状态)，
+    不允许的变更返回 409 和当前状态
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return make_err_response("请求数据不能为空"), 400
+        
+        expected_version = _parse_expected_version(data)
+        if expected_version is None:
+            return make_err_response("缺少 version（请求体 version 或 If-Match 头）"), 428
+        
+        fields, error = _parse_order_patch_fields(data)
+        if error:
+            return make_err_response(error), 400
+        if not fields:
+            return make_err_response("没有需要更新的字段"), 400
+        
+        to_status = fields.get('status')
+        allowed_from = ORDER_STATUS_TRANSITIONS[to_status] if to_status else None
+        with transaction():
+            version, updated_at, previous_status = patch_battery_upload_order(
+                order_id, expected_version, fields, allowed_from
+            )
+        
+        if version is None and previous_status is not None:
+            logger.info("订单状态不允许变更: order_id=%s, %s -> %s", order_id, previous_status, to_status)
+            response = make_err_response(
+                "订单当前状态为 {}，不能变更为 {}".format(previous_status, to_status), 409
+            )
+            response.headers['ETag'] = '"{}"'.format(expected_version)
+            return response, 409
+        
+        if version is None:
+            current_version = get_battery_order_version(order_id)
+            if current_version is None:
+                return make_err_response("未找到指定的电池订单"), 404
+            logger.info("订单版本冲突: order_id=%s, version=%s, 当前 version=%s",
+                        order_id, expected_version, current_version)
+            response = make_err_response("订单已被其他人修改，请刷新后重试", 409)
+            response.headers['ETag'] = '"{}"'.format(current_version)
+            return response, 409
+        
+        if to_status and previous_status != to_status:
+            events.emit(events.ORDER_STATUS_CHANGED, {
+                'order_id': order_id,
+                'from_status': previous_status,
+                'to_status': to_status,
+                'changed_at': updated_at,
+            })
+        
+        response_data = {
+            'order_id': order_id,
+            'version': version,
+            'updated_at': updated_at.isoformat() + 'Z',
+            'updated_fields': sorted(fields),
+        }
+        response = make_succ_response(response_data, "订单更新成功")
+        response.headers['ETag'] = '"{}"'.format(version)
+        return response, 200
+        
+    except Exception as e:
+        logger.error("❌ 更新电池订单失败: %s", str(e), exc_info=True)
+        return make_err_response(f"更新电池订单失败: {str(e)}"), 500
@@ -1,21 +1,31 @@
 import logging
 from datetime import datetime
 from flask import request, jsonify
+import config
 from wxcloudrun import db
 from wxcloudrun.dao import (
     create_user_registration, get_latest_user_registration,
-    get_all_user_registrations, update_user_registration_status,
+    list_user_registrations, count_user_registrations, update_user_registration_status,
+    bulk_update_user_registration_status,
     get_user_registration_by_user_id, get_user_registration_by_phone,
-    get_latest_sms_code, mark_sms_code_as_used,
-    get_user_by_phone, create_user
+    upsert_user_by_phone, transaction, user_profile_cache
 )
+from wxcloudrun import sms_store
+from wxcloudrun.ttl_cache import MISSING
 from wxcloudrun.utils import (
-    generate_user_id, generate_registration_id, validate_user_registration_data
+    generate_user_id, generate_registration_id, validate_user_registration_data,
+    encode_cursor, decode_cursor, parse_page_limit, parse_utc_datetime
 )
 from wxcloudrun.response import make_succ_response, make_err_response
 
 logger = logging.getLogger('log')
 
+# 注册记录状态
+REGISTRATION_STATUSES = ('pending', 'approved', 'rejected')
+
+# 批量审核一次最多处理的注册记录数
+BULK_REVIEW_MAX_IDS = 500
+
 
 def register_user():
     """
@@ -44,42 +54,8 @@ def register_user():
             logger.error("❌ 缺少短信验证码")
             return make_err_response("请先获取并输入短信验证码"), 400
         
-        # 获取最新的未使用验证码
-        sms_code_record = get_latest_sms_code(phone)
-        
-        if not sms_code_record:
-            logger.error("❌ 验证码不存在或已过期: phone=%s", phone)
-            return make_err_response("验证码不存在或已过期，请重新获取"), 400
-        
-        # 验证验证码
-        if sms_code_record.code != sms_code:
-            logger.warning("⚠️ 注册验证码错误: phone=%s, input_code=%s", phone, sms_code)
-            return make_err_response("验证码错误"), 400
-        
-        # 标记验证码为已使用
-        mark_sms_code_as_used(sms_code_record.id)
-        logger.info("✅ 短信验证码验证通过: phone=%s", phone)
-        
         logger.info("✅ 数据验证通过，开始处理注册")
         
-        # 检查用户是否已存在，如果不存在则创建
-        existing_user = get_user_by_phone(phone)
-        
-        if existing_user:
-            # 用户已存在，使用现有的 user_id
-            user_id = str(existing_user.id)
-            logger.info("📋 用户已存在，使用现有 user_id: %s", user_id)
-        else:
-            # 创建新用户
-            logger.info("📋 创建新用户: phone=%s", phone)
-            new_user = create_user(phone)
-            user_id = str(new_user.id)
-            logger.info("✅ 新用户创建成功: user_id=%s", user_id)
-        
-        # 生成唯一ID
-        registration_id = generate_registration_id()
-        logger.info("🆔 生成ID: user_id=%s, registration_id=%s", user_id, registration_id)
-        
         # 解析提交时间
         submit_time = datetime.utcnow()
         if 'submit_time' in data:
@@ -88,25 +64,42 @@ def register_user():
             except:
                 pass
         
-        # 构建注册数据
-        registration_data = {
-            'registration_id': registration_id,
-            'user_id': user_id,
-            'business_type_id': data['business_type_id'],
-            'business_type_name': data['business_type'],
-            'user_role_id': data['user_role_id'],
-            'user_role_name': data['user_role'],
-            'store_name': user_info['store_name'],
-            'contact_name': user_info['contact_name'],
-            'contact_phone': user_info['contact_phone'],
-            'address': user_info['address'],
-            'business_license_path': user_info.get('business_license'),
-            'status': 'pending',
-            'submit_time': submit_time,
-        }
+        # 生成唯一ID
+        registration_id = generate_registration_id()
         
         logger.info("💾 开始数据库操作...")
-        registration = create_user_registration(registration_data)
+        # 核销验证码、创建用户和注册记录在同一事务中完成，只提交一次。
+        # 只有 mysql 验证码存储（默认）的核销 UPDATE 加入该事务，注册失败时验证码不会被消耗；
+        # redis / memory 存储的核销不在事务中，注册失败时验证码已经作废，用户需要重新获取
+        with transaction():
+            result = sms_store.verify_and_consume(phone, sms_code)
+            if result != sms_store.VERIFY_OK:
+                logger.warning("⚠️ 注册验证码校验失败: phone=%s, result=%s", phone, result)
+                return make_err_response(sms_store.VERIFY_ERROR_MESSAGES[result]), 400
+            
+            # 获取或创建用户（INSERT ... ON DUPLICATE KEY，并发注册同一手机号不会冲突）
+            user_id = str(upsert_user_by_phone(phone))
+            
+            logger.info("🆔 生成ID: user_id=%s, registration_id=%s", user_id, registration_id)
+            
+            # 构建注册数据
+            registration_data = {
+                'registration_id': registration_id,
+                'user_id': user_id,
+                'business_type_id': data['business_type_id'],
+                'business_type_name': data['business_type'],
+                'user_role_id': data['user_role_id'],
+                'user_role_name': data['user_role'],
+                'store_name': user_info['store_name'],
+                'contact_name': user_info['contact_name'],
+                'contact_phone': user_info['contact_phone'],
+                'address': user_info['address'],
+                'business_license_path': user_info.get('business_license'),
+                'status': 'pending',
+                'submit_time': submit_time,
+            }
+            
+            registration = create_user_registration(registration_data)
         
         logger.info("✅ 数据库操作成功: user_id=%s, registration_id=%s", user_id, registration_id)
         
@@ -127,6 +120,29 @@ def register_user():
         return make_err_response(f"注册失败: {str(e)}"), 500
 
 
+def _serialize_registration(registration):
+    # 个人信息接口的响应数据
+    return {
+        'user_id': registration.user_id,
+        'registration_id': registration.registration_id,
+        'business_type_id': registration.business_type_id,
+        'business_type_name': registration.business_type_name,
+        'user_role_id': registration.user_role_id,
+        'user_role_name': registration.user_role_name,
+        'store_name': registration.store_name,
+        'contact_name': registration.contact_name,
+        'contact_phone': registration.contact_phone,
+        'address': registration.address,
+        'business_license_path': registration.business_license_path,
+        'status': registration.status,
+        'submit_time': registration.submit_time.isoformat() + 'Z' if registration.submit_time else None,
+        'review_time': registration.review_time.isoformat() + 'Z' if registration.review_time else None,
+        'review_comment': registration.review_comment,
+        'created_at': registration.created_at.isoformat() + 'Z' if registration.created_at else None,
+        'updated_at': registration.updated_at.isoformat() + 'Z' if registration.updated_at else None,
+    }
+
+
 def get_user_profile():
     """
     获取用户个人信息处理器
@@ -146,37 +162,20 @@ def get_user_profile():
             logger.error("❌ token 中缺少 phone")
             return make_err_response("无效的 token"), 401
         
-        logger.info("📋 从 token 获取 phone: %s", phone)
-        
-        # 根据手机号获取用户注册信息（返回最新的注册记录）
-        user_profile = get_user_registration_by_phone(phone)
-        
-        if user_profile is None:
-            logger.warn("⚠️ 未找到用户注册记录: phone=%s", phone)
-            return make_err_response("未找到用户信息"), 404
-        
-        logger.info("✅ 成功获取用户个人信息: phone=%s, user_id=%s", phone, user_profile.user_id)
-        
-        # 构建响应数据
-        response_data = {
-            'user_id': user_profile.user_id,
-            'registration_id': user_profile.registration_id,
-            'business_type_id': user_profile.business_type_id,
-            'business_type_name': user_profile.business_type_name,
-            'user_role_id': user_profile.user_role_id,
-            'user_role_name': user_profile.user_role_name,
-            'store_name': user_profile.store_name,
-            'contact_name': user_profile.contact_name,
-            'contact_phone': user_profile.contact_phone,
-            'address': user_profile.address,
-            'business_license_path': user_profile.business_license_path,
-            'status': user_profile.status,
-            'submit_time': user_profile.submit_time.isoformat() + 'Z' if user_profile.submit_time else None,
-            'review_time': user_profile.review_time.isoformat() + 'Z' if user_profile.review_time else None,
-            'review_comment': user_profile.review_comment,
-            'created_at': user_profile.created_at.isoformat() + 'Z' if user_profile.created_at else None,
-            'updated_at': user_profile.updated_at.isoformat() + 'Z' if user_profile.updated_at else None,
-        }
+        # 先查缓存（按手机号缓存响应数据，注册、审核、更新营业执照时失效）
+        response_data = user_profile_cache.get(phone)
+        if response_data is MISSING:
+            generation = user_profile_cache.generation
+            # 根据手机号获取用户注册信息（返回最新的注册记录）
+            user_profile = get_user_registration_by_phone(phone)
+            if user_profile is None:
+                # 查询失败时 dao 同样返回 None，未找到的结果不缓存
+                logger.warn("⚠️ 未找到用户注册记录: phone=%s", phone)
+                return make_err_response("未找到用户信息"), 404
+            response_data = _serialize_registration(user_profile)
+            # 待审核状态随时会变化（审核可能发生在其他实例，本实例的缓存不会失效），只缓存很短时间
+            ttl = config.USER_PROFILE_PENDING_CACHE_TTL if user_profile.status == 'pending' else None
+            user_profile_cache.set(phone, response_data, generation, ttl)
         
         return make_succ_response(response_data, "获取用户个人信息成功"), 200
         
@@ -187,37 +186,47 @@ def get_user_profile():
 
 def get_all_user_registrations_handler():
     """
-    获取所有用户注册记录（管理员功能）
+    获取用户注册记录（管理员功能，游标分页，按提交时间倒序）
+    查询参数：
+    - status: 按状态筛选，pending、approved 或 rejected（可选）
+    - submitted_from / submitted_to: 提交时间范围，ISO 8601，包含起点不包含终点（可选）
+    - cursor: 上一页返回的 next_cursor（可选）
+    - limit: 分页大小，默认 20，最大 100
+    响应中的 pending_count 为全部待审核记录数（不受筛选条件影响）
     """
     try:
-        logger.info("🚀 开始获取所有用户注册记录")
+        status = request.args.get('status') or None
+        if status and status not in REGISTRATION_STATUSES:
+            return make_err_response("无效的状态值，必须是 pending、approved 或 rejected"), 400
         
-        registrations = get_all_user_registrations()
-        logger.info("✅ 成功获取用户注册记录，共 %d 条", len(registrations))
+        try:
+            submitted_from = parse_utc_datetime(request.args.get('submitted_from'))
+            submitted_to = parse_utc_datetime(request.args.get('submitted_to'))
+        except ValueError:
+            return make_err_response("无效的提交时间参数，请使用 ISO 8601 格式"), 400
+        
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = decode_cursor(request.args['cursor'])
+            if cursor is None:
+                return make_err_response("无效的分页游标"), 400
+        
+        limit = parse_page_limit(request.args.get('limit'))
+        registrations, has_more = list_user_registrations(
+            status=status, submitted_from=submitted_from, submitted_to=submitted_to,
+            cursor=cursor, limit=limit
+        )
         
-        # 构建响应数据
-        response_data = []
-        for reg in registrations:
-            response_data.append({
-                'user_id': reg.user_id,
-                'registration_id': reg.registration_id,
-                'business_type_id': reg.business_type_id,
-                'business_type_name': reg.business_type_name,
-                'user_role_id': reg.user_role_id,
-                'user_role_name': reg.user_role_name,
-                'store_name': reg.store_name,
-                'contact_name': reg.contact_name,
-                'contact_phone': reg.contact_phone,
-                'address': reg.address,
-                'business_license_path': reg.business_license_path,
-                'status': reg.status,
-                'submit_time': reg.submit_time.isoformat() + 'Z' if reg.submit_time else None,
-                'review_time': reg.review_time.isoformat() + 'Z' if reg.review_time else None,
-                'review_comment': reg.review_comment,
-                'created_at': reg.created_at.isoformat() + 'Z' if reg.created_at else None,
-                'updated_at': reg.updated_at.isoformat() + 'Z' if reg.updated_at else None,
-            })
+        next_cursor = None
+        if has_more and registrations:
+            next_cursor = encode_cursor(registrations[-1].submit_time, registrations[-1].id)
         
+        response_data = {
+            'items': [_serialize_registration(reg) for reg in registrations],
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'pending_count': count_user_registrations('pending'),
+        }
         return make_succ_response(response_data, "获取用户注册记录成功"), 200
         
     except Exception as e:
@@ -241,7 +250,7 @@ def update_user_registration_status_handler(registration_id):
         review_comment = data.get('review_comment')
         
         # 验证状态值
-        if status not in ['pending', 'approved', 'rejected']:
+        if status not in REGISTRATION_STATUSES:
             return make_err_response("无效的状态值，必须是 pending、approved 或 rejected"), 400
         
         # 更新状态
@@ -282,3 +291,52 @@ def update_user_registration_status_handler(registration_id):
         logger.error("❌ 更新用户注册状态失败: %s", str(e), exc_info=True)
         return make_err_response(f"更新用户注册状态失败: {str(e)}"), 500
 
+
+def bulk_update_user_registration_status_handler():
+    """
+    批量更新用户注册状态（管理员功能）
+    请求体：{"registration_ids": [...], "status": "approved", "review_comment": "..."}
+    所有记录在一个事务中用一条 UPDATE 更新，返回每个注册ID的处理结果（updated / not_found）
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return make_err_response("请求数据不能为空"), 400
+        
+        status = data.get('status')
+        review_comment = data.get('review_comment')
+        registration_ids = data.get('registration_ids')
+        
+        if status not in REGISTRATION_STATUSES:
+            return make_err_response("无效的状态值，必须是 pending、approved 或 rejected"), 400
+        if not isinstance(registration_ids, list) or not registration_ids:
+            return make_err_response("registration_ids 必须是非空数组"), 400
+        if not all(isinstance(registration_id, str) and registration_id for registration_id in registration_ids):
+            return make_err_response("registration_ids 中的每一项必须是非空字符串"), 400
+        
+        # 去重并保持请求中的顺序
+        registration_ids = list(dict.fromkeys(registration_ids))
+        if len(registration_ids) > BULK_REVIEW_MAX_IDS:
+            return make_err_response(f"一次最多处理 {BULK_REVIEW_MAX_IDS} 条注册记录"), 400
+        
+        with transaction():
+            updated = bulk_update_user_registration_status(registration_ids, status, review_comment)
+        
+        results = [
+            {'registration_id': registration_id, 'result': 'updated' if registration_id in updated else 'not_found'}
+            for registration_id in registration_ids
+        ]
+        logger.info("✅ 批量更新用户注册状态: status=%s, 更新 %d 条, 未找到 %d 条",
+                    status, len(updated), len(registration_ids) - len(updated))
+        
+        response_data = {
+            'status': status,
+            'updated_count': len(updated),
+            'not_found_count': len(registration_ids) - len(updated),
+            'results': results,
+        }
+        return make_succ_response(response_data, "批量更新用户注册状态成功"), 200
+        
+    except Exception as e:
+        logger.error("❌ 批量更新用户注册状态失败: %s", str(e), exc_info=True)
+        return make_err_response(f"批量更新用户注册状态失败: {str(e)}"), 500
@@ -0,0 +1,101 @@
+"""
+微信开放接口（api.weixin.qq.com/_/cos/*）HTTP 客户端
+所有线程共享同一个连接池（keep-alive），每个线程使用独立的 Session 避免共享 Cookie 等状态；
+每次调用有总耗时预算，幂等调用在连接失败、超时或 5xx 时按带抖动的指数退避重试
+"""
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from wxcloudrun import metrics
+
+logger = logging.getLogger('log')
+
+# 连接池配置：pool_connections 为缓存的主机连接池个数，pool_maxsize 为每个主机保持的连接数
+POOL_CONNECTIONS = int(os.environ.get('WX_API_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.environ.get('WX_API_POOL_MAXSIZE', '16'))
+
+# 单次请求的连接/读取超时（秒）
+CONNECT_TIMEOUT = float(os.environ.get('WX_API_CONNECT_TIMEOUT', '1'))
+READ_TIMEOUT = float(os.environ.get('WX_API_READ_TIMEOUT', '3'))
+
+# 重试配置：最多重试次数、退避基数和上限（秒）
+MAX_RETRIES = int(os.environ.get('WX_API_MAX_RETRIES', '2'))
+BACKOFF_BASE = float(os.environ.get('WX_API_BACKOFF_BASE', '0.1'))
+BACKOFF_MAX = float(os.environ.get('WX_API_BACKOFF_MAX', '1'))
+
+# 需要重试的 HTTP 状态码
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# 所有线程共享的连接池适配器（urllib3 连接池本身是线程安全的）
+_adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """
+    获取当前线程的 Session（挂载共享连接池）
+    :return: requests.Session
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        # 云托管内网调用，不走环境变量中的代理
+        session.trust_env = False
+        session.mount('http://', _adapter)
+        session.mount('https://', _adapter)
+        _local.session = session
+    return session
+
+
+def _backoff(attempt: int) -> float:
+    # full jitter：在 [0, min(上限, 基数 * 2^attempt)] 内随机
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def call(method: str, url: str, name: str, idempotent: bool = False,
+         budget: float = 5.0, **kwargs) -> requests.Response:
+    """
+    调用微信开放接口
+    :param method: HTTP 方法
+    :param url: 请求地址
+    :param name: 指标名（如 getauth、metaid_encode）
+    :param idempotent: 是否幂等，幂等调用失败时重试
+    :param budget: 本次调用（含重试）的总耗时预算（秒）
+    :param kwargs: 透传给 requests 的参数（json、params 等）
+    :return: requests.Response（已检查状态码）
+    :raises requests.RequestException: 重试耗尽或预算用完后仍失败
+    """
+    deadline = time.monotonic() + budget
+    retries = MAX_RETRIES if idempotent else 0
+    attempt = 0
+    while True:
+        remaining = max(deadline - time.monotonic(), 0.001)
+        timeout = (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+        start = time.monotonic()
+        try:
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+        metrics.observe(f'wx_openapi.{name}', time.monotonic() - start)
+        
+        if error is None and response.status_code not in RETRY_STATUS_CODES:
+            response.raise_for_status()
+            return response
+        
+        metrics.incr(f'wx_openapi.{name}.error')
+        delay = _backoff(attempt)
+        if attempt >= retries or time.monotonic() + delay >= deadline:
+            if error is not None:
+                raise error
+            response.raise_for_status()
+        
+        attempt += 1
+        metrics.incr(f'wx_openapi.{name}.retry')
+        logger.warning("调用微信开放接口失败，%.2f 秒后第 %d 次重试: %s, %s",
+                       delay, attempt, name, str(error) if error else response.status_code)
+        time.sleep(delay)
@@ -0,0 +1,197 @@
+"""
+幂等键
+客户端在请求头 Idempotency-Key 中为每次业务操作生成一个唯一值（如 UUID），弱网重试时复用同一个值：
+- 第一次请求在 idempotency_keys 表登记该 Key（唯一索引保证并发的重复请求只有一个登记成功），
+  处理完成后保存响应；之后相同 Key 的请求直接回放该响应（响应头 Idempotent-Replayed: true），不再执行业务逻辑
+- 已完成的响应同时缓存在进程内，重试请求通常不需要查询数据库
+- 相同 Key 的请求仍在处理中时：同一进程内等待其完成后回放；其他实例（或等待超时）返回 409 和 Retry-After
+- 登记带有处理租约（IDEMPOTENCY_LOCK_SECONDS）：处理请求的实例崩溃或超时后，租约到期即可由之后的重试接管，
+  不必等待记录过期；被接管后原请求不再保存或删除该记录
+- 处理失败（5xx 或异常）时删除登记，客户端可以用同一个 Key 重试；409、429 同样不保存
+- 同一个 Key 用于内容不同的请求（上传照片时包括文件内容）返回 422
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import request, make_response, Response
+import config
+from wxcloudrun import metrics
+from wxcloudrun.ttl_cache import TTLCache, MISSING
+from wxcloudrun.response import make_err_response
+
+logger = logging.getLogger('log')
+
+# Idempotency-Key 的最大长度（与表字段一致）
+MAX_KEY_LENGTH = 100
+
+# 不保存的响应状态码（客户端稍后重试可能得到不同的结果）
+_RETRYABLE_STATUSES = (409, 429)
+
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'status', 'body'])
+
+_response_cache = TTLCache('idempotency.responses', config.IDEMPOTENCY_CACHE_SIZE, config.IDEMPOTENCY_TTL_SECONDS)
+_inflight_lock = threading.Lock()
+_inflight = {}  # (scope, key) -> threading.Event，本进程内正在处理的 Key
+
+
+def _file_digest(storage):
+    # 上传文件内容的 SHA-256 和大小（读取后把文件流恢复到原位置，不影响之后的处理）
+    stream = storage.stream
+    position = stream.tell()
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(position)
+    return digest.hexdigest(), size
+
+
+def fingerprint_request():
+    """
+    计算当前请求内容的摘要（JSON 请求取请求体；表单请求取普通字段，以及上传文件的文件名、内容 SHA-256 和大小）
+    :return: 十六进制 SHA-256 摘要
+    """
+    parts = {
+        'method': request.method,
+        'path': request.path,
+        'args': sorted(request.args.items(multi=True)),
+    }
+    if request.is_json:
+        parts['json'] = request.get_data(as_text=True)
+    else:
+        parts['form'] = sorted(request.form.items(multi=True))
+        parts['files'] = sorted(
+            (name, f.filename or '') + _file_digest(f) for name, f in request.files.items(multi=True)
+        )
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        metrics.incr('idempotency.mismatch')
+        return make_err_response("该 Idempotency-Key 已用于内容不同的请求", 422), 422
+    metrics.incr('idempotency.replayed')
+    response = Response(stored.body, status=stored.status, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress():
+    metrics.incr('idempotency.in_progress')
+    response = make_err_response("相同 Idempotency-Key 的请求正在处理中，请稍后重试", 409)
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
+
+def _claim(scope, key, fingerprint):
+    """
+    登记 Key（已过期或处理租约已到期的 Key 直接接管）
+    :return: (登记成功时的租约到期时间，未登记成功为 None, 已存在的记录)
+    """
+    from wxcloudrun.dao import claim_idempotency_key, get_idempotency_key, take_over_idempotency_key
+    # DATETIME 列只保存到秒，租约到期时间同时作为登记凭证，需要与数据库中的值一致
+    now = datetime.utcnow().replace(microsecond=0)
+    expires_at = now + timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS)
+    locked_until = now + timedelta(seconds=config.IDEMPOTENCY_LOCK_SECONDS)
+    if claim_idempotency_key(scope, key, fingerprint, expires_at, locked_until):
+        return locked_until, None
+    if take_over_idempotency_key(scope, key, fingerprint, expires_at, locked_until, now):
+        metrics.incr('idempotency.taken_over')
+        return locked_until, None
+    row = get_idempotency_key(scope, key)
+    if row is None:
+        # 刚被释放的 Key 视为新请求
+        if claim_idempotency_key(scope, key, fingerprint, expires_at, locked_until):
+            return locked_until, None
+        row = get_idempotency_key(scope, key)
+    return None, row
+
+
+def _process(scope, key, fingerprint, handler):
+    from wxcloudrun.dao import complete_idempotency_key, release_idempotency_key
+    try:
+        locked_until, row = _claim(scope, key, fingerprint)
+    except Exception as e:
+        # 幂等键存储故障时按普通请求处理，不影响业务
+        metrics.incr('idempotency.store_error')
+        logger.error("登记幂等键失败，按普通请求处理: %s, %s", scope, str(e))
+        return handler()
+
+    if locked_until is None:
+        if row is not None and row.status == 'completed':
+            stored = StoredResponse(row.fingerprint, row.response_status, row.response_body)
+            _response_cache.set((scope, key), stored)
+            return _replay(stored, fingerprint)
+        if row is not None and row.fingerprint != fingerprint:
+            metrics.incr('idempotency.mismatch')
+            return make_err_response("该 Idempotency-Key 已用于内容不同的请求", 422), 422
+        return _in_progress()
+
+    try:
+        response = make_response(handler())
+    except Exception:
+        release_idempotency_key(scope, key, locked_until)
+        raise
+
+    status = response.status_code
+    if status >= 500 or status in _RETRYABLE_STATUSES or response.is_streamed or response.mimetype != 'application/json':
+        release_idempotency_key(scope, key, locked_until)
+        return response
+
+    body = response.get_data(as_text=True)
+    try:
+        if not complete_idempotency_key(scope, key, locked_until, status, body):
+            # 处理时间超过租约，Key 已被重试接管
+            metrics.incr('idempotency.lease_lost')
+            logger.warning("幂等键租约已到期，响应未保存: %s, %s", scope, key)
+            return response
+    except Exception as e:
+        # 响应已经生成，保存失败只影响之后的重试
+        metrics.incr('idempotency.store_error')
+        logger.error("保存幂等键响应失败: %s, %s", scope, str(e))
+    _response_cache.set((scope, key), StoredResponse(fingerprint, status, body))
+    metrics.incr('idempotency.stored')
+    return response
+
+
+def execute(scope, key, handler):
+    """
+    按幂等键执行请求处理
+    :param scope: 接口名（不同接口的 Key 互不影响）
+    :param key: 客户端传入的 Idempotency-Key
+    :param handler: 无参函数，执行实际的请求处理
+    :return: 响应
+    """
+    fingerprint = fingerprint_request()
+    cache_key = (scope, key)
+    stored = _response_cache.get(cache_key)
+    if stored is not MISSING:
+        return _replay(stored, fingerprint)
+
+    with _inflight_lock:
+        event = _inflight.get(cache_key)
+        leader = event is None
+        if leader:
+            event = threading.Event()
+            _inflight[cache_key] = event
+
+    if not leader:
+        # 本进程内相同 Key 的请求正在处理，等待其完成后回放
+        metrics.incr('idempotency.waited')
+        if event.wait(config.IDEMPOTENCY_WAIT_SECONDS):
+            stored = _response_cache.get(cache_key)
+            if stored is not MISSING:
+                return _replay(stored, fingerprint)
+        return _process(scope, key, fingerprint, handler)
+
+    try:
+        return _process(scope, key, fingerprint, handler)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+        event.set()
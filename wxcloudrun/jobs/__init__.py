@@ -0,0 +1,19 @@
+# Background jobs package
+# 每个任务模块提供 add_arguments(parser) 和 run(args)，由根目录 jobs.py 调度执行
+from . import (
+    migrate_local_photos, gc_orphan_photos, tier_photo_storage, purge_sms_codes, purge_idempotency_keys,
+    migrate_uuid_keys, archive_orders, restore_orders
+)
+
+JOBS = {
+    'migrate-local-photos': migrate_local_photos,
+    'gc-orphan-photos': gc_orphan_photos,
+    'tier-photo-storage': tier_photo_storage,
+    'purge-sms-codes': purge_sms_codes,
+    'purge-idempotency-keys': purge_idempotency_keys,
+    'migrate-uuid-keys': migrate_uuid_keys,
+    'archive-orders': archive_orders,
+    'restore-orders': restore_orders,
+}
+
+__all__ = ['JOBS']
@@ -0,0 +1,173 @@
+"""
+订单归档任务
+订单和照片表只增不减，而几乎所有查询只访问最近的数据。照片表有外键、主键不含 created_at，无法按月 RANGE 分区，
+该任务按自然月轮转：把保留期（--retention-months 个自然月）之前创建的订单及其照片记录导出为
+gzip 压缩的 JSONL 文件（见 order_archive 模块），上传到 COS 后从数据库删除，需要时用 restore-orders 任务恢复。
+
+- 先完整写出并上传归档文件，再按批删除（每批一个事务），上传失败时不删除任何记录
+- 删除前锁定订单并核对版本号和照片，导出之后被修改的订单不删除，下次归档时重新导出
+- 删除的照片记录登记到 archived_photo_files，孤儿清理任务不会删除其存储文件
+- 统计信息记录到任务检查点（GET /api/admin/metrics 的 jobs 中可见）
+"""
+import gzip
+import logging
+import os
+import time
+from datetime import datetime
+import config
+from wxcloudrun import metrics
+from wxcloudrun import order_archive
+from wxcloudrun.dao import (
+    transaction, get_oldest_battery_order_created_at, count_battery_orders_created_between,
+    get_orders_for_archive, get_photos_by_order_ids, delete_archived_orders, save_job_checkpoint
+)
+from wxcloudrun.cos_storage import upload_file_to_cos, STORAGE_CLASS_STANDARD_IA
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'archive_orders'
+
+
+def add_arguments(parser):
+    parser.add_argument('--retention-months', type=int, default=config.ORDER_ARCHIVE_RETENTION_MONTHS,
+                        help='数据库中保留最近多少个自然月的订单')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批导出/删除的订单数')
+    parser.add_argument('--max-months', type=int, default=0, help='最多归档的月数，0 表示不限')
+    parser.add_argument('--no-upload', action='store_true', help='只保存到本地目录，不上传 COS（本地开发环境）')
+    parser.add_argument('--keep-local', action='store_true', help='上传后保留本地归档文件')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不归档')
+
+
+def _month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(month_start, months):
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return month_start.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _export_month(month_start, month_end, path, batch_size):
+    """
+    导出一个月的订单到归档文件（先写临时文件，完成后重命名）
+    :return: (订单数, 照片数)
+    """
+    tmp_path = path + '.tmp'
+    orders_count = photos_count = 0
+    after_id = ''
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        while True:
+            orders = get_orders_for_archive(month_start, month_end, after_id, batch_size)
+            if not orders:
+                break
+            photos_by_order = {}
+            for photo in get_photos_by_order_ids([order.id for order in orders]):
+                photos_by_order.setdefault(photo.order_id, []).append(photo)
+            for order in orders:
+                photos = photos_by_order.get(order.id, [])
+                f.write(order_archive.serialize_order(order, photos))
+                f.write('\n')
+                photos_count += len(photos)
+            orders_count += len(orders)
+            after_id = orders[-1].id
+    os.replace(tmp_path, path)
+    return orders_count, photos_count
+
+
+def _delete_month(path, name, batch_size):
+    """
+    按归档文件中的内容分批删除数据库记录
+    :return: (删除的订单数, 跳过的订单数)
+    """
+    deleted_count = skipped_count = 0
+    batch = {}
+
+    def flush():
+        with transaction():
+            deleted, skipped = delete_archived_orders(batch, name)
+        batch.clear()
+        return len(deleted), len(skipped)
+
+    for order, photos in order_archive.read_archive(path):
+        batch[order['id']] = (order['version'], {photo['id'] for photo in photos})
+        if len(batch) >= batch_size:
+            deleted, skipped = flush()
+            deleted_count += deleted
+            skipped_count += skipped
+    if batch:
+        deleted, skipped = flush()
+        deleted_count += deleted
+        skipped_count += skipped
+    return deleted_count, skipped_count
+
+
+def run(args):
+    """
+    执行归档
+    :return: 统计信息字典
+    """
+    if args.retention_months < 1:
+        raise ValueError("保留期至少为 1 个月")
+    now = datetime.utcnow()
+    cutoff = _add_months(_month_start(now), -args.retention_months)
+    stats = {
+        'cutoff': cutoff.isoformat() + 'Z',
+        'archives': [],
+        'orders_archived': 0,
+        'photos_exported': 0,
+        'orders_skipped': 0,
+    }
+
+    oldest = get_oldest_battery_order_created_at()
+    month = _month_start(oldest) if oldest is not None else cutoff
+    start = time.monotonic()
+    while month < cutoff:
+        if args.max_months and len(stats['archives']) >= args.max_months:
+            break
+        next_month = _add_months(month, 1)
+        eligible = count_battery_orders_created_between(month, next_month)
+        if not eligible:
+            month = next_month
+            continue
+        if args.dry_run:
+            stats['archives'].append({'month': month.strftime('%Y-%m'), 'orders': eligible})
+            month = next_month
+            continue
+
+        name = order_archive.archive_name(month, now)
+        path = order_archive.local_path(name)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        orders_count, photos_count = _export_month(month, next_month, path, args.batch_size)
+        file_size = os.path.getsize(path)
+        if not args.no_upload and not upload_file_to_cos(path, order_archive.cos_key(name), STORAGE_CLASS_STANDARD_IA):
+            raise RuntimeError("上传归档文件失败，未删除数据库记录，本地文件: {}".format(path))
+
+        deleted, skipped = _delete_month(path, name, args.batch_size)
+        if not args.no_upload and not args.keep_local:
+            os.remove(path)
+        metrics.incr('order_archive.orders', deleted)
+
+        stats['archives'].append({
+            'month': month.strftime('%Y-%m'),
+            'name': name,
+            'orders': orders_count,
+            'photos': photos_count,
+            'deleted': deleted,
+            'skipped': skipped,
+            'file_size': file_size,
+        })
+        stats['orders_archived'] += deleted
+        stats['photos_exported'] += photos_count
+        stats['orders_skipped'] += skipped
+        save_job_checkpoint(JOB_NAME, month.strftime('%Y-%m'), stats)
+        logger.info("订单归档: %s 导出 %d 个订单、%d 张照片（%d 字节），删除 %d 个，跳过 %d 个",
+                    name, orders_count, photos_count, file_size, deleted, skipped)
+        month = next_month
+
+    stats['dry_run'] = args.dry_run
+    stats['elapsed_seconds'] = round(time.monotonic() - start, 3)
+    stats['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+    if not args.dry_run:
+        save_job_checkpoint(JOB_NAME, None, stats)
+    logger.info("订单归档完成: %s", stats)
+    return stats
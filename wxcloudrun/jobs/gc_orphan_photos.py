@@ -0,0 +1,159 @@
+"""
+孤儿照片清理任务
+上传失败、事务回滚或订单删除后，COS（photos/ 前缀）和本地回退目录中可能残留没有照片记录的文件，
+该任务逐页列出存储中的文件，按文件名批量查询数据库做集合差，删除超过宽限期的孤儿文件。
+
+- 内存占用只与分页大小有关：每页单独比对、单独删除
+- 宽限期内的文件不删除（小程序先上传照片、后创建订单，期间文件暂时没有记录）
+- --dry-run 只统计不删除
+"""
+import calendar
+import logging
+import os
+from datetime import datetime, timedelta
+from wxcloudrun.dao import get_photo_file_paths_by_filenames
+from wxcloudrun.cos_storage import (
+    list_objects_page, delete_files_from_cos, extract_cos_key_from_file_path
+)
+
+logger = logging.getLogger('log')
+
+COS_PREFIX = 'photos/'
+LOCAL_PHOTO_DIR = os.path.join('uploads', 'photos')
+
+
+def add_arguments(parser):
+    parser.add_argument('--target', choices=['cos', 'local', 'all'], default='all', help='清理的存储')
+    parser.add_argument('--grace-hours', type=float, default=24, help='宽限期（小时），更新的文件不删除')
+    parser.add_argument('--page-size', type=int, default=1000, help='每页比对的文件数（COS 最大 1000）')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+
+
+def _parse_cos_time(value):
+    # COS 返回的 LastModified 形如 2024-01-01T08:00:00.000Z
+    try:
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def _new_stats():
+    return {'scanned': 0, 'orphans': 0, 'deleted': 0, 'reclaimed_bytes': 0, 'errors': 0}
+
+
+def gc_cos(page_size, grace_cutoff, dry_run):
+    """
+    清理 COS 中的孤儿照片
+    :return: 统计信息字典
+    """
+    stats = _new_stats()
+    marker = ''
+    while True:
+        page = list_objects_page(COS_PREFIX, marker=marker, max_keys=min(page_size, 1000))
+        if page is None:
+            raise RuntimeError("列出 COS 文件失败，已中止清理")
+        objects = page['objects']
+        stats['scanned'] += len(objects)
+
+        # 本页文件名 -> 数据库中已登记的 COS Key
+        filenames = {obj['key'].rsplit('/', 1)[-1] for obj in objects}
+        known_keys = {
+            extract_cos_key_from_file_path(path)
+            for path in get_photo_file_paths_by_filenames(filenames)
+        }
+        orphans = [
+            obj for obj in objects
+            if obj['key'] not in known_keys
+            and (_parse_cos_time(obj['last_modified']) or datetime.utcnow()) < grace_cutoff
+        ]
+        stats['orphans'] += len(orphans)
+
+        if orphans and not dry_run:
+            sizes = {obj['key']: obj['size'] for obj in orphans}
+            result = delete_files_from_cos([obj['key'] for obj in orphans])
+            if result is None:
+                stats['errors'] += len(orphans)
+            else:
+                stats['deleted'] += len(result['deleted'])
+                stats['reclaimed_bytes'] += sum(sizes.get(key, 0) for key in result['deleted'])
+                stats['errors'] += len(result['errors'])
+                for error in result['errors']:
+                    logger.warning("删除孤儿文件失败: %s", error)
+        elif orphans:
+            stats['reclaimed_bytes'] += sum(obj['size'] for obj in orphans)
+            for obj in orphans:
+                logger.info("[dry-run] 孤儿文件: %s (%d bytes)", obj['key'], obj['size'])
+
+        if not page['is_truncated']:
+            break
+        marker = page['next_marker']
+    return stats
+
+
+def _iter_local_pages(page_size):
+    # 按用户目录逐个 scandir，按页产出 (路径, 文件名, 大小, 修改时间)
+    if not os.path.isdir(LOCAL_PHOTO_DIR):
+        return
+    page = []
+    with os.scandir(LOCAL_PHOTO_DIR) as user_dirs:
+        for user_dir in user_dirs:
+            if not user_dir.is_dir():
+                continue
+            with os.scandir(user_dir.path) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    page.append((entry.path, entry.name, stat.st_size, stat.st_mtime))
+                    if len(page) >= page_size:
+                        yield page
+                        page = []
+    if page:
+        yield page
+
+
+def gc_local(page_size, grace_cutoff, dry_run):
+    """
+    清理本地回退目录中的孤儿照片
+    :return: 统计信息字典
+    """
+    stats = _new_stats()
+    cutoff_ts = calendar.timegm(grace_cutoff.utctimetuple())
+    for page in _iter_local_pages(page_size):
+        stats['scanned'] += len(page)
+        known_paths = {
+            os.path.normpath(path)
+            for path in get_photo_file_paths_by_filenames({name for _, name, _, _ in page})
+        }
+        for path, _, size, mtime in page:
+            if os.path.normpath(path) in known_paths or mtime >= cutoff_ts:
+                continue
+            stats['orphans'] += 1
+            if dry_run:
+                stats['reclaimed_bytes'] += size
+                logger.info("[dry-run] 本地孤儿文件: %s (%d bytes)", path, size)
+                continue
+            try:
+                os.remove(path)
+                stats['deleted'] += 1
+                stats['reclaimed_bytes'] += size
+            except OSError as e:
+                stats['errors'] += 1
+                logger.warning("删除本地孤儿文件失败: %s, %s", path, str(e))
+    return stats
+
+
+def run(args):
+    """
+    执行清理
+    :return: 各存储的统计信息（dry-run 时 reclaimed_bytes 为可回收的字节数）
+    """
+    grace_cutoff = datetime.utcnow() - timedelta(hours=args.grace_hours)
+    result = {'dry_run': args.dry_run}
+    if args.target in ('cos', 'all'):
+        result['cos'] = gc_cos(args.page_size, grace_cutoff, args.dry_run)
+        logger.info("COS 孤儿照片清理完成: %s", result['cos'])
+    if args.target in ('local', 'all'):
+        result['local'] = gc_local(args.page_size, grace_cutoff, args.dry_run)
+        logger.info("本地孤儿照片清理完成: %s", result['local'])
+    return result
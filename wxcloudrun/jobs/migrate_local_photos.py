@@ -0,0 +1,108 @@
+"""
+本地回退照片迁移任务
+COS 不可用时 upload_photos 会把照片写到 uploads/photos/<user_id>/ 并在 file_path 中记录本地路径，
+容器磁盘是临时的，该任务把这些照片补传到 COS、批量改写 file_path 并删除本地副本。
+
+- 幂等：COS Key 与正常上传一致（photos/<user_id>/<filename>），重复上传只会覆盖同一对象；
+  数据库只改写仍为 local 的记录
+- 使用上传时记录的 openid 生成文件元数据，小程序端可以照常访问补传的照片
+  （openid 为空的记录按管理端上传处理）
+- 可恢复：每批处理完成后保存检查点（最后处理的照片ID），中断后从检查点继续；
+  全部处理完成后清空检查点，下次从头扫描之前失败的记录
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from wxcloudrun.dao import (
+    get_local_photos_after, mark_photos_migrated_to_cos,
+    get_job_checkpoint, save_job_checkpoint
+)
+from wxcloudrun.cos_storage import upload_photo_to_cos, cos_breaker
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'migrate_local_photos'
+
+
+def add_arguments(parser):
+    parser.add_argument('--batch-size', type=int, default=100, help='每批处理的照片数')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发上传数')
+    parser.add_argument('--max-batches', type=int, default=0, help='最多处理的批数，0 表示不限')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头开始')
+    parser.add_argument('--keep-local', action='store_true', help='迁移后保留本地文件')
+
+
+def _upload_one(photo):
+    """
+    上传单张本地照片（在线程池中执行，不访问数据库）
+    :return: (photo_id, cos_key 或 None, 本地路径, 失败原因)
+    """
+    local_path = photo['file_path']
+    if not os.path.isfile(local_path):
+        return photo['id'], None, local_path, 'missing'
+    with open(local_path, 'rb') as f:
+        file_data = f.read()
+    cos_key = upload_photo_to_cos(file_data, photo['user_id'], photo['filename'], openid=photo['openid'])
+    return photo['id'], cos_key, local_path, None if cos_key else 'upload_failed'
+
+
+def run(args):
+    """
+    执行迁移
+    :return: 统计信息字典
+    """
+    checkpoint = None if args.restart else get_job_checkpoint(JOB_NAME)
+    after_id = (checkpoint.position if checkpoint and checkpoint.position else '')
+    stats = dict(checkpoint.state) if checkpoint and checkpoint.position and checkpoint.state else {
+        'migrated': 0, 'missing': 0, 'failed': 0, 'removed_local': 0,
+    }
+    if after_id:
+        logger.info("从检查点继续迁移: after_id=%s, 已迁移=%d", after_id, stats['migrated'])
+    
+    batches = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        while True:
+            if args.max_batches and batches >= args.max_batches:
+                break
+            if cos_breaker.state == 'open':
+                logger.error("COS 熔断器已打开，停止迁移，检查点: %s", after_id)
+                break
+            
+            photos = get_local_photos_after(after_id, args.batch_size)
+            if not photos:
+                # 全部处理完成，清空检查点
+                save_job_checkpoint(JOB_NAME, None, stats)
+                logger.info("本地照片迁移完成: %s", stats)
+                break
+            
+            # 线程池中只使用普通字典，不跨线程传递 ORM 实体
+            items = [
+                {'id': p.id, 'user_id': p.user_id, 'openid': p.openid or '', 'filename': p.filename,
+                 'file_path': p.file_path}
+                for p in photos
+            ]
+            results = list(executor.map(_upload_one, items))
+            
+            migrated = [(photo_id, cos_key) for photo_id, cos_key, _, _ in results if cos_key]
+            updated = mark_photos_migrated_to_cos(migrated)
+            stats['migrated'] += updated
+            stats['missing'] += sum(1 for r in results if r[3] == 'missing')
+            stats['failed'] += sum(1 for r in results if r[3] == 'upload_failed')
+            
+            # 数据库已改写后再删除本地副本；若在此之前中断，残留的本地文件由孤儿清理任务回收
+            if not args.keep_local:
+                for _, cos_key, local_path, _ in results:
+                    if cos_key:
+                        try:
+                            os.remove(local_path)
+                            stats['removed_local'] += 1
+                        except OSError as e:
+                            logger.warning("删除本地照片失败: %s, %s", local_path, str(e))
+            
+            after_id = items[-1]['id']
+            save_job_checkpoint(JOB_NAME, after_id, stats)
+            batches += 1
+            logger.info("迁移批次 %d 完成: 本批 %d 张，成功 %d 张，累计 %s",
+                        batches, len(items), updated, stats)
+    
+    return stats
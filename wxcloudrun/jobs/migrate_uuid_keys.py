@@ -0,0 +1,134 @@
+"""
+订单、照片主键回填任务（CHAR(36) -> BINARY(16)）
+在 migrations/016 之后执行：按主键顺序分批把字符串 UUID 转换写入 id_bin / order_id_bin 列，
+迁移期间新写入的记录由触发器同步。
+
+- 每批只更新一小段主键区间并单独提交，不长时间锁表，旧版本应用可以照常读写
+- 可恢复：每批完成后保存检查点（表名和最后处理的ID），中断后从检查点继续
+- 完成后统计各表仍未回填的行数（remaining），为 0 时可以用 --swap 切换主键
+- --swap：确认主键尚未切换、回填已完成后执行 migrations/manual/binary_uuid_keys_swap.sql（发布新版本时执行）；
+  主键已经是 BINARY(16) 时直接跳过，重复执行没有副作用
+"""
+import logging
+import os
+import time
+from datetime import datetime
+from wxcloudrun import metrics
+from wxcloudrun.dao import (
+    UUID_KEY_BACKFILL_COLUMNS, backfill_binary_uuid_keys, count_pending_binary_uuid_keys,
+    get_column_data_type, get_foreign_key_name, execute_sql_statements,
+    get_job_checkpoint, save_job_checkpoint
+)
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'migrate_uuid_keys'
+
+# 先回填订单再回填照片
+TABLES = ['battery_upload_orders', 'battery_upload_photos']
+
+SWAP_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'migrations', 'manual', 'binary_uuid_keys_swap.sql'
+)
+
+
+def add_arguments(parser):
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批回填的行数')
+    parser.add_argument('--sleep', type=float, default=0.05, help='批次之间暂停的秒数')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头开始')
+    parser.add_argument('--swap', action='store_true', help='回填完成后切换主键（发布新版本时执行）')
+
+
+def _is_swapped():
+    return get_column_data_type('battery_upload_orders', 'id') == 'binary'
+
+
+def _read_swap_statements(photo_order_fk):
+    with open(SWAP_SCRIPT, 'r', encoding='utf-8') as f:
+        sql_content = f.read().replace('{photo_order_fk}', photo_order_fk)
+    statements = []
+    for statement in sql_content.split(';'):
+        statement = '\n'.join(
+            line for line in statement.strip().splitlines() if not line.strip().startswith('--')
+        ).strip()
+        if statement:
+            statements.append(statement)
+    return statements
+
+
+def swap(args):
+    """
+    切换主键
+    :return: 统计信息字典
+    """
+    if _is_swapped():
+        logger.info("主键已经是 BINARY(16)，跳过切换")
+        return {'swapped': False, 'reason': 'already_binary'}
+    if get_column_data_type('battery_upload_orders', 'id_bin') is None:
+        raise RuntimeError("缺少 id_bin 列，请先执行 migrations/016_binary_uuid_keys_prepare.sql")
+    remaining = {name: count_pending_binary_uuid_keys(name) for name in UUID_KEY_BACKFILL_COLUMNS}
+    if any(remaining.values()):
+        raise RuntimeError("回填尚未完成，请先执行 python jobs.py migrate-uuid-keys: {}".format(remaining))
+    photo_order_fk = get_foreign_key_name('battery_upload_photos', 'order_id')
+    if photo_order_fk is None:
+        raise RuntimeError("未找到 battery_upload_photos.order_id 的外键，表结构与预期不一致")
+
+    start = time.monotonic()
+    execute_sql_statements(_read_swap_statements(photo_order_fk))
+    stats = {
+        'swapped': True,
+        'elapsed_seconds': round(time.monotonic() - start, 3),
+        'finished_at': datetime.utcnow().isoformat() + 'Z',
+    }
+    save_job_checkpoint(JOB_NAME, None, stats)
+    logger.info("主键切换完成: %s", stats)
+    return stats
+
+
+def run(args):
+    """
+    执行回填（--swap 时切换主键）
+    :return: 统计信息字典
+    """
+    if args.swap:
+        return swap(args)
+    if _is_swapped():
+        logger.info("主键已经是 BINARY(16)，不需要回填")
+        return {'updated': {}, 'batches': 0, 'reason': 'already_binary'}
+
+    checkpoint = None if args.restart else get_job_checkpoint(JOB_NAME)
+    table_name, after_id = TABLES[0], ''
+    if checkpoint and checkpoint.position:
+        table_name, _, after_id = checkpoint.position.partition(':')
+        logger.info("从检查点继续回填: %s after_id=%s", table_name, after_id)
+    stats = dict(checkpoint.state) if checkpoint and checkpoint.position and checkpoint.state else {
+        'updated': {name: 0 for name in TABLES}, 'batches': 0,
+    }
+
+    start = time.monotonic()
+    for name in TABLES[TABLES.index(table_name):]:
+        if name != table_name:
+            after_id = ''
+        while True:
+            batch_start = time.monotonic()
+            last_id, updated = backfill_binary_uuid_keys(name, after_id, args.batch_size)
+            if last_id is None:
+                break
+            metrics.observe('uuid_key_backfill.batch', time.monotonic() - batch_start)
+            stats['updated'][name] += updated
+            stats['batches'] += 1
+            after_id = last_id
+            save_job_checkpoint(JOB_NAME, '{}:{}'.format(name, after_id), stats)
+            if stats['batches'] % 100 == 0:
+                logger.info("主键回填进度: %s 当前ID %s, 累计 %s", name, after_id, stats['updated'])
+            if args.sleep > 0:
+                time.sleep(args.sleep)
+
+    stats['remaining'] = {name: count_pending_binary_uuid_keys(name) for name in UUID_KEY_BACKFILL_COLUMNS}
+    stats['elapsed_seconds'] = round(time.monotonic() - start, 3)
+    stats['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+    # 全部处理完成，清空检查点
+    save_job_checkpoint(JOB_NAME, None, stats)
+    logger.info("主键回填完成: %s", stats)
+    return stats
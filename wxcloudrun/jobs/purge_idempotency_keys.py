@@ -0,0 +1,51 @@
+"""
+过期幂等键清理任务
+idempotency_keys 每个带 Idempotency-Key 的写请求登记一行，过期后只占空间（过期的 Key 重新使用时会被替换）。
+该任务按 expires_at 索引分批删除已过期的记录，每批单独提交，批次之间可以暂停（--sleep）
+"""
+import logging
+import time
+from datetime import datetime
+from wxcloudrun import metrics
+from wxcloudrun.dao import delete_expired_idempotency_keys, save_job_checkpoint
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'purge_idempotency_keys'
+
+
+def add_arguments(parser):
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的最大行数')
+    parser.add_argument('--sleep', type=float, default=0.05, help='批次之间暂停的秒数')
+
+
+def run(args):
+    """
+    执行清理
+    :return: 统计信息字典
+    """
+    cutoff = datetime.utcnow()
+    stats = {
+        'cutoff': cutoff.isoformat() + 'Z',
+        'deleted': 0,
+        'batches': 0,
+        'elapsed_seconds': 0.0,
+    }
+    start = time.monotonic()
+    while True:
+        deleted = delete_expired_idempotency_keys(cutoff, args.batch_size)
+        if not deleted:
+            break
+        metrics.incr('idempotency_purge.deleted', deleted)
+        stats['deleted'] += deleted
+        stats['batches'] += 1
+        if deleted < args.batch_size:
+            break
+        if args.sleep > 0:
+            time.sleep(args.sleep)
+
+    stats['elapsed_seconds'] = round(time.monotonic() - start, 3)
+    stats['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+    save_job_checkpoint(JOB_NAME, None, stats)
+    logger.info("幂等键清理完成: %s", stats)
+    return stats
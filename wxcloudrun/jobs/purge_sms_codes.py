@@ -0,0 +1,83 @@
+"""
+短信验证码保留期清理任务
+sms_codes 只增不减，(phone) 和 (sent_at) 索引随之膨胀。该任务删除发送时间早于保留期的记录
+（保留期远大于验证码有效期，这些记录都已使用或已过期）：
+
+- 先按 sent_at 索引取出待删除记录的主键范围，再按主键区间分批 DELETE，每批单独提交，
+  每条语句只锁定一小段主键，不会长时间阻塞登录请求的写入
+- 批次之间可以暂停（--sleep），降低对线上库的压力
+- 删除行数、吞吐量和表行数记录到任务检查点（GET /api/admin/metrics 的 jobs 中可见）
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+import config
+from wxcloudrun import metrics
+from wxcloudrun.dao import (
+    get_sms_code_id_range, delete_sms_codes_in_id_range, count_sms_codes, save_job_checkpoint
+)
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'purge_sms_codes'
+
+
+def add_arguments(parser):
+    parser.add_argument('--retention-days', type=float, default=30, help='保留最近多少天的记录')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的主键区间大小')
+    parser.add_argument('--sleep', type=float, default=0.05, help='批次之间暂停的秒数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+
+
+def run(args):
+    """
+    执行清理
+    :return: 统计信息字典
+    """
+    retention = timedelta(days=args.retention_days)
+    if retention.total_seconds() < config.SMS_CODE_TTL_SECONDS:
+        raise ValueError("保留期不能短于验证码有效期")
+    cutoff = datetime.utcnow() - retention
+
+    table_rows_before = count_sms_codes()
+    eligible = count_sms_codes(before=cutoff)
+    stats = {
+        'cutoff': cutoff.isoformat() + 'Z',
+        'table_rows_before': table_rows_before,
+        'eligible': eligible,
+        'deleted': 0,
+        'batches': 0,
+        'elapsed_seconds': 0.0,
+        'rows_per_second': 0.0,
+    }
+    if args.dry_run or not eligible:
+        stats['dry_run'] = args.dry_run
+        return stats
+
+    min_id, max_id = get_sms_code_id_range(cutoff)
+    start = time.monotonic()
+    start_id = min_id
+    while start_id is not None and start_id <= max_id:
+        end_id = start_id + args.batch_size
+        batch_start = time.monotonic()
+        deleted = delete_sms_codes_in_id_range(start_id, end_id, cutoff)
+        metrics.observe('sms_purge.batch', time.monotonic() - batch_start)
+        metrics.incr('sms_purge.deleted', deleted)
+
+        stats['deleted'] += deleted
+        stats['batches'] += 1
+        start_id = end_id
+        if stats['batches'] % 100 == 0:
+            logger.info("验证码清理进度: 已删除 %d / %d 行, 当前ID %d / %d",
+                        stats['deleted'], eligible, start_id, max_id)
+        if args.sleep > 0 and start_id <= max_id:
+            time.sleep(args.sleep)
+
+    elapsed = time.monotonic() - start
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['deleted'] / elapsed, 1) if elapsed > 0 else 0.0
+    stats['table_rows_after'] = count_sms_codes()
+    stats['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+    save_job_checkpoint(JOB_NAME, None, stats)
+    logger.info("验证码清理完成: %s", stats)
+    return stats
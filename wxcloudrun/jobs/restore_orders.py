@@ -0,0 +1,65 @@
+"""
+订单归档恢复任务
+把 archive-orders 任务生成的归档文件中的订单及照片记录写回数据库：
+--name 指定归档文件名（先在 ORDER_ARCHIVE_DIR 中查找，不存在时从 COS 下载），或用 --file 指定本地文件。
+
+- 按批写入（每批一个事务），数据库中已存在的订单保持不变，重复执行不会产生重复记录
+- 恢复后照片不再登记在 archived_photo_files 中
+- 恢复的订单创建时间较早，列表接口需要用 created_from 参数查询
+"""
+import logging
+import os
+from datetime import datetime
+from wxcloudrun import order_archive
+from wxcloudrun.dao import transaction, restore_archived_orders
+from wxcloudrun.cos_storage import download_file_from_cos
+
+logger = logging.getLogger('log')
+
+
+def add_arguments(parser):
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--name', help='归档文件名，如 battery_orders_2024-01_20250201030000.jsonl.gz')
+    group.add_argument('--file', help='本地归档文件路径')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批写入的订单数')
+
+
+def _resolve_path(args):
+    if args.file:
+        return args.file
+    path = order_archive.local_path(args.name)
+    if not os.path.isfile(path):
+        if not download_file_from_cos(order_archive.cos_key(args.name), path):
+            raise RuntimeError("归档文件不存在: {}".format(args.name))
+    return path
+
+
+def run(args):
+    """
+    执行恢复
+    :return: 统计信息字典
+    """
+    path = _resolve_path(args)
+    stats = {'file': path, 'orders': 0, 'orders_restored': 0, 'photos_restored': 0}
+    orders, photos = [], []
+
+    def flush():
+        with transaction():
+            restored_orders, restored_photos = restore_archived_orders(orders, photos)
+        stats['orders_restored'] += restored_orders
+        stats['photos_restored'] += restored_photos
+        del orders[:]
+        del photos[:]
+
+    for order, order_photos in order_archive.read_archive(path):
+        orders.append(order)
+        photos.extend(order_photos)
+        stats['orders'] += 1
+        if len(orders) >= args.batch_size:
+            flush()
+    if orders:
+        flush()
+
+    stats['finished_at'] = datetime.utcnow().isoformat() + 'Z'
+    logger.info("订单归档恢复完成: %s", stats)
+    return stats
@@ -0,0 +1,120 @@
+"""
+照片存储类型分层任务
+照片上传时为标准存储，订单完成或超过一段时间后基本不再查看，该任务批量降低这些照片的 COS 存储类型：
+
+- 标准存储 -> 低频存储：订单创建超过 --ia-days 天，或订单已完成/已取消
+- 低频存储（或标准存储）-> 归档存储：订单创建超过 --archive-days 天
+- 存储类型通过复制到同一个 Key 修改，保留 x-cos-meta-fileid 元数据；
+  数据库 storage_class 按批更新，生成下载URL时据此判断归档文件是否需要先取回
+- 可恢复：每批处理完成后保存检查点（最后处理的照片ID），全部处理完成后清空检查点
+
+注意 COS 低频存储最少按 30 天、归档存储最少按 90 天计费，--ia-days / --archive-days 不宜过小
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from wxcloudrun.dao import (
+    get_photos_for_tiering, update_photo_storage_classes,
+    get_job_checkpoint, save_job_checkpoint
+)
+from wxcloudrun.cos_storage import (
+    change_storage_class, extract_cos_key_from_file_path, cos_breaker,
+    STORAGE_CLASS_STANDARD_IA, STORAGE_CLASS_ARCHIVE
+)
+
+logger = logging.getLogger('log')
+
+JOB_NAME = 'tier_photo_storage'
+
+# 订单终态：照片不再需要频繁查看
+TERMINAL_ORDER_STATUSES = ('completed', 'cancelled')
+
+
+def add_arguments(parser):
+    parser.add_argument('--ia-days', type=int, default=30, help='订单创建超过多少天转为低频存储')
+    parser.add_argument('--archive-days', type=int, default=180, help='订单创建超过多少天转为归档存储，0 表示不归档')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批处理的照片数')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发修改存储类型的数量')
+    parser.add_argument('--max-batches', type=int, default=0, help='最多处理的批数，0 表示不限')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头开始')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不修改')
+
+
+def _target_storage_class(order_created_at, archive_cutoff):
+    if archive_cutoff is not None and order_created_at < archive_cutoff:
+        return STORAGE_CLASS_ARCHIVE
+    return STORAGE_CLASS_STANDARD_IA
+
+
+def _change_one(item):
+    """
+    修改单张照片的存储类型（在线程池中执行，不访问数据库）
+    :return: (photo_id, 修改后的存储类型或 None)
+    """
+    photo_id, cos_key, storage_class = item
+    return photo_id, change_storage_class(cos_key, storage_class)
+
+
+def run(args):
+    """
+    执行分层
+    :return: 统计信息字典
+    """
+    now = datetime.utcnow()
+    ia_cutoff = now - timedelta(days=args.ia_days)
+    archive_cutoff = now - timedelta(days=args.archive_days) if args.archive_days > 0 else None
+
+    checkpoint = None if args.restart or args.dry_run else get_job_checkpoint(JOB_NAME)
+    after_id = (checkpoint.position if checkpoint and checkpoint.position else '')
+    stats = dict(checkpoint.state) if checkpoint and checkpoint.position and checkpoint.state else {
+        STORAGE_CLASS_STANDARD_IA: 0, STORAGE_CLASS_ARCHIVE: 0, 'skipped': 0, 'failed': 0,
+    }
+    if after_id:
+        logger.info("从检查点继续分层: after_id=%s, 已处理=%s", after_id, stats)
+
+    batches = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        while True:
+            if args.max_batches and batches >= args.max_batches:
+                break
+            if cos_breaker.state == 'open':
+                logger.error("COS 熔断器已打开，停止分层，检查点: %s", after_id)
+                break
+
+            rows = get_photos_for_tiering(
+                after_id, ia_cutoff, archive_cutoff, TERMINAL_ORDER_STATUSES, args.batch_size
+            )
+            if not rows:
+                if not args.dry_run:
+                    # 全部处理完成，清空检查点
+                    save_job_checkpoint(JOB_NAME, None, stats)
+                logger.info("照片存储类型分层完成: %s", stats)
+                break
+
+            items = []
+            for photo_id, file_path, storage_class, order_created_at in rows:
+                cos_key = extract_cos_key_from_file_path(file_path)
+                if not cos_key:
+                    stats['skipped'] += 1
+                    continue
+                items.append((photo_id, cos_key, _target_storage_class(order_created_at, archive_cutoff)))
+
+            if args.dry_run:
+                for _, _, storage_class in items:
+                    stats[storage_class] += 1
+            else:
+                changed = [(photo_id, storage_class)
+                           for photo_id, storage_class in executor.map(_change_one, items) if storage_class]
+                update_photo_storage_classes(changed)
+                for _, storage_class in changed:
+                    stats[storage_class] += 1
+                stats['failed'] += len(items) - len(changed)
+
+            after_id = rows[-1][0]
+            if not args.dry_run:
+                save_job_checkpoint(JOB_NAME, after_id, stats)
+            batches += 1
+            logger.info("分层批次 %d 完成: 本批 %d 张，累计 %s", batches, len(rows), stats)
+
+    stats['dry_run'] = args.dry_run
+    return stats
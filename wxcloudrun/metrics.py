@@ -0,0 +1,96 @@
+"""
+进程内运行指标
+提供计数器、耗时统计和状态快照，通过 /api/admin/metrics 输出用于监控
+"""
+import threading
+from collections import deque
+
+# 每个耗时指标保留的最近样本数（用于计算分位数）
+TIMING_SAMPLE_SIZE = 1000
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+
+def incr(name, value=1):
+    """
+    计数器累加
+    :param name: 指标名
+    :param value: 增量
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """
+    记录一次耗时
+    :param name: 指标名
+    :param seconds: 耗时（秒）
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=TIMING_SAMPLE_SIZE)}
+            _timings[name] = timing
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['samples'].append(seconds)
+
+
+def register_gauge(name, func):
+    """
+    注册状态指标，输出快照时调用 func() 取值
+    :param name: 指标名
+    :param func: 无参函数，返回可 JSON 序列化的值
+    """
+    with _lock:
+        _gauges[name] = func
+
+
+def _percentile(sorted_samples, percent):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(percent / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def snapshot():
+    """
+    获取所有指标的快照
+    :return: {'counters': {...}, 'timings': {...}, 'gauges': {...}}，耗时单位为毫秒
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: (timing['count'], timing['total'], timing['max'], sorted(timing['samples']))
+            for name, timing in _timings.items()
+        }
+        gauges = dict(_gauges)
+
+    timing_data = {}
+    for name, (count, total, max_value, samples) in timings.items():
+        timing_data[name] = {
+            'count': count,
+            'avg_ms': round(total / count * 1000, 3) if count else 0.0,
+            'max_ms': round(max_value * 1000, 3),
+            'p50_ms': round(_percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 3),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 3),
+        }
+
+    gauge_data = {}
+    for name, func in gauges.items():
+        try:
+            gauge_data[name] = func()
+        except Exception as e:
+            gauge_data[name] = {'error': str(e)}
+
+    return {
+        'counters': counters,
+        'timings': timing_data,
+        'gauges': gauge_data,
+    }
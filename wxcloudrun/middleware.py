@@ -1,12 +1,17 @@
 """
 认证中间件
 """
+import logging
 import jwt
 from functools import wraps
+import config
 from flask import request, redirect, url_for
+from wxcloudrun.token_cache import user_tokens, admin_tokens
 from wxcloudrun.handlers.admin_handler import JWT_SECRET, JWT_ALGORITHM
 from wxcloudrun.handlers.auth_handler import USER_JWT_SECRET, USER_JWT_ALGORITHM
 
+logger = logging.getLogger('log')
+
 def require_admin_auth(f):
     """
     管理员认证装饰器
@@ -38,7 +43,7 @@ def require_admin_auth(f):
         
         # 验证 token
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            payload = admin_tokens.decode(token, JWT_SECRET, JWT_ALGORITHM)
             # 检查是否是管理员
             if payload.get('role') != 'admin':
                 if request.path.startswith('/admin/') and not request.path.endswith('/login'):
@@ -75,7 +80,7 @@ def get_admin_from_request():
     
     try:
         token = auth_header.replace('Bearer ', '')
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = admin_tokens.decode(token, JWT_SECRET, JWT_ALGORITHM)
         if payload.get('role') == 'admin':
             return payload
     except:
@@ -91,57 +96,46 @@ def require_user_auth(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        import logging
-        logger = logging.getLogger('log')
-        
         # 从请求头获取 token
         auth_header = request.headers.get('Authorization')
-        logger.info("🔍 [认证] 检查 Authorization 头: %s", auth_header[:30] + '...' if auth_header else 'None')
-        
         if not auth_header:
-            logger.warning("⚠️ [认证] 未找到 Authorization 头")
+            logger.debug("[认证] 未找到 Authorization 头: %s", request.path)
             from wxcloudrun.response import make_err_response
             return make_err_response("未授权，请先登录"), 401
         
         # 提取 token
-        try:
-            token = auth_header.replace('Bearer ', '').strip()
-            logger.info("🔑 [认证] 提取 token: %s...", token[:20] if token else 'None')
-        except Exception as e:
-            logger.error("❌ [认证] 提取 token 失败: %s", str(e))
-            token = None
-        
+        token = auth_header.replace('Bearer ', '').strip()
         if not token:
-            logger.warning("⚠️ [认证] token 为空")
+            logger.debug("[认证] token 为空: %s", request.path)
             from wxcloudrun.response import make_err_response
             return make_err_response("无效的 token"), 401
         
-        # 验证 token
+        # 验证 token（已验证过的 token 命中缓存时跳过签名校验）
         try:
-            payload = jwt.decode(token, USER_JWT_SECRET, algorithms=[USER_JWT_ALGORITHM])
-            logger.info("✅ [认证] Token 验证成功: user_id=%s, role=%s", payload.get('user_id'), payload.get('role'))
-            
-            # 检查是否是用户
-            if payload.get('role') != 'user':
-                logger.warning("⚠️ [认证] 角色不匹配: %s", payload.get('role'))
-                from wxcloudrun.response import make_err_response
-                return make_err_response("权限不足"), 403
-            
-            # 将用户信息添加到 request
-            request.user = payload
-            return f(*args, **kwargs)
+            payload = user_tokens.decode(token, USER_JWT_SECRET, USER_JWT_ALGORITHM)
         except jwt.ExpiredSignatureError:
-            logger.warning("⚠️ [认证] Token 已过期")
+            logger.debug("[认证] Token 已过期: %s", request.path)
             from wxcloudrun.response import make_err_response
             return make_err_response("Token 已过期，请重新登录"), 401
         except jwt.InvalidTokenError as e:
-            logger.error("❌ [认证] Token 无效: %s", str(e))
+            logger.warning("[认证] Token 无效: %s, %s", request.path, str(e))
             from wxcloudrun.response import make_err_response
             return make_err_response("无效的 token"), 401
         except Exception as e:
             logger.error("❌ [认证] Token 验证异常: %s", str(e))
             from wxcloudrun.response import make_err_response
             return make_err_response("认证失败"), 401
+        
+        # 检查是否是用户
+        if payload.get('role') != 'user':
+            logger.warning("⚠️ [认证] 角色不匹配: %s", payload.get('role'))
+            from wxcloudrun.response import make_err_response
+            return make_err_response("权限不足"), 403
+        
+        logger.debug("[认证] user_id=%s", payload.get('user_id'))
+        # 将用户信息添加到 request
+        request.user = payload
+        return f(*args, **kwargs)
     
     return decorated_function
 
@@ -157,7 +151,7 @@ def get_user_from_request():
     
     try:
         token = auth_header.replace('Bearer ', '')
-        payload = jwt.decode(token, USER_JWT_SECRET, algorithms=[USER_JWT_ALGORITHM])
+        payload = user_tokens.decode(token, USER_JWT_SECRET, USER_JWT_ALGORITHM)
         if payload.get('role') == 'user':
             return payload
     except:
@@ -165,3 +159,113 @@ def get_user_from_request():
     
     return None
 
+
+def limit_content_length(max_bytes):
+    """
+    请求体大小限制装饰器
+    在解析表单之前根据 Content-Length 拒绝超限请求；
+    未声明长度的请求（chunked）在解析时按该上限截断（Flask 3.1+），否则由全局 MAX_CONTENT_LENGTH 兜底
+    :param max_bytes: 请求体大小上限（字节）
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            content_length = request.content_length
+            if content_length is not None and content_length > max_bytes:
+                from wxcloudrun.response import make_err_response
+                return make_err_response(
+                    "请求体过大，最大允许 {} MB".format(max_bytes // (1024 * 1024)), 413
+                ), 413
+            
+            try:
+                request.max_content_length = max_bytes
+            except AttributeError:
+                pass
+            return f(*args, **kwargs)
+        
+        return decorated_function
+    
+    return decorator
+
+
+def get_client_ip():
+    """
+    获取客户端IP
+    X-Forwarded-For 前面的条目由客户端填写、可以伪造，只信任网关追加在末尾的 TRUSTED_PROXY_HOPS 个条目：
+    取倒数第 TRUSTED_PROXY_HOPS 个；条目不足或未配置时使用连接的对端地址
+    :return: IP 字符串
+    """
+    hops = config.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        entries = [item.strip() for item in request.headers.get('X-Forwarded-For', '').split(',') if item.strip()]
+        if len(entries) >= hops:
+            return entries[-hops]
+    return request.remote_addr or ''
+
+
+def _get_request_phone():
+    # 短信相关接口的手机号在请求体 phone 字段，注册接口在 user_info.contact_phone
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None
+    phone = data.get('phone')
+    if not phone and isinstance(data.get('user_info'), dict):
+        phone = data['user_info'].get('contact_phone')
+    return str(phone).strip() if phone else None
+
+
+def rate_limit(name, rules):
+    """
+    令牌桶限流装饰器
+    在访问数据库之前按手机号、IP、全局规则限流，超限返回 429 和 Retry-After
+    :param name: 限流名称
+    :param rules: 规则字符串，如 "phone:1/60,ip:10/60,global:200/60"（见 rate_limit 模块）
+    """
+    from wxcloudrun import rate_limit as limiter
+    parsed_rules = limiter.parse_rules(rules)
+    
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if parsed_rules:
+                wait = limiter.check(name, parsed_rules, {
+                    'phone': _get_request_phone(),
+                    'ip': get_client_ip(),
+                })
+                if wait:
+                    from wxcloudrun.response import make_err_response
+                    response = make_err_response("请求过于频繁，请{}秒后再试".format(wait), 429)
+                    response.headers['Retry-After'] = str(wait)
+                    return response, 429
+            return f(*args, **kwargs)
+        
+        return decorated_function
+    
+    return decorator
+
+
+def idempotent(scope):
+    """
+    幂等键装饰器
+    请求头带 Idempotency-Key 时，相同 Key 的重复请求回放第一次的响应，不重复执行（见 idempotency 模块）；
+    不带该请求头的请求按原样处理
+    :param scope: 接口名
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if key is None:
+                return f(*args, **kwargs)
+            from wxcloudrun import idempotency
+            key = key.strip()
+            if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+                from wxcloudrun.response import make_err_response
+                return make_err_response(
+                    "无效的 Idempotency-Key（长度 1-{}）".format(idempotency.MAX_KEY_LENGTH), 400
+                ), 400
+            return idempotency.execute(scope, key, lambda: f(*args, **kwargs))
+        
+        return decorated_function
+    
+    return decorator
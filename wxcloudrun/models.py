@@ -1,11 +1,42 @@
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, BigInteger, ForeignKey, CheckConstraint
+from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, BigInteger, ForeignKey, CheckConstraint, Index
+from sqlalchemy.types import TypeDecorator, BINARY
 from sqlalchemy.dialects.mysql import JSON
 from sqlalchemy.orm import relationship
 from wxcloudrun import db
+from wxcloudrun.utils import generate_time_ordered_id
 import uuid as uuid_lib
 
 
+class BinaryUUID(TypeDecorator):
+    """
+    UUID 以 BINARY(16) 存储，Python 侧读写标准格式的字符串（与 CHAR(36) 时的接口一致）
+    查询参数不是合法 UUID 时按 NULL 处理，不匹配任何记录
+    """
+    impl = BINARY
+    cache_ok = True
+
+    def __init__(self):
+        super().__init__(16)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid_lib.UUID):
+            return value.bytes
+        if isinstance(value, bytes) and len(value) == 16:
+            return value
+        try:
+            return uuid_lib.UUID(str(value)).bytes
+        except ValueError:
+            return None
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid_lib.UUID(bytes=bytes(value)))
+
+
 # 用户注册表
 class UserRegistration(db.Model):
     __tablename__ = 'user_registrations'
@@ -22,7 +53,7 @@ class UserRegistration(db.Model):
     contact_phone = Column(String(20), nullable=False)
     address = Column(String(300), nullable=False)
     business_license_path = Column(Text, nullable=True)
-    status = Column(String(20), default='pending', nullable=False, index=True)
+    status = Column(String(20), default='pending', nullable=False)
     submit_time = Column(DateTime, nullable=False)
     review_time = Column(DateTime, nullable=True)
     review_comment = Column(Text, nullable=True)
@@ -31,6 +62,9 @@ class UserRegistration(db.Model):
     
     __table_args__ = (
         CheckConstraint("status IN ('pending', 'approved', 'rejected')", name='chk_status'),
+        Index('idx_user_registrations_phone_created', 'contact_phone', 'created_at'),
+        Index('idx_user_registrations_status', 'status', 'submit_time'),
+        Index('idx_user_registrations_submit_time', 'submit_time'),
     )
 
 
@@ -63,7 +97,7 @@ class UserRole(db.Model):
 class BatteryUploadOrder(db.Model):
     __tablename__ = 'battery_upload_orders'
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid_lib.uuid4()))
+    id = Column(BinaryUUID(), primary_key=True, default=generate_time_ordered_id)  # UUIDv7，按创建时间递增
     user_id = Column(String(50), nullable=False, index=True)
     store_name = Column(String(255), nullable=False)
     contact_name = Column(String(100), nullable=False)
@@ -76,6 +110,7 @@ class BatteryUploadOrder(db.Model):
     batteries = Column(JSON, nullable=True)  # 电池列表JSON数据
     total_price = Column(String(50), nullable=True)  # 总价格（字符串格式，支持小数）
     total_weight = Column(String(50), nullable=True)  # 总重量（字符串格式，支持小数）
+    version = Column(Integer, default=1, nullable=False)  # 乐观锁版本号，每次更新加 1
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -87,16 +122,38 @@ class BatteryUploadOrder(db.Model):
 class BatteryUploadPhoto(db.Model):
     __tablename__ = 'battery_upload_photos'
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid_lib.uuid4()))
-    order_id = Column(String(36), ForeignKey('battery_upload_orders.id', ondelete='CASCADE'), nullable=False, index=True)
+    id = Column(BinaryUUID(), primary_key=True, default=generate_time_ordered_id)  # UUIDv7，按创建时间递增
+    order_id = Column(BinaryUUID(), ForeignKey('battery_upload_orders.id', ondelete='CASCADE'), nullable=False, index=True)
     user_id = Column(String(50), nullable=False, index=True)
+    openid = Column(String(64), nullable=True)  # 上传者 openid（生成 COS 文件元数据），管理端上传为空
     filename = Column(String(255), nullable=False)
     original_filename = Column(String(255), nullable=False)
     file_path = Column(Text, nullable=False)
     file_size = Column(BigInteger, nullable=False)
     mime_type = Column(String(100), nullable=False)
     upload_index = Column(Integer, nullable=False)
+    storage = Column(String(10), default='cos', nullable=False)  # cos-对象存储, local-本地回退存储
+    storage_class = Column(String(20), default='STANDARD', nullable=False)  # COS 存储类型：STANDARD, STANDARD_IA, ARCHIVE
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_battery_upload_photos_storage', 'storage', 'created_at'),
+        Index('idx_battery_upload_photos_user_created', 'user_id', 'created_at', 'id'),
+        Index('idx_battery_upload_photos_created', 'created_at', 'id'),
+        Index('idx_battery_upload_photos_filename', 'filename'),
+        Index('idx_battery_upload_photos_storage_class', 'storage', 'storage_class', 'id'),
+    )
+
+
+# 已归档照片文件表（照片记录随订单归档后，孤儿清理任务据此保留存储中的文件）
+class ArchivedPhotoFile(db.Model):
+    __tablename__ = 'archived_photo_files'
+    
+    photo_id = Column(BinaryUUID(), primary_key=True)
+    filename = Column(String(255), nullable=False, index=True)
+    file_path = Column(Text, nullable=False)
+    archive_name = Column(String(100), nullable=False, index=True)  # 归档文件名
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 # 用户表（用于短信验证码登录）
@@ -119,4 +176,35 @@ class SmsCode(db.Model):
     sent_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     used_at = Column(DateTime, nullable=True)
     ip_address = Column(String(45), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)  # 验证码输入错误次数
 
+
+
+# 后台任务检查点表
+class JobCheckpoint(db.Model):
+    __tablename__ = 'job_checkpoints'
+    
+    job_name = Column(String(100), primary_key=True)
+    position = Column(String(255), nullable=True)  # 已处理到的位置（如最后处理的记录ID）
+    state = Column(JSON, nullable=True)  # 任务统计等附加状态
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+# 幂等键表（重试的请求回放第一次的响应）
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    scope = Column(String(50), nullable=False)  # 接口名
+    idempotency_key = Column(String(100), nullable=False)  # 客户端传入的 Idempotency-Key
+    fingerprint = Column(String(64), nullable=False)  # 请求内容摘要，同一个 Key 用于不同请求时拒绝
+    status = Column(String(20), default='processing', nullable=False)  # processing-处理中, completed-已完成
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # 处理中的租约到期时间，到期后可由重试接管
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        Index('uk_idempotency_keys_scope_key', 'scope', 'idempotency_key', unique=True),
+    )
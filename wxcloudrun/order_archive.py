@@ -0,0 +1,91 @@
+"""
+订单归档文件
+每个归档文件对应一个自然月创建的订单，gzip 压缩的 JSONL：每行一个订单
+{"order": {订单表字段}, "photos": [{照片表字段}, ...]}，时间字段为 ISO 8601（UTC，不带时区）。
+文件名形如 battery_orders_2024-01_20250201030000.jsonl.gz（月份_归档时间），
+本地保存在 ORDER_ARCHIVE_DIR，同时上传到 COS 的 archives/orders/ 前缀下（低频存储）。
+"""
+import gzip
+import json
+import os
+from datetime import datetime
+from sqlalchemy import DateTime
+import config
+from wxcloudrun.models import BatteryUploadOrder, BatteryUploadPhoto
+
+COS_PREFIX = 'archives/orders/'
+
+FILE_PREFIX = 'battery_orders_'
+FILE_SUFFIX = '.jsonl.gz'
+
+
+def archive_name(month_start, archived_at):
+    """
+    生成归档文件名
+    :param month_start: 归档月份的第一天
+    :param archived_at: 归档时间
+    :return: 文件名
+    """
+    return '{}{}_{}{}'.format(FILE_PREFIX, month_start.strftime('%Y-%m'), archived_at.strftime('%Y%m%d%H%M%S'), FILE_SUFFIX)
+
+
+def local_path(name):
+    return os.path.join(config.ORDER_ARCHIVE_DIR, name)
+
+
+def cos_key(name):
+    return COS_PREFIX + name
+
+
+def _to_dict(model, entity):
+    data = {}
+    for column in model.__table__.columns:
+        value = getattr(entity, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[column.key] = value
+    return data
+
+
+def _from_dict(model, data):
+    # 只取表中存在的字段，时间字段还原为 datetime
+    row = {}
+    for column in model.__table__.columns:
+        if column.key not in data:
+            continue
+        value = data[column.key]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.key] = value
+    return row
+
+
+def serialize_order(order, photos):
+    """
+    序列化一个订单及其照片为一行 JSON
+    :param order: BatteryUploadOrder 实体
+    :param photos: 该订单的 BatteryUploadPhoto 列表
+    :return: JSON 字符串（不含换行）
+    """
+    return json.dumps({
+        'order': _to_dict(BatteryUploadOrder, order),
+        'photos': [_to_dict(BatteryUploadPhoto, photo) for photo in photos],
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def read_archive(path):
+    """
+    逐行读取归档文件
+    :param path: 文件路径
+    :return: 生成器，每项为 (订单字段字典, 照片字段字典列表)
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield (
+                _from_dict(BatteryUploadOrder, item['order']),
+                [_from_dict(BatteryUploadPhoto, photo) for photo in item.get('photos', [])],
+            )
@@ -0,0 +1,197 @@
+"""
+令牌桶限流
+规则格式为 "scope:count/seconds"，多条规则用逗号分隔，如 "phone:1/60,ip:10/60,global:200/60"：
+桶容量为 count，每 seconds 秒匀速补满。scope 取值：
+- phone：请求体中的手机号（phone 或 user_info.contact_phone）
+- ip：客户端IP
+- global：该接口全局
+后端通过 RATE_LIMIT_BACKEND 选择：memory（进程内）或 redis（多实例共享，需要安装 redis 包）；
+memory 后端每个实例各自计数，N 个实例时实际限额放宽为 N 倍
+"""
+import logging
+import math
+import threading
+import time
+import config
+from wxcloudrun import metrics
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖，只有 RATE_LIMIT_BACKEND=redis 时需要
+    redis = None
+
+logger = logging.getLogger('log')
+
+SCOPES = ('phone', 'ip', 'global')
+
+
+def parse_rules(value):
+    """
+    解析限流规则
+    :param value: 规则字符串，如 "phone:1/60,ip:10/60"
+    :return: [(scope, 容量, 每秒补充的令牌数), ...]
+    """
+    rules = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        scope, _, rate = item.partition(':')
+        count, _, seconds = rate.partition('/')
+        scope = scope.strip()
+        if scope not in SCOPES:
+            raise ValueError("未知的限流范围: {}".format(scope))
+        capacity, period = int(count), float(seconds)
+        if capacity <= 0 or period <= 0:
+            raise ValueError("无效的限流规则: {}".format(item))
+        rules.append((scope, capacity, capacity / period))
+    return rules
+
+
+class MemoryRateLimiter:
+    """进程内令牌桶（线程安全），长时间未使用的桶定期清理"""
+
+    # 每处理多少次请求清理一次空闲的桶
+    SWEEP_INTERVAL = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [令牌数, 上次更新时间, 补满所需秒数]
+        self._calls = 0
+
+    def _sweep(self, now):
+        # 调用方需持有锁；已经补满的桶与不存在等价，直接删除
+        idle = [key for key, (_, updated_at, full_after) in self._buckets.items() if now - updated_at >= full_after]
+        for key in idle:
+            del self._buckets[key]
+
+    def acquire_all(self, buckets):
+        """
+        从多个桶中各获取一个令牌：全部有令牌时才扣减，任一桶不足则都不扣减
+        :param buckets: [(桶的 Key, 桶容量, 每秒补充的令牌数), ...]
+        :return: 需要等待的秒数（不足的桶中最长的），0 表示放行
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.SWEEP_INTERVAL == 0:
+                self._sweep(now)
+            current = []
+            wait = 0
+            for key, capacity, refill_rate in buckets:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    tokens = float(capacity)
+                else:
+                    tokens = min(float(capacity), bucket[0] + (now - bucket[1]) * refill_rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / refill_rate)
+                current.append((key, tokens, capacity / refill_rate))
+            cost = 1 if wait == 0 else 0
+            for key, tokens, full_after in current:
+                self._buckets[key] = [tokens - cost, now, full_after]
+            return wait
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class RedisRateLimiter:
+    """Redis 令牌桶：每个桶一个 Hash（tokens、updated_at），使用 WATCH/MULTI 乐观事务更新"""
+
+    KEY_PREFIX = 'ratelimit:'
+
+    # 乐观事务冲突时的最多重试次数
+    MAX_WATCH_RETRIES = 5
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis 需要安装 redis 包")
+        self._client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1, socket_connect_timeout=1)
+
+    def acquire_all(self, buckets):
+        keys = [self.KEY_PREFIX + key for key, _, _ in buckets]
+        for _ in range(self.MAX_WATCH_RETRIES):
+            with self._client.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(*keys)
+                    # 使用 Redis 服务器时间，多个实例之间不受本机时钟影响
+                    seconds, microseconds = pipe.time()
+                    now = seconds + microseconds / 1e6
+                    current = []
+                    wait = 0
+                    for key, (_, capacity, refill_rate) in zip(keys, buckets):
+                        bucket = pipe.hgetall(key)
+                        if bucket:
+                            elapsed = max(0.0, now - float(bucket['updated_at']))
+                            tokens = min(float(capacity), float(bucket['tokens']) + elapsed * refill_rate)
+                        else:
+                            tokens = float(capacity)
+                        if tokens < 1:
+                            wait = max(wait, (1 - tokens) / refill_rate)
+                        current.append((key, tokens, int(math.ceil(capacity / refill_rate)) + 1))
+                    cost = 1 if wait == 0 else 0
+                    pipe.multi()
+                    for key, tokens, ttl in current:
+                        pipe.hset(key, mapping={'tokens': tokens - cost, 'updated_at': now})
+                        pipe.expire(key, ttl)
+                    pipe.execute()
+                    return wait
+                except redis.WatchError:
+                    continue
+        # 冲突过多说明这些桶被高频访问，按拒绝处理
+        return max(1 / refill_rate for _, _, refill_rate in buckets)
+
+
+_limiter = None
+_init_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    获取限流器（首次使用时按配置创建）
+    :return: 限流器实例
+    """
+    global _limiter
+    if _limiter is None:
+        with _init_lock:
+            if _limiter is None:
+                if config.RATE_LIMIT_BACKEND == 'redis':
+                    _limiter = RedisRateLimiter(config.RATE_LIMIT_REDIS_URL)
+                else:
+                    limiter = MemoryRateLimiter()
+                    metrics.register_gauge('rate_limit.memory_buckets', limiter.size)
+                    _limiter = limiter
+    return _limiter
+
+
+def check(name, rules, values):
+    """
+    按规则检查所有桶，全部放行时才各扣减一个令牌（被拒绝的请求不消耗其他规则的令牌）
+    :param name: 限流名称（通常为接口名）
+    :param rules: parse_rules 的结果
+    :param values: {'phone': ..., 'ip': ...}，值为空的范围跳过
+    :return: 需要等待的秒数（向上取整），0 表示放行
+    """
+    buckets = []
+    for index, (scope, capacity, refill_rate) in enumerate(rules):
+        value = 'all' if scope == 'global' else values.get(scope)
+        if not value:
+            continue
+        # 同一范围可以有多条规则（如每分钟 1 次、每小时 10 次），各自使用独立的桶
+        buckets.append(('{}:{}{}:{}'.format(name, scope, index, value), capacity, refill_rate))
+    if not buckets:
+        return 0
+    try:
+        wait = get_limiter().acquire_all(buckets)
+    except Exception as e:
+        # 限流后端故障时放行，不影响正常请求
+        metrics.incr('rate_limit.backend_error')
+        logger.error("限流检查失败，已放行: %s, %s", name, str(e))
+        return 0
+    if wait > 0:
+        metrics.incr('rate_limit.{}.rejected'.format(name))
+        return int(math.ceil(wait))
+    metrics.incr('rate_limit.{}.allowed'.format(name))
+    return 0
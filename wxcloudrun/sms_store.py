@@ -0,0 +1,315 @@
+"""
+短信验证码存储
+验证码有效期 5 分钟、单次使用，错误次数超过上限后作废。存储后端通过 SMS_CODE_STORE 选择：
+- mysql：sms_codes 表（默认，多实例共享）
+- redis：Redis 协议的存储（多实例共享，需要安装 redis 包），兼容 Redis 协议的本地替代服务也可以使用
+- memory：进程内 TTL 字典（只适合单实例的本地开发，多实例部署时无法跨实例校验）
+memory / redis 后端下 sms_codes 表只作为审计日志，由后台线程异步写入（SMS_AUDIT_ENABLED）
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+import config
+from wxcloudrun import metrics
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖，只有 SMS_CODE_STORE=redis 时需要
+    redis = None
+
+logger = logging.getLogger('log')
+
+# 校验结果
+VERIFY_OK = 'ok'
+VERIFY_NOT_FOUND = 'not_found'
+VERIFY_MISMATCH = 'mismatch'
+VERIFY_TOO_MANY_ATTEMPTS = 'too_many_attempts'
+
+
+class MemorySmsCodeStore:
+    """进程内 TTL 字典（线程安全），过期的验证码在访问时和定期清理时删除"""
+
+    # 每保存多少次验证码清理一次过期条目
+    SWEEP_INTERVAL = 100
+
+    def __init__(self, ttl_seconds, max_attempts):
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._codes = {}  # phone -> {'code', 'sent_at', 'expires_at', 'attempts'}
+        self._saves = 0
+
+    def _get_valid(self, phone, now):
+        # 调用方需持有锁
+        entry = self._codes.get(phone)
+        if entry is not None and entry['expires_at'] <= now:
+            del self._codes[phone]
+            return None
+        return entry
+
+    def _sweep(self, now):
+        # 调用方需持有锁
+        expired = [phone for phone, entry in self._codes.items() if entry['expires_at'] <= now]
+        for phone in expired:
+            del self._codes[phone]
+
+    def save(self, phone, code, ip_address=None):
+        """
+        保存验证码（覆盖该手机号之前的验证码）
+        :param phone: 手机号
+        :param code: 验证码
+        :param ip_address: 请求IP（只记录在审计日志中）
+        :return: 发送时间
+        """
+        now = time.monotonic()
+        sent_at = datetime.utcnow()
+        with self._lock:
+            self._codes[phone] = {
+                'code': code,
+                'sent_at': sent_at,
+                'expires_at': now + self.ttl_seconds,
+                'attempts': 0,
+            }
+            self._saves += 1
+            if self._saves % self.SWEEP_INTERVAL == 0:
+                self._sweep(now)
+        return sent_at
+
+    def verify_and_consume(self, phone, code):
+        """
+        校验验证码，正确则立即作废（单次使用）；错误次数达到上限后作废
+        :param phone: 手机号
+        :param code: 用户输入的验证码
+        :return: 校验结果（VERIFY_*）
+        """
+        with self._lock:
+            entry = self._get_valid(phone, time.monotonic())
+            if entry is None:
+                return VERIFY_NOT_FOUND
+            if entry['code'] == code:
+                del self._codes[phone]
+                return VERIFY_OK
+            entry['attempts'] += 1
+            if entry['attempts'] >= self.max_attempts:
+                del self._codes[phone]
+                return VERIFY_TOO_MANY_ATTEMPTS
+            return VERIFY_MISMATCH
+
+    def size(self):
+        with self._lock:
+            return len(self._codes)
+
+
+class RedisSmsCodeStore:
+    """
+    Redis 存储：每个手机号一个 Hash（code、sent_at、attempts），由 Redis 过期删除；
+    校验使用 WATCH/MULTI 乐观事务，同一个验证码并发校验只有一个成功
+    """
+
+    KEY_PREFIX = 'sms:code:'
+
+    # 乐观事务冲突时的最多重试次数
+    MAX_WATCH_RETRIES = 5
+
+    def __init__(self, url, ttl_seconds, max_attempts):
+        if redis is None:
+            raise RuntimeError("SMS_CODE_STORE=redis 需要安装 redis 包")
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self._client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1, socket_connect_timeout=1)
+
+    def _key(self, phone):
+        return self.KEY_PREFIX + phone
+
+    def save(self, phone, code, ip_address=None):
+        sent_at = datetime.utcnow()
+        key = self._key(phone)
+        pipe = self._client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={'code': code, 'sent_at': sent_at.isoformat(), 'attempts': 0})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+        return sent_at
+
+    def verify_and_consume(self, phone, code):
+        key = self._key(phone)
+        for _ in range(self.MAX_WATCH_RETRIES):
+            with self._client.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(key)
+                    entry = pipe.hgetall(key)
+                    if not entry or 'code' not in entry:
+                        return VERIFY_NOT_FOUND
+                    attempts = int(entry.get('attempts', 0)) + 1
+                    pipe.multi()
+                    if entry['code'] == code:
+                        pipe.delete(key)
+                        result = VERIFY_OK
+                    elif attempts >= self.max_attempts:
+                        pipe.delete(key)
+                        result = VERIFY_TOO_MANY_ATTEMPTS
+                    else:
+                        pipe.hincrby(key, 'attempts', 1)
+                        result = VERIFY_MISMATCH
+                    pipe.execute()
+                    return result
+                except redis.WatchError:
+                    # 其他请求同时修改了该验证码，重新读取
+                    continue
+        return VERIFY_NOT_FOUND
+
+
+class MysqlSmsCodeStore:
+    """
+    sms_codes 表存储
+    只校验该手机号最后发送的验证码（与其他后端覆盖旧验证码一致）：校验成功只需一条条件 UPDATE；
+    校验失败再用一条 UPDATE 累加错误次数，达到上限时返回 VERIFY_TOO_MANY_ATTEMPTS，之后该验证码不再匹配
+    """
+
+    def __init__(self, ttl_seconds, max_attempts):
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+
+    def save(self, phone, code, ip_address=None):
+        from wxcloudrun.dao import create_sms_code
+        return create_sms_code(phone, code, ip_address).sent_at
+
+    def verify_and_consume(self, phone, code):
+        from wxcloudrun.dao import consume_sms_code, record_sms_code_failure
+        if consume_sms_code(phone, code, self.ttl_seconds, self.max_attempts):
+            return VERIFY_OK
+        attempts = record_sms_code_failure(phone, self.ttl_seconds, self.max_attempts)
+        if not attempts:
+            return VERIFY_NOT_FOUND
+        if attempts >= self.max_attempts:
+            return VERIFY_TOO_MANY_ATTEMPTS
+        return VERIFY_MISMATCH
+
+
+class SmsAuditSink:
+    """
+    验证码审计日志：后台线程把发送和使用记录异步写入 sms_codes 表，不阻塞请求；
+    队列满时丢弃记录（计入 sms_audit.dropped 指标）
+    """
+
+    def __init__(self, max_queue_size=10000):
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sms-audit', daemon=True)
+                self._thread.start()
+
+    def _put(self, event):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            metrics.incr('sms_audit.dropped')
+
+    def record_sent(self, phone, code, ip_address, sent_at):
+        self._put(('sent', phone, code, ip_address, sent_at))
+
+    def record_used(self, phone, code, used_at):
+        self._put(('used', phone, code, None, used_at))
+
+    def _write(self, event):
+        from wxcloudrun.dao import create_sms_code, consume_sms_code
+        kind, phone, code, ip_address, at = event
+        if kind == 'sent':
+            create_sms_code(phone, code, ip_address, sent_at=at)
+        else:
+            consume_sms_code(phone, code, config.SMS_CODE_TTL_SECONDS, config.SMS_CODE_MAX_ATTEMPTS, used_at=at)
+
+    def _run(self):
+        from wxcloudrun import app
+        while True:
+            event = self._queue.get()
+            try:
+                with app.app_context():
+                    self._write(event)
+                metrics.incr('sms_audit.written')
+            except Exception as e:
+                metrics.incr('sms_audit.failed')
+                logger.error("写入验证码审计日志失败: %s", str(e))
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+_store = None
+_audit_sink = None
+_init_lock = threading.Lock()
+
+
+def get_sms_code_store():
+    """
+    获取验证码存储（首次使用时按配置创建）
+    :return: 验证码存储实例
+    """
+    global _store, _audit_sink
+    if _store is None:
+        with _init_lock:
+            if _store is None:
+                backend = config.SMS_CODE_STORE
+                ttl, max_attempts = config.SMS_CODE_TTL_SECONDS, config.SMS_CODE_MAX_ATTEMPTS
+                if backend == 'redis':
+                    store = RedisSmsCodeStore(config.SMS_REDIS_URL, ttl, max_attempts)
+                elif backend == 'memory':
+                    store = MemorySmsCodeStore(ttl, max_attempts)
+                    metrics.register_gauge('sms_code.memory_entries', store.size)
+                else:
+                    backend = 'mysql'
+                    store = MysqlSmsCodeStore(ttl, max_attempts)
+                if backend != 'mysql' and config.SMS_AUDIT_ENABLED:
+                    _audit_sink = SmsAuditSink()
+                    metrics.register_gauge('sms_audit.pending', _audit_sink.pending)
+                logger.info("短信验证码存储: %s, 审计日志: %s", backend, _audit_sink is not None)
+                _store = store
+    return _store
+
+
+def save_code(phone, code, ip_address=None):
+    """
+    保存新发送的验证码
+    :param phone: 手机号
+    :param code: 验证码
+    :param ip_address: 请求IP
+    :return: 发送时间
+    """
+    sent_at = get_sms_code_store().save(phone, code, ip_address)
+    if _audit_sink is not None:
+        _audit_sink.record_sent(phone, code, ip_address, sent_at)
+    metrics.incr('sms_code.sent')
+    return sent_at
+
+
+def verify_and_consume(phone, code):
+    """
+    校验并核销验证码
+    :param phone: 手机号
+    :param code: 用户输入的验证码
+    :return: 校验结果（VERIFY_*）
+    """
+    result = get_sms_code_store().verify_and_consume(phone, code)
+    metrics.incr(f'sms_code.verify.{result}')
+    if result == VERIFY_OK and _audit_sink is not None:
+        _audit_sink.record_used(phone, code, datetime.utcnow())
+    return result
+
+
+# 校验失败时返回给客户端的提示
+VERIFY_ERROR_MESSAGES = {
+    VERIFY_NOT_FOUND: "验证码不存在或已过期，请重新获取",
+    VERIFY_MISMATCH: "验证码错误",
+    VERIFY_TOO_MANY_ATTEMPTS: "验证码错误次数过多，请重新获取",
+}
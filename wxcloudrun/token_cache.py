@@ -0,0 +1,157 @@
+"""
+已验证 Token 缓存
+每个带 Token 的请求都要做一次 jwt.decode（HMAC 签名校验、JSON 解析、声明检查）。
+验证通过的 Token 以 SHA-256 摘要为 Key 缓存 payload 和过期时间，同一个 Token 再次出现时跳过签名校验；
+缓存条目在 Token 过期时失效，按条目数限制容量（LRU 淘汰）。
+
+撤销：revoke(token) 使单个 Token 立即失效（在其过期前一直拒绝），
+revoke_where(predicate) 按 payload 撤销（如禁用某个手机号的所有 Token）。
+撤销记录保存在进程内，多实例部署时需要各实例分别撤销。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import jwt
+import config
+from wxcloudrun import metrics
+
+
+def _digest(token):
+    # 不在内存和日志中保留 Token 原文
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class VerifiedTokenCache:
+    """
+    已验证 Token 的 LRU 缓存（线程安全）
+    用法：
+        payload = cache.decode(token, secret, algorithm)   # 与 jwt.decode 相同的异常
+    """
+
+    def __init__(self, name, max_entries):
+        """
+        :param name: 缓存名称（用于指标名）
+        :param max_entries: 最多缓存的 Token 数，0 表示不缓存（每次都校验签名）
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 摘要 -> (payload, exp)，按访问顺序排列（末尾最新）
+        self._revoked = {}  # 摘要 -> exp，过期后清理
+        self._predicates = []  # (predicate, 登记时间)，只拒绝登记之前签发的 Token
+        metrics.register_gauge(name, self.snapshot)
+
+    def _is_revoked(self, digest, payload, now):
+        # 调用方需持有锁
+        exp = self._revoked.get(digest)
+        if exp is not None:
+            if exp > now:
+                return True
+            del self._revoked[digest]
+        # iat 是整数秒，登记时间是 time.time() 的浮点数：按整秒比较，登记同一秒内之后签发的 Token 不被拒绝
+        issued_at = payload.get('iat')
+        for predicate, revoked_at in self._predicates:
+            if (issued_at is None or issued_at < int(revoked_at)) and predicate(payload):
+                return True
+        return False
+
+    def decode(self, token, secret, algorithm):
+        """
+        校验 Token，命中缓存时跳过签名校验
+        :param token: Token 字符串
+        :param secret: 签名密钥
+        :param algorithm: 签名算法
+        :return: payload 字典（副本，可以修改）
+        :raises jwt.ExpiredSignatureError: Token 已过期
+        :raises jwt.InvalidTokenError: Token 无效或已撤销
+        """
+        digest = _digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, exp = entry
+                if exp <= now:
+                    del self._entries[digest]
+                    metrics.incr(f'{self.name}.expired')
+                    raise jwt.ExpiredSignatureError("Signature has expired")
+                self._entries.move_to_end(digest)
+                metrics.incr(f'{self.name}.hit')
+                return dict(payload)
+
+        metrics.incr(f'{self.name}.miss')
+        payload = jwt.decode(token, secret, algorithms=[algorithm])
+        exp = payload.get('exp')
+        with self._lock:
+            if self._is_revoked(digest, payload, now):
+                metrics.incr(f'{self.name}.revoked')
+                raise jwt.InvalidTokenError("Token has been revoked")
+            # 没有过期时间的 Token 不缓存，避免撤销前一直有效
+            if self.max_entries > 0 and isinstance(exp, (int, float)):
+                self._entries[digest] = (payload, exp)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    metrics.incr(f'{self.name}.evicted')
+        return dict(payload)
+
+    def revoke(self, token):
+        """
+        撤销单个 Token
+        :param token: Token 字符串
+        """
+        digest = _digest(token)
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except jwt.InvalidTokenError:
+            exp = None
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if exp is None and entry is not None:
+                exp = entry[1]
+            # 无法解析过期时间的 Token 本身就无法通过校验，不需要记录
+            if isinstance(exp, (int, float)):
+                self._revoked[digest] = exp
+                now = time.time()
+                for key in [key for key, value in self._revoked.items() if value <= now]:
+                    del self._revoked[key]
+
+    def revoke_where(self, predicate):
+        """
+        撤销 payload 满足条件的所有已签发 Token（之后重新签发的 Token 不受影响，需要 payload 带 iat）
+        :param predicate: predicate(payload) -> bool
+        :return: 从缓存中移除的条目数
+        """
+        now = time.time()
+        with self._lock:
+            self._predicates.append((predicate, now))
+            matched = [digest for digest, (payload, _) in self._entries.items() if predicate(payload)]
+            for digest in matched:
+                del self._entries[digest]
+            # 撤销条件在最长的 Token 有效期之后不再有意义
+            max_age = config.AUTH_TOKEN_REVOCATION_MAX_AGE
+            self._predicates = [(p, at) for p, at in self._predicates if now - at < max_age]
+        return len(matched)
+
+    def clear(self):
+        """清空缓存（不影响撤销记录）"""
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """
+        获取缓存状态（用于监控）
+        :return: 状态字典
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'revoked': len(self._revoked),
+                'revocation_rules': len(self._predicates),
+            }
+
+
+# 用户 Token 与管理员 Token 使用不同的密钥，分别缓存
+user_tokens = VerifiedTokenCache('auth.user_token_cache', config.AUTH_TOKEN_CACHE_SIZE)
+admin_tokens = VerifiedTokenCache('auth.admin_token_cache', config.AUTH_TOKEN_CACHE_SIZE)
@@ -0,0 +1,104 @@
+"""
+进程内 TTL + LRU 缓存
+条目在写入 ttl 秒后过期，超过容量时淘汰最久未访问的条目。
+只适合缓存可以容忍短暂不一致的读结果：写操作需要调用 delete 使对应条目失效，
+多实例部署时其他实例最多在 ttl 秒后看到新值。
+读数据库之前取 generation，写入时带上：期间发生过 delete 则放弃写入，避免并发的写操作被旧值覆盖
+"""
+import threading
+import time
+from collections import OrderedDict
+from wxcloudrun import metrics
+
+# get 未命中时的返回值，用于区分“未缓存”和“缓存的值为 None”
+MISSING = object()
+
+
+class TTLCache:
+    """线程安全的 TTL + LRU 缓存"""
+
+    def __init__(self, name, max_entries, ttl):
+        """
+        :param name: 缓存名称（用于指标名）
+        :param max_entries: 最大条目数，0 表示不缓存
+        :param ttl: 条目有效期（秒）
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, 过期时间)，按访问顺序排列（末尾最新）
+        self._generation = 0  # 每次 delete / clear 递增
+        metrics.register_gauge(name, self.snapshot)
+
+    def get(self, key):
+        """
+        读取缓存
+        :param key: 缓存 Key
+        :return: 缓存的值，未命中或已过期返回 MISSING
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    metrics.incr(f'{self.name}.hit')
+                    return value
+                del self._entries[key]
+        metrics.incr(f'{self.name}.miss')
+        return MISSING
+
+    @property
+    def generation(self):
+        """当前失效计数，读数据库之前获取，传给 set"""
+        return self._generation
+
+    def set(self, key, value, generation=None, ttl=None):
+        """
+        写入缓存
+        :param key: 缓存 Key
+        :param value: 值（可以为 None）
+        :param generation: 读取 value 之前获取的 generation，之后有条目失效时放弃写入
+        :param ttl: 该条目的有效期（秒），为空时使用缓存的 ttl，0 表示不写入
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr(f'{self.name}.evicted')
+
+    def delete(self, key):
+        """
+        使条目失效
+        :param key: 缓存 Key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def snapshot(self):
+        """
+        获取缓存状态（用于监控）
+        :return: 状态字典
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+            }
@@ -1,12 +1,28 @@
+import os
 import re
+import json
 import uuid
-from datetime import datetime
+import base64
+import threading
+import time
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any, Tuple
 
 
 # 手机号验证正则表达式
 PHONE_REGEX = re.compile(r'^1[3-9]\d{9}$')
 
+# 识别图片类型需要读取的文件头长度
+IMAGE_HEADER_SIZE = 12
+
+# 分块读取上传文件的块大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# UUIDv7 生成状态：同一毫秒内 rand_a 递增，保证单进程内生成的ID严格有序
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_counter = 0
+
 
 def validate_phone(phone: str) -> bool:
     """
@@ -33,14 +49,102 @@ def generate_registration_id() -> str:
     return f"reg_{uuid.uuid4()}"
 
 
-def is_valid_image_type(filename: str) -> bool:
+def generate_time_ordered_id() -> str:
     """
-    验证是否为有效的图片类型
-    :param filename: 文件名
-    :return: 是否有效
+    生成按时间递增的 UUID（UUIDv7：48 位毫秒时间戳 + 12 位同毫秒计数 + 62 位随机数）
+    用作订单、照片主键，新记录总是追加在主键索引末尾
+    :return: 标准格式的 UUID 字符串
     """
-    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-    return extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']
+    global _uuid7_last_ms, _uuid7_counter
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1000000
+        if now_ms > _uuid7_last_ms:
+            _uuid7_last_ms = now_ms
+            _uuid7_counter = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+        else:
+            # 同一毫秒（或时钟回拨）：计数加 1，溢出时借用下一毫秒
+            _uuid7_counter += 1
+            if _uuid7_counter > 0xfff:
+                _uuid7_last_ms += 1
+                _uuid7_counter = 0
+        ms, counter = _uuid7_last_ms, _uuid7_counter
+    value = (ms & 0xffffffffffff) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), 'big') & 0x3fffffffffffffff
+    return str(uuid.UUID(int=value))
+
+
+def normalize_uuid(value: Any) -> Optional[str]:
+    """
+    转换为标准格式的 UUID 字符串（小写、带连字符）
+    :param value: UUID 字符串（可以不带连字符）或 uuid.UUID
+    :return: 标准格式字符串，不是合法 UUID 时返回 None
+    """
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        return None
+
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    """
+    根据文件头（magic bytes）识别图片类型，不信任文件扩展名
+    :param header: 文件开头的字节（至少 IMAGE_HEADER_SIZE 字节才能识别 webp）
+    :return: 图片扩展名（jpg/png/gif/webp）或 None
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def read_image_upload(stream, max_bytes: int) -> Tuple[Optional[bytes], Optional[str], Optional[str]]:
+    """
+    校验并读取上传的图片文件
+    - 可定位的流（Werkzeug 解析出的临时文件）先直接取大小，超限时不读取内容
+    - 只读取文件头识别图片类型，不是图片时立即返回
+    - 分块读取剩余内容，超过上限立即停止
+    :param stream: 上传文件流（FileStorage.stream）
+    :param max_bytes: 文件大小上限（字节）
+    :return: (文件数据, 图片扩展名, 错误消息)，校验通过时错误消息为 None
+    """
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        if size > max_bytes:
+            return None, None, "文件过大"
+    except (AttributeError, OSError, ValueError):
+        # 不可定位的流，依靠下面的分块读取限制大小
+        pass
+    
+    header = stream.read(IMAGE_HEADER_SIZE)
+    image_type = detect_image_type(header)
+    if image_type is None:
+        return None, None, "不支持的文件类型"
+    
+    chunks = [header]
+    total = len(header)
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            return None, None, "文件过大"
+        chunks.append(chunk)
+    return b''.join(chunks), image_type, None
 
 
 def get_mime_type(extension: str) -> str:
@@ -59,6 +163,65 @@ def get_mime_type(extension: str) -> str:
     return mime_types.get(extension.lower(), 'application/octet-stream')
 
 
+def encode_cursor(created_at: datetime, record_id: Any) -> str:
+    """
+    编码分页游标（按 created_at 倒序、id 倒序的 keyset 分页）
+    :param created_at: 当前页最后一条记录的创建时间
+    :param record_id: 当前页最后一条记录的ID
+    :return: 游标字符串（URL 安全）
+    """
+    raw = json.dumps([created_at.isoformat(), record_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, Any]]:
+    """
+    解码分页游标
+    带时区的时间转换为不带时区的 UTC（与数据库一致）；ID 只接受字符串或整数
+    :param cursor: 游标字符串
+    :return: (created_at, id) 或 None（游标无效）
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(created_at, str) or isinstance(record_id, bool) \
+                or not isinstance(record_id, (str, int)):
+            return None
+        return parse_utc_datetime(created_at), record_id
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_page_limit(value: Optional[str], default: int = 20, maximum: int = 100) -> int:
+    """
+    解析分页大小参数
+    :param value: 请求参数中的 limit
+    :param default: 默认分页大小
+    :param maximum: 最大分页大小
+    :return: 分页大小
+    """
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def parse_utc_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    解析 ISO 8601 时间参数（如 2024-01-01T00:00:00Z），带时区的转换为 UTC，返回不带时区的时间（与数据库一致）
+    :param value: 时间字符串
+    :return: datetime，参数为空时返回 None
+    :raises ValueError: 格式无效
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
 def validate_user_registration_data(data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
     """
     验证用户注册数据
@@ -1,12 +1,19 @@
 from datetime import datetime
-from flask import render_template, request, send_from_directory, redirect, url_for
-import os
+from flask import render_template, request, redirect, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+import config
 from wxcloudrun import app
 from wxcloudrun.dao import delete_counterbyid, query_counterbyid, insert_counter, update_counterbyid
 from wxcloudrun.model import Counters
 from wxcloudrun.response import make_succ_empty_response, make_succ_response, make_err_response
 from wxcloudrun.handlers import user_handler, upload_handler, admin_handler, auth_handler
-from wxcloudrun.middleware import require_admin_auth, require_user_auth
+from wxcloudrun.middleware import require_admin_auth, require_user_auth, limit_content_length, rate_limit, idempotent
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH（解析表单时触发）"""
+    return make_err_response("请求体过大", 413), 413
 
 
 @app.route('/')
@@ -74,6 +81,7 @@ def get_count():
 # ========== 用户相关API ==========
 
 @app.route('/api/user/register', methods=['POST'])
+@rate_limit('register', config.RATE_LIMIT_REGISTER)
 def register_user():
     """用户注册"""
     return user_handler.register_user()
@@ -82,18 +90,21 @@ def register_user():
 # ========== 短信验证码认证相关API ==========
 
 @app.route('/api/auth/sms/send', methods=['POST'])
+@rate_limit('sms_send', config.RATE_LIMIT_SMS_SEND)
 def send_sms_code():
     """发送短信验证码"""
     return auth_handler.send_sms_code()
 
 
 @app.route('/api/auth/sms/verify', methods=['POST'])
+@rate_limit('sms_verify', config.RATE_LIMIT_SMS_VERIFY)
 def verify_sms_code():
     """验证短信验证码"""
     return auth_handler.verify_sms_code()
 
 
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limit('login', config.RATE_LIMIT_LOGIN)
 def login_with_sms():
     """使用手机号和验证码登录"""
     return auth_handler.login_with_sms()
@@ -112,6 +123,12 @@ def get_all_user_registrations():
     return user_handler.get_all_user_registrations_handler()
 
 
+@app.route('/api/user/registrations/status', methods=['PUT'])
+def bulk_update_user_registration_status():
+    """批量更新用户注册状态（管理员功能）"""
+    return user_handler.bulk_update_user_registration_status_handler()
+
+
 @app.route('/api/user/registrations/<registration_id>/status', methods=['PUT'])
 def update_user_registration_status(registration_id):
     """更新用户注册状态（管理员功能）"""
@@ -121,6 +138,8 @@ def update_user_registration_status(registration_id):
 # ========== 上传相关API ==========
 
 @app.route('/api/upload/photos', methods=['POST'])
+@limit_content_length(config.PHOTO_UPLOAD_MAX_BODY)
+@idempotent('upload_photos')
 def upload_photos():
     """上传照片"""
     return upload_handler.upload_photos()
@@ -133,6 +152,7 @@ def get_uploaded_photos():
 
 
 @app.route('/api/upload/business-license', methods=['POST'])
+@limit_content_length(config.BUSINESS_LICENSE_MAX_BODY)
 def upload_business_license():
     """上传营业执照"""
     return upload_handler.upload_business_license()
@@ -147,6 +167,7 @@ def get_all_battery_orders():
 
 
 @app.route('/api/battery/orders', methods=['POST'])
+@idempotent('create_battery_order')
 def create_battery_order():
     """创建电池订单"""
     return upload_handler.create_battery_order()
@@ -158,6 +179,24 @@ def get_battery_order_detail(order_id):
     return upload_handler.get_battery_order_detail(order_id)
 
 
+@app.route('/api/photos/<photo_id>/content', methods=['GET'])
+def get_photo_content(photo_id):
+    """获取照片内容（经本地磁盘缓存）"""
+    return upload_handler.get_photo_content(photo_id)
+
+
+@app.route('/api/battery/orders/<order_id>/photos.zip', methods=['GET'])
+def download_order_photos_zip(order_id):
+    """打包下载订单的所有照片"""
+    return upload_handler.download_order_photos_zip(order_id)
+
+
+@app.route('/api/battery/orders/status', methods=['PUT'])
+def bulk_update_battery_order_status():
+    """批量变更订单状态"""
+    return upload_handler.bulk_update_battery_order_status()
+
+
 @app.route('/api/battery/orders/<order_id>', methods=['PUT'])
 # TODO: 暂时禁用授权检查，以便小程序可以编辑订单。以后需要实现小程序用户认证机制
 # @require_admin_auth
@@ -166,6 +205,12 @@ def update_battery_order(order_id):
     return upload_handler.update_battery_order(order_id)
 
 
+@app.route('/api/battery/orders/<order_id>', methods=['PATCH'])
+def patch_battery_order(order_id):
+    """按版本号部分更新订单（乐观锁，版本冲突返回 409）"""
+    return upload_handler.patch_battery_order(order_id)
+
+
 # ========== 管理员相关API ==========
 
 @app.route('/api/admin/login', methods=['POST'])
@@ -174,6 +219,13 @@ def admin_login():
     return admin_handler.admin_login()
 
 
+@app.route('/api/admin/metrics', methods=['GET'])
+@require_admin_auth
+def admin_metrics():
+    """获取运行指标（COS 熔断器状态等，管理员功能）"""
+    return admin_handler.get_metrics()
+
+
 # ========== 管理后台页面路由 ==========
 
 @app.route('/admin/login')
@@ -211,5 +263,4 @@ def admin_order_tracking():
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """提供上传文件的访问"""
-    upload_dir = os.path.join(os.getcwd(), 'uploads')
-    return send_from_directory(upload_dir, filename)
+    return upload_handler.serve_uploaded_file(filename)
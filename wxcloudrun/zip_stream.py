@@ -0,0 +1,64 @@
+"""
+流式 ZIP 打包
+边读取文件边产出 ZIP 字节块，不在内存或磁盘上拼装完整的压缩包：
+输出流不可 seek，zipfile 会为每个条目写数据描述符（data descriptor），内存占用只与分块大小有关
+"""
+import zipfile
+
+# 每次从源文件读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """只支持 write 的输出缓冲区，zipfile 写入的字节在每次 drain 时取出"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if not self._chunks:
+            return b''
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    流式生成 ZIP（条目不压缩，适合 JPEG 等已压缩的文件；单个条目需小于 2GB）
+    :param entries: 可迭代对象，元素为 (条目名, 二进制文件对象, 修改时间 datetime 或 None)，
+                    文件对象写入完成后由本函数关闭
+    :param chunk_size: 每次读取的字节数
+    :return: 产出 ZIP 字节块的生成器
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, source, modified_at in entries:
+            info = zipfile.ZipInfo(name)
+            if modified_at is not None and modified_at.year >= 1980:
+                info.date_time = modified_at.timetuple()[:6]
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            with source, archive.open(info, mode='w') as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # 中央目录
+    data = buffer.drain()
+    if data:
+        yield data